@@ -4,9 +4,10 @@ from flask import (Flask, request, send_from_directory, render_template, url_for
 from flask_cors import CORS
 
 from api.endpoints import *
-from api.functions import initAndIndexMemeLibrary, validAccess, serverErrorResponse, checkReqJSONParameters, \
-    checkDictionaryParams
+from api.functions import initAndIndexMemeLibrary, reloadMemeLibrary, validAccess, serverErrorResponse, \
+    checkReqJSONParameters, checkDictionaryParams
 from apiutils.HTTPResponses import *
+from apiutils.OutboundPolicy import getBreakerStates
 from apiutils.configs.ServerConfig import ServerConfig
 
 # Initialize our server config
@@ -39,6 +40,50 @@ def route_info_meme(memeID: int):
         return serverErrorResponse(e)
 
 
+@app.route('/info', methods=['POST'])
+def route_info_memes():
+    try:
+        paramInfo = [
+            ('ids', True, list),
+            ('thumbnails', False, str)
+        ]
+
+        good, msg = checkReqJSONParameters(request, paramInfo)
+        if not good:
+            return error_response(400, msg)
+
+        return getMemesInfo(request.json['ids'], request.json.get('thumbnails'), memeLib)
+    except Exception as e:
+        return serverErrorResponse(e)
+
+
+@app.route('/thumbnail/<int:memeID>', methods=['GET'])
+def route_meme_thumbnail(memeID: int):
+    try:
+        paramInfo = [
+            ('size', False, str),
+            ('format', False, str),
+            ('v', False, str)
+        ]
+
+        good, msg = checkDictionaryParams(request.args, paramInfo)
+        if not good:
+            return error_response(400, msg)
+
+        return getMemeThumbnail(memeID, request.args.get('size'), request.args.get('format'), request.args.get('v'),
+                                request.if_none_match, memeLib)
+    except Exception as e:
+        return serverErrorResponse(e)
+
+
+@app.route('/preview/<int:memeID>', methods=['GET'])
+def route_meme_preview(memeID: int):
+    try:
+        return getMemePreview(memeID, request.if_none_match, memeLib)
+    except Exception as e:
+        return serverErrorResponse(e)
+
+
 @app.route('/edit/<int:memeID>', methods=['POST'])
 def route_edit_meme(memeID: int):
     try:
@@ -66,22 +111,31 @@ def route_edit_meme(memeID: int):
 def route_meme_browse():
     try:
         paramInfo = [
-            ('page', True, str),
-            ('per_page', True, str)
+            ('page', False, str),
+            ('per_page', True, str),
+            ('cursor', False, str),
+            ('after_id', False, str),
+            ('thumbnails', False, str)
         ]
 
         good, msg = checkDictionaryParams(request.args, paramInfo)
         if not good:
             return error_response(400, msg)
 
+        pageNo = request.args.get('page')
+        afterID = request.args.get('after_id')
+
         try:
             itemsPerPage = int(request.args['per_page'])
-            pageNo = int(request.args['page'])
+            if pageNo is not None:
+                pageNo = int(pageNo)
+            if afterID is not None:
+                afterID = int(afterID)
         except ValueError:
-            return error_response(400, '"per_page" and/or "page" parameter is a non-integer value')
+            return error_response(400, '"per_page", "page" and/or "after_id" parameter is a non-integer value')
 
 
-        return browseMemes(itemsPerPage, pageNo, memeLib)
+        return browseMemes(itemsPerPage, pageNo, afterID, request.args.get('cursor'), request.args.get('thumbnails'), memeLib)
     except Exception as e:
         return serverErrorResponse(e)
 
@@ -93,7 +147,8 @@ def route_meme_search():
             ('query', True, str),
             ('page', False, str),
             ('per_page', False, str),
-            ('media_type', False, str)
+            ('media_type', False, str),
+            ('thumbnails', False, str)
         ]
 
         good, msg = checkDictionaryParams(request.args, paramInfo)
@@ -104,6 +159,7 @@ def route_meme_search():
         pageNo = request.args.get("page")
         itemsPerPage = request.args.get("per_page")
         mediaTypeStr = request.args.get("media_type")
+        thumbnailModeStr = request.args.get("thumbnails")
 
         if itemsPerPage is not None:
             try:
@@ -117,7 +173,7 @@ def route_meme_search():
             except ValueError:
                 return error_response(400, '"page" parameter is a non-integer value')
 
-        return searchMemes(query, itemsPerPage, pageNo, mediaTypeStr, memeLib)
+        return searchMemes(query, itemsPerPage, pageNo, mediaTypeStr, thumbnailModeStr, memeLib)
     except Exception as e:
         return serverErrorResponse(e)
 
@@ -179,11 +235,26 @@ def reset_meme_lib():
     if not validAccess(request):
         return error_response(400, 'Invalid Access Token')
 
-    global memeLib
-    memeLib = initAndIndexMemeLibrary()
+    # the reset discards the changes which were not written, unless they are flushed first with ?flush=true
+    if request.args.get('flush', '').lower() == 'true' and not memeLib.saveLibrary(durable=True):
+        return error_response(500, 'Failed to save the meme library before resetting it')
+
+    try:
+        # nothing is downloaded or indexed again if the database did not change
+        reloadMemeLibrary(memeLib)
+    except Exception as e:
+        return serverErrorResponse(e)
     return make_json_response({'message': 'Library Reset'})
 
 
+@app.route('/admin/breakers')
+def breaker_states():
+    if not validAccess(request):
+        return error_response(400, 'Invalid Access Token')
+
+    return make_json_response({'breakers': getBreakerStates()})
+
+
 @app.route('/media/<mediaName>')
 def getMedia(mediaName):
     mediaName = str(mediaName)
@@ -1,13 +1,30 @@
+import base64
+import binascii
+
 from flask import (redirect, Response)
 from typing import Union
-from werkzeug.datastructures import FileStorage
+from werkzeug.datastructures import FileStorage, ETags
 
-from api.functions import makeMemeJSON
+from api.functions import makeMemeJSON, ThumbnailResponseMode
+from apiutils.FileStorage.ThumbnailFileStorageInterface import ThumbnailFileStorageInterface
 from apiutils.HTTPResponses import error_response, make_json_response
 from apiutils.MemeManagement.MemeMediaType import MemeMediaType, memeMediaTypeToString, stringToMemeMediaType, \
     isValidMediaType
+from apiutils.ThumbnailMaker import ThumbnailMaker
+from apiutils.VideoPreviewMaker import VideoPreviewMaker
 from apiutils.configs.ServerComponents import *
 
+# How long clients may cache a thumbnail requested with its version, which never changes (a year, the longest allowed)
+THUMBNAIL_IMMUTABLE_MAX_AGE_SECONDS = 365 * 24 * 60 * 60
+
+# Most memes that can be requested in one batch info request
+MAX_INFO_BATCH_SIZE = 100
+
+# Formats and largest size of the thumbnails clients can request, the variants the server makes are configured separately
+THUMBNAIL_FORMATS = ('jpeg', 'webp', 'avif', 'png')
+THUMBNAIL_FORMAT_ALIASES = {'jpg': 'jpeg'}
+MAX_THUMBNAIL_SIZE = 2048
+
 class EndPointException(Exception):
     def __init__(self, message):
         self.message = message
@@ -18,7 +35,140 @@ def getMemeInfo(memeID: int,  memeLib: MemeLibrary) -> Response:
         return error_response(400, message=f"ID {memeID} does not exist in database")
 
     meme = memeLib.getMeme(memeID)
-    return make_json_response(makeMemeJSON(meme))
+    return make_json_response(makeMemeJSON(meme, thumbnailStatus=memeLib.getThumbnailStatus(memeID)))
+
+def getMemesInfo(memeIDs: list, thumbnailModeStr: Union[str, None], memeLib: MemeLibrary) -> Response:
+    if len(memeIDs) > MAX_INFO_BATCH_SIZE:
+        return error_response(400, message=f'At most {MAX_INFO_BATCH_SIZE} IDs can be requested at once')
+
+    # bool is a subclass of int, but true and false are not IDs
+    if any(type(memeID) != int for memeID in memeIDs):
+        return error_response(400, message='"ids" must only contain meme IDs (Numbers)')
+
+    thumbnailMode = parseThumbnailMode(thumbnailModeStr)
+    if thumbnailMode is None:
+        return invalidThumbnailModeResponse(thumbnailModeStr)
+
+    memes = memeLib.getMemes(memeIDs)
+    results = [makeMemeJSON(meme, thumbnailMode) for meme in memes if meme is not None]
+    missing = [memeID for memeID, meme in zip(memeIDs, memes) if meme is None]
+    return make_json_response({'results': results, 'missing': missing})
+
+def parseThumbnailSize(sizeStr: str) -> Union[tuple[int, int], None]:
+    """
+    Returns the size for a "200" or "200x150" size string, None if it is not a valid size
+    """
+    try:
+        if 'x' in sizeStr:
+            width, height = (int(dim) for dim in sizeStr.split('x'))
+        else:
+            width = height = int(sizeStr)
+    except ValueError:
+        return None
+
+    if not (0 < width <= MAX_THUMBNAIL_SIZE and 0 < height <= MAX_THUMBNAIL_SIZE):
+        return None
+    return width, height
+
+def setThumbnailCacheHeaders(resp: Response, etag: str, version: Union[str, None]):
+    """
+    A thumbnail requested with the version it has (see makeMemeJSON) never changes at that URL, so it is cached as immutable
+    Otherwise the URL can serve a new thumbnail, so clients must revalidate it with its ETag every time
+    """
+    resp.set_etag(etag)
+    if version is not None and version == etag:
+        resp.cache_control.public = True
+        resp.cache_control.max_age = THUMBNAIL_IMMUTABLE_MAX_AGE_SECONDS
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+
+def getMemeThumbnail(memeID: int, sizeStr: Union[str, None], formatStr: Union[str, None], version: Union[str, None],
+                     ifNoneMatch: ETags, memeLib: MemeLibrary) -> Response:
+    if not memeLib.hasMeme(memeID):
+        return error_response(400, message=f"ID {memeID} does not exist in database")
+
+    tbSize = ThumbnailMaker.DEFAULT_SIZE
+    if sizeStr is not None:
+        tbSize = parseThumbnailSize(sizeStr)
+        if tbSize is None:
+            return error_response(400, message=f'"size" must be a number of pixels e.g. "200" or "200x150", at most {MAX_THUMBNAIL_SIZE}')
+
+    tbFrmt = ThumbnailMaker.DEFAULT_FORMAT
+    if formatStr is not None:
+        tbFrmt = THUMBNAIL_FORMAT_ALIASES.get(formatStr.lower(), formatStr.lower())
+        if tbFrmt not in THUMBNAIL_FORMATS:
+            return error_response(400, message=f'"format" must be one of: {", ".join(THUMBNAIL_FORMATS)}')
+
+    meme = memeLib.getMeme(memeID)
+    thumbnailBytes, etag = None, None
+
+    # The smallest thumbnail of the requested format which is at least the requested size, the default thumbnail is one of them
+    # If there is none, the default thumbnail is sent
+    defaultKey = ThumbnailMaker.makeVariantKey(ThumbnailMaker.DEFAULT_SIZE, ThumbnailMaker.DEFAULT_FORMAT)
+    variantKey = ThumbnailMaker.selectVariant(meme.getThumbnailVariantKeys() + [defaultKey], tbSize, tbFrmt)
+    if variantKey is not None and variantKey != defaultKey:
+        thumbnailBytes = meme.getThumbnailVariantBytes(variantKey)
+        etag = (meme.getThumbnailVariantIDs() or {}).get(variantKey)
+        _, tbFrmt = ThumbnailMaker.parseVariantKey(variantKey)
+
+    if not thumbnailBytes:
+        thumbnailBytes = meme.getThumbnailBytes()
+        etag = meme.getThumbnailID()
+        tbFrmt = ThumbnailMaker.DEFAULT_FORMAT
+        if not thumbnailBytes:
+            return error_response(404, message=f"Meme {memeID} does not have a thumbnail")
+
+    # Stored thumbnails are content-addressed, so their ID is already a hash of the bytes
+    if etag is None:
+        etag = ThumbnailFileStorageInterface.makeThumbnailID(thumbnailBytes)
+
+    if ifNoneMatch.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(response=thumbnailBytes, status=200, mimetype=f'image/{tbFrmt}')
+
+    setThumbnailCacheHeaders(resp, etag, version)
+    return resp
+
+def getMemePreview(memeID: int, ifNoneMatch: ETags, memeLib: MemeLibrary) -> Response:
+    if not memeLib.hasMeme(memeID):
+        return error_response(400, message=f"ID {memeID} does not exist in database")
+
+    meme = memeLib.getMeme(memeID)
+    previewBytes = meme.getThumbnailVariantBytes(VideoPreviewMaker.STRIP_VARIANT_KEY)
+    if not previewBytes:
+        return error_response(404, message=f"Meme {memeID} does not have a preview")
+
+    etag = (meme.getThumbnailVariantIDs() or {}).get(VideoPreviewMaker.STRIP_VARIANT_KEY)
+    if etag is None:
+        etag = ThumbnailFileStorageInterface.makeThumbnailID(previewBytes)
+
+    if ifNoneMatch.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(response=previewBytes, status=200, mimetype='image/webp')
+
+    # the preview URL is not versioned
+    setThumbnailCacheHeaders(resp, etag, None)
+    return resp
+
+def parseThumbnailMode(thumbnailModeStr: Union[str, None]) -> Union[ThumbnailResponseMode, None]:
+    """
+    Returns the thumbnail response mode for the string, the default mode if the string is None
+    Returns None if the string is not a valid mode
+    """
+    if thumbnailModeStr is None:
+        return ThumbnailResponseMode.INLINE
+
+    for mode in ThumbnailResponseMode:
+        if thumbnailModeStr.lower() == mode.value:
+            return mode
+    return None
+
+def invalidThumbnailModeResponse(thumbnailModeStr: str) -> Response:
+    acceptedModes = [mode.value for mode in ThumbnailResponseMode]
+    return error_response(400, f'Invalid thumbnails option: "{thumbnailModeStr}". Accepted options are: {acceptedModes}')
 
 def downloadMeme(memeID: int, memeLib: MemeLibrary) -> Response:
     if not memeLib.hasMeme(memeID):
@@ -40,28 +190,82 @@ def editMeme(memeID: int, name: Union[str, None], tags: Union[list[str], None],
     if not memeLib.editMeme(memeID, name=name, tags=tags):
         raise EndPointException(f'Failed to edit meme in the library, id={memeID}, name="{name}", tags={tags}')
 
-    # Save the changes to the library and reindex with new tags
-    if not memeLib.saveLibrary():
+    # Save the changes to the library, the library index is updated by the edit
+    # Edits come in bursts when memes are tagged, so they are written with the next flush of the library
+    if not memeLib.saveLibrary(durable=False):
         raise EndPointException('Failed to save the meme library')
 
-    memeLib.indexLibrary()
-
     # return the meme information
     meme = memeLib.getMeme(memeID)
     return make_json_response(makeMemeJSON(meme))
 
-def browseMemes(itemsPerPage: int, pageNo: int, memeLib: MemeLibrary) -> Response:
+def encodeBrowseCursor(memeID: int) -> str:
+    """
+    Returns the opaque cursor clients pass to /browse to continue after the meme with the given ID
+    """
+    return base64.urlsafe_b64encode(f'id:{memeID}'.encode()).decode().rstrip('=')
+
+def decodeBrowseCursor(cursor: str) -> Union[int, None]:
+    """
+    Returns the meme ID encoded in the browse cursor, None if the cursor is invalid
+    """
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+
+    prefix, _, memeID = decoded.partition(':')
+    if prefix != 'id' or not memeID.isdigit():
+        return None
+    return int(memeID)
+
+def browseMemes(itemsPerPage: int, pageNo: Union[int, None], afterID: Union[int, None], cursor: Union[str, None], thumbnailModeStr: Union[str, None], memeLib: MemeLibrary) -> Response:
+    """
+    Memes are browsed either by page number, or after a meme ID given as a cursor or after_id
+    """
     # TODO: Support media type filters?
-    if itemsPerPage <= 0 or pageNo <= 0:
-        return error_response(400, 'Invalid values for "page" and/or "per_page" parameters')
+    usesCursor = afterID is not None or cursor is not None
+    if usesCursor and pageNo is not None:
+        return error_response(400, '"page" cannot be used together with "cursor" or "after_id"')
 
-    memes = memeLib.browseMemes(itemsPerPage, pageNo)
-    collated = [makeMemeJSON(meme) for meme in memes]
+    if afterID is not None and cursor is not None:
+        return error_response(400, 'Only one of "cursor" or "after_id" can be used')
 
-    return make_json_response({'results': collated, 'itemsPerPage': itemsPerPage, 'page': pageNo})
+    if not usesCursor and pageNo is None:
+        return error_response(400, 'One of "page", "cursor" or "after_id" is required')
+
+    if itemsPerPage <= 0 or (pageNo is not None and pageNo <= 0) or (afterID is not None and afterID < 0):
+        return error_response(400, 'Invalid values for "page", "per_page" and/or "after_id" parameters')
+
+    if cursor is not None:
+        afterID = decodeBrowseCursor(cursor)
+        if afterID is None:
+            return error_response(400, f'Invalid cursor: "{cursor}"')
 
+    thumbnailMode = parseThumbnailMode(thumbnailModeStr)
+    if thumbnailMode is None:
+        return invalidThumbnailModeResponse(thumbnailModeStr)
 
-def searchMemes(query: str, itemsPerPage: Union[int, None], pageNo: Union[int, None], mediaTypeStr: Union[str, None], memeLib: MemeLibrary) -> Response:
+    if usesCursor:
+        # one extra meme is fetched to know if there is a next page
+        memes = memeLib.browseMemesAfter(afterID, itemsPerPage + 1)
+        hasNext = len(memes) > itemsPerPage
+        memes = memes[:itemsPerPage]
+    else:
+        # pages are sliced from the same ordered IDs as cursors, so a page can be continued with a cursor
+        memes = memeLib.browseMemes(itemsPerPage, pageNo)
+        hasNext = len(memes) == itemsPerPage and len(memeLib.browseMemesAfter(memes[-1].getID(), 1)) > 0
+
+    collated = [makeMemeJSON(meme, thumbnailMode) for meme in memes]
+    nextCursor = encodeBrowseCursor(memes[-1].getID()) if hasNext else None
+
+    payload = {'results': collated, 'itemsPerPage': itemsPerPage, 'nextCursor': nextCursor}
+    if pageNo is not None:
+        payload['page'] = pageNo
+    return make_json_response(payload)
+
+
+def searchMemes(query: str, itemsPerPage: Union[int, None], pageNo: Union[int, None], mediaTypeStr: Union[str, None], thumbnailModeStr: Union[str, None], memeLib: MemeLibrary) -> Response:
     if query == "":
         return error_response(400, 'No query found, use "query" for the URL parameter')
 
@@ -82,15 +286,21 @@ def searchMemes(query: str, itemsPerPage: Union[int, None], pageNo: Union[int, N
         if mediaTypeStr != "all":
             mediaType = stringToMemeMediaType(mediaTypeStr)
 
+    thumbnailMode = parseThumbnailMode(thumbnailModeStr)
+    if thumbnailMode is None:
+        return invalidThumbnailModeResponse(thumbnailModeStr)
+
     matchedMemes = memeLib.search(query, itemsPerPage=itemsPerPage, pageNo=pageNo, onlyMediaType=mediaType)
-    collated = [makeMemeJSON(meme) for meme in matchedMemes]
+    collated = [makeMemeJSON(meme, thumbnailMode) for meme in matchedMemes]
 
     return make_json_response({'results': collated, 'itemsPerPage': itemsPerPage, 'page': pageNo})
 
 
 def addNewMeme(name: str, tags: list, fileExt: str, mediaID: str, mediaURL: str, memeLib: MemeLibrary) -> Response:
     # Create the entry in the database
-    meme = memeLib.addMemeToLibrary(name=name, tags=tags, fileExt=fileExt, mediaID=mediaID, mediaURL=mediaURL, addMemeToIndex=True)
+    # The thumbnail is made in the background if the library has thumbnail workers, clients poll /info for its status
+    meme = memeLib.addMemeToLibrary(name=name, tags=tags, fileExt=fileExt, mediaID=mediaID, mediaURL=mediaURL, addMemeToIndex=True,
+                                    backgroundThumbnail=True)
 
     if meme is None:
         d = {
@@ -98,16 +308,14 @@ def addNewMeme(name: str, tags: list, fileExt: str, mediaID: str, mediaURL: str,
         }
         raise EndPointException(f'Failed to add meme to library: {d}')
 
-    # TODO: Use thread to save and reindex library asynchronously
-    # Meme library has index mutex to synchronize requests for searching or adding to the index
-    # threading.Thread(target=saveLibrary).start()
-    success = memeLib.saveLibrary()
+    # The meme is written with the next flush of the library, the index is updated when the meme is added
+    success = memeLib.saveLibrary(durable=False)
 
     if not success:
         raise EndPointException('Failed to save the meme library')
 
     # respond with the item informaion and an upload URL
-    return make_json_response(makeMemeJSON(meme))
+    return make_json_response(makeMemeJSON(meme, thumbnailStatus=memeLib.getThumbnailStatus(meme.getID())))
 
 
 def uploadMeme(fileExt: str, file: FileStorage, memeLib: MemeLibrary ) -> Response:
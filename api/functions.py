@@ -1,49 +1,105 @@
 import traceback
+from enum import Enum
 
-from flask import request, Response
+from flask import request, Response, url_for
 
+from apiutils.FileStorage.ThumbnailFileStorageInterface import ThumbnailFileStorageInterface
 from apiutils.HTTPResponses import error_response
 from apiutils.MemeDB.JSONMemeDB import JSONMemeDB
 from apiutils.MemeManagement.MemeContainer import MemeContainer
 from apiutils.MemeManagement.MemeLibrary import MemeLibrary
-from apiutils.configs.ServerComponents import getServerFileStorage, getServerMemeStorage
+from apiutils.MemeManagement.ThumbnailPipeline import ThumbnailStatus
+from apiutils.OutboundPolicy import CircuitOpenException
+from apiutils.configs.ServerComponents import getServerFileStorage, getServerMemeStorage, getServerThumbnailStorage, \
+    getServerSearchIndexDir, getServerThumbnailVariants, getServerVideoPreviewMaker
 from apiutils.configs.ServerConfig import ServerConfig
 
 
 def initAndIndexMemeLibrary() -> MemeLibrary:
     fileStorage = getServerFileStorage()
     memeStorage = getServerMemeStorage()
+    thumbnailStorage = getServerThumbnailStorage(fileStorage)
 
-    JSONMemeDB.initSingleton(fileStorage)
+    JSONMemeDB.initSingleton(fileStorage, thumbnailStorage=thumbnailStorage)
     memeDB = JSONMemeDB.getSingleton()
 
-    memeLib = MemeLibrary(memeDB, memeStorage)
+    memeLib = MemeLibrary(memeDB, memeStorage, indexDir=getServerSearchIndexDir(), flushIntervalSeconds=ServerConfig.DB_FLUSH_INTERVAL_SECONDS,
+                          thumbnailWorkers=ServerConfig.THUMBNAIL_WORKERS, thumbnailVariants=getServerThumbnailVariants(),
+                          videoPreviewMaker=getServerVideoPreviewMaker())
 
     if not memeLib.loadLibrary():
         raise Exception('There was an error loading the library!')
 
-    memeLib.indexLibrary()
+    # only re-indexed if there is no persisted index for the loaded revision of the library
+    memeLib.indexLibraryIfStale(artifactStorage=fileStorage)
     return memeLib
 
+def reloadMemeLibrary(memeLib:MemeLibrary):
+    """
+    Reloads the meme library made by initAndIndexMemeLibrary, only downloading and indexing the database if it changed
+    """
+    if not memeLib.reloadLibrary(artifactStorage=JSONMemeDB.getSingleton().fileStorage):
+        raise Exception('There was an error reloading the library!')
+
 def validAccess(req:request) -> bool:
     accToken = req.headers.get('Access-Token')
     if accToken is None:
         return False
     return accToken in ServerConfig.ALLOWED_ACCESS_TOKENS
 
-def makeMemeJSON(meme: MemeContainer) -> dict:
-    return {
+class ThumbnailResponseMode(Enum):
+    # The base64 thumbnail is included in the meme response
+    INLINE = 'inline'
+    # A URL to the thumbnail endpoint is included instead, so clients can fetch and cache the thumbnail bytes
+    URL = 'url'
+    # No thumbnail information is included
+    NONE = 'none'
+
+def getThumbnailVersion(meme: MemeContainer) -> str:
+    """
+    Returns the ETag of the default thumbnail of the meme, it changes whenever the thumbnail changes so it versions the
+    thumbnail URL. None if the meme has no thumbnail yet
+    """
+    if meme.getThumbnailID() is not None:
+        return meme.getThumbnailID()
+
+    # inline thumbnails have no ID, they are already in memory so hashing them is cheap
+    thumbnailBytes = meme.getThumbnailBytes()
+    return ThumbnailFileStorageInterface.makeThumbnailID(thumbnailBytes) if thumbnailBytes else None
+
+def makeMemeJSON(meme: MemeContainer, thumbnailMode: ThumbnailResponseMode = ThumbnailResponseMode.INLINE,
+                 thumbnailStatus: ThumbnailStatus = None) -> dict:
+    memeJSON = {
             'id': meme.getID(),
             'name': meme.getName(),
             'mediaType': meme.getMediaTypeString(),
             'fileExt': meme.getFileExt(),
             'tags': meme.getTags(),
             'url': meme.getMediaURL(),
-            'thumbnail': meme.getThumbnail()
         }
 
+    if thumbnailMode == ThumbnailResponseMode.INLINE:
+        memeJSON['thumbnail'] = meme.getThumbnail()
+    elif thumbnailMode == ThumbnailResponseMode.URL:
+        # the version makes a new URL when the thumbnail changes, so the thumbnail can be cached as immutable
+        version = getThumbnailVersion(meme)
+        if version is not None:
+            memeJSON['thumbnailURL'] = url_for('route_meme_thumbnail', memeID=meme.getID(), v=version, _external=True)
+        else:
+            memeJSON['thumbnailURL'] = url_for('route_meme_thumbnail', memeID=meme.getID(), _external=True)
+
+    if thumbnailStatus is not None:
+        memeJSON['thumbnailStatus'] = thumbnailStatus.value
+
+    return memeJSON
+
 
 def serverErrorResponse(e: Exception) -> Response:
+    # a backend being down is reported as such, without waiting for it
+    if isinstance(e, CircuitOpenException):
+        print(f'Backend Unavailable: {e.message}')
+        return error_response(503, e.message)
+
     print(f'Exception Occured: {e}')
     traceback.print_exc()
     return error_response(500, f"Unexpected Server Error")
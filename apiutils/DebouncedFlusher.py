@@ -0,0 +1,104 @@
+import threading
+import traceback
+from typing import Callable
+
+
+class DebouncedFlusher:
+    """
+    Coalesces bursts of changes into a single flush.
+    Changes mark the flusher dirty, and the flush function is called once the interval has passed since the first change
+    that was not flushed, so it is called at most once per interval however many changes are made.
+    If the flush fails, the flusher stays dirty and the flush is retried after another interval.
+    """
+    def __init__(self, flush: Callable[[], bool], intervalSeconds: float):
+        """
+        :param flush: Persists the changes, returns true if the changes were persisted
+        :param intervalSeconds: The longest time a change waits before it is flushed
+        """
+        self.__flush = flush
+        self.__intervalSeconds = intervalSeconds
+        self.__dirty = False
+        self.__timer = None
+        # Guards the dirty flag and timer
+        self.__stateLock = threading.Lock()
+        # Serializes the flushes, so a timed flush and an explicit flush do not run at the same time
+        self.__flushLock = threading.Lock()
+
+    def isDirty(self) -> bool:
+        return self.__dirty
+
+    def markDirty(self):
+        """
+        Records that there are changes to flush, and schedules a flush if one is not already scheduled
+        """
+        with self.__stateLock:
+            self.__dirty = True
+            self.__scheduleFlush()
+
+    def __scheduleFlush(self):
+        # Must be called with the state lock held
+        if self.__timer is not None:
+            return
+        self.__timer = threading.Timer(self.__intervalSeconds, self.__timedFlush)
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def __cancelTimer(self):
+        # Must be called with the state lock held
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+
+    def __timedFlush(self):
+        with self.__stateLock:
+            self.__timer = None
+        try:
+            self.flushIfDirty()
+        except Exception as e:
+            # Nothing can handle the exception in the timer thread, the flush is retried after the next interval
+            print(f'Debounced flush failed: {e}')
+            traceback.print_exc()
+
+    def flushNow(self) -> bool:
+        """
+        Flushes immediately, whether there are changes or not, and cancels the scheduled flush
+        Returns the result of the flush function
+        """
+        with self.__flushLock:
+            with self.__stateLock:
+                self.__cancelTimer()
+                # Changes made while flushing mark the flusher dirty again
+                self.__dirty = False
+
+            try:
+                flushed = self.__flush()
+            except Exception:
+                self.markDirty()
+                raise
+
+            if not flushed:
+                self.markDirty()
+            return flushed
+
+    def flushIfDirty(self) -> bool:
+        """
+        Flushes immediately if there are changes which have not been flushed
+        Returns true if there was nothing to flush or the flush succeeded
+        """
+        if not self.__dirty:
+            return True
+        return self.flushNow()
+
+    def discard(self):
+        """
+        Forgets the changes which have not been flushed and cancels the scheduled flush, e.g. when they are reloaded
+        """
+        with self.__stateLock:
+            self.__cancelTimer()
+            self.__dirty = False
+
+    def close(self) -> bool:
+        """
+        Flushes any remaining changes, used on shutdown
+        """
+        return self.flushIfDirty()
@@ -0,0 +1,109 @@
+import asyncio
+
+from apiutils.FileStorage.PushBulletFileServer import PushBulletFileServer, PushBulletFileServerException
+
+
+class AsyncPushBulletFileServer(PushBulletFileServer):
+    """
+    PushBullet File Server whose file operations are coroutines, the independent HTTP calls of an operation run concurrently
+    Each HTTP call is a blocking call of PushBulletFileServer, run in a worker thread with asyncio.to_thread, so the calls
+    share the same pooled session.
+
+    When writing a file:
+    - The upload request of the index file is made together with the upload request of the file
+    - Once the file is pushed, its old version is deleted while the new index is uploaded
+
+    Files written in several chunks are pushed one chunk at a time, as PushBulletFileServer does, so a file object is still
+    only read one chunk at a time. Only the pushes run in a worker thread, the index is updated in the calling thread,
+    so the write is deferred by the batch of the caller like any other write.
+
+    The sync methods are kept as wrappers which run the coroutines to completion, so this class can be used anywhere
+    PushBulletFileServer is. They cannot be called from a running event loop, await the coroutines instead.
+    """
+
+    @staticmethod
+    def __runSync(coroutine):
+        return asyncio.run(coroutine)
+
+    async def __deleteOldVersion(self, fileEntry):
+        try:
+            await asyncio.gather(*[asyncio.to_thread(self._delete, iden) for iden in PushBulletFileServer._entryIdens(fileEntry)])
+        except PushBulletFileServerException as e:
+            self.errorMsg = 'Failed to delete file: {}'.format(e)
+
+    def __uploadsIndex(self) -> bool:
+        # inside a batch, the index is uploaded at the end of the batch instead
+        return self.isPersistent() and not self._isBatching()
+
+    async def __requestIndexUpload(self, uploadsIndex: bool) -> dict:
+        if not uploadsIndex:
+            return None
+        return await asyncio.to_thread(self._requestUpload, PushBulletFileServer.getIndexFileName())
+
+    async def writeAsync(self, destPath: str, fileBinary, deleteOldVersion=True) -> str:
+        '''
+        Coroutine version of `write`
+        Returns the uploaded path if successful
+        '''
+        filename = destPath.split('/')[-1]
+        # checked in the calling thread, the batch state of PushBulletFileServer is per thread
+        uploadsIndex = self.__uploadsIndex()
+
+        try:
+            if self._fitsSinglePush(fileBinary):
+                PushBulletFileServer._checkFileSize(fileBinary)
+                # the index upload request only depends on the file name, so it is requested at the same time
+                uploadRequest, indexUploadRequest = await asyncio.gather(
+                    asyncio.to_thread(self._requestUpload, filename),
+                    self.__requestIndexUpload(uploadsIndex)
+                )
+                await asyncio.to_thread(self._uploadFile, uploadRequest, fileBinary)
+                fileEntry = (await asyncio.to_thread(self._pushUploadedFile, uploadRequest))['iden']
+            else:
+                # the chunks are pushed one at a time, as PushBulletFileServer does
+                fileEntry, indexUploadRequest = await asyncio.gather(
+                    asyncio.to_thread(self._pushChunks, filename, fileBinary),
+                    self.__requestIndexUpload(uploadsIndex)
+                )
+        except PushBulletFileServerException as e:
+            # if something went wrong, then exit with the error
+            self.errorMsg = 'Error: '+str(e)
+            return None
+
+        oldFileEntry = self._setIndexEntry(destPath, fileEntry)
+
+        # the new version is pushed, so the old version is deleted while the index pointing to the new one is uploaded
+        steps = []
+        if deleteOldVersion and oldFileEntry is not None:
+            steps.append(self.__deleteOldVersion(oldFileEntry))
+        if uploadsIndex:
+            steps.append(asyncio.to_thread(self._uploadIndex, self._makeIndexFile(), indexUploadRequest))
+        else:
+            self._indexChanged()
+        await asyncio.gather(*steps)
+
+        return PushBulletFileServer.sanitizePath(destPath)
+
+    async def readAsync(self, filePath: str):
+        '''
+        Coroutine version of `read`
+        '''
+        return await asyncio.to_thread(self.read, filePath)
+
+    async def readManyAsync(self, filePaths: list[str]) -> list:
+        '''
+        Reads all the files concurrently, returns the binary contents of each of the files, None for a file which could not be read
+        '''
+        return list(await asyncio.gather(*[self.readAsync(path) for path in filePaths]))
+
+    async def uploadFileIndexAsync(self):
+        '''
+        Coroutine version of `uploadFileIndex`
+        '''
+        await asyncio.to_thread(self._uploadIndex, self._makeIndexFile())
+
+    def write(self, destPath: str, fileBinary, deleteOldVersion=True) -> str:
+        return AsyncPushBulletFileServer.__runSync(self.writeAsync(destPath, fileBinary, deleteOldVersion=deleteOldVersion))
+
+    def readMany(self, filePaths: list[str]) -> list:
+        return AsyncPushBulletFileServer.__runSync(self.readManyAsync(filePaths))
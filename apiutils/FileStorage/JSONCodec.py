@@ -0,0 +1,73 @@
+import gzip
+import json
+
+from apiutils.configs.ServerConfig import JSONDBCodecOption
+
+try:
+    import zstandard
+except ImportError:
+    # zstd is optional, files can be stored with gzip without it
+    zstandard = None
+
+
+class JSONCodecException(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class JSONCodec:
+    """
+    Encodes JSON documents into the bytes stored by a file storage, and decodes them back
+    - JSON: Pretty printed JSON, the format the files were originally stored in
+    - COMPACT: JSON without any whitespace
+    - GZIP / ZSTD: Compact JSON compressed with gzip or zstd (requires the zstandard package)
+
+    Decoding does not depend on the option of the codec, the format is sniffed from the magic bytes of the data,
+    so files written in any format (including the files from before the codec) can always be read.
+    """
+    GZIP_MAGIC = b'\x1f\x8b'
+    ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+    GZIP_LEVEL = 6
+    ZSTD_LEVEL = 10
+
+    def __init__(self, option:JSONDBCodecOption=JSONDBCodecOption.JSON):
+        if option == JSONDBCodecOption.ZSTD and zstandard is None:
+            raise JSONCodecException('The zstd JSON codec requires the zstandard package')
+        self.option = option
+
+    @staticmethod
+    def sniffOption(data:bytes) -> JSONDBCodecOption:
+        """
+        Returns the format of the encoded data, JSON (pretty or compact) is returned as JSON
+        """
+        if data.startswith(JSONCodec.GZIP_MAGIC):
+            return JSONDBCodecOption.GZIP
+        if data.startswith(JSONCodec.ZSTD_MAGIC):
+            return JSONDBCodecOption.ZSTD
+        return JSONDBCodecOption.JSON
+
+    def encode(self, obj) -> bytes:
+        if self.option == JSONDBCodecOption.JSON:
+            return json.dumps(obj, indent=4).encode('utf-8')
+
+        compact = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+        if self.option == JSONDBCodecOption.GZIP:
+            # mtime is fixed so the same document is always encoded to the same bytes
+            return gzip.compress(compact, compresslevel=JSONCodec.GZIP_LEVEL, mtime=0)
+        if self.option == JSONDBCodecOption.ZSTD:
+            return zstandard.ZstdCompressor(level=JSONCodec.ZSTD_LEVEL).compress(compact)
+        return compact
+
+    @staticmethod
+    def decode(data:bytes):
+        option = JSONCodec.sniffOption(data)
+        if option == JSONDBCodecOption.GZIP:
+            data = gzip.decompress(data)
+        elif option == JSONDBCodecOption.ZSTD:
+            if zstandard is None:
+                raise JSONCodecException('Cannot decode a zstd JSON file without the zstandard package')
+            # the content size is not always in the frame header when streamed, so it is decompressed as a stream
+            data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        return json.loads(data.decode('utf-8'))
@@ -1,3 +1,6 @@
+import contextlib
+
+
 class JSONDBFileStorageInterface:
     def __init__(self):
         '''
@@ -7,10 +10,73 @@ class JSONDBFileStorageInterface:
 
     def getJSONDB(self) -> dict:
         raise Exception('Must be implemented in subclass')
-    
+
     def writeJSONDB(self, db:dict) -> bool:
         """
         Writes the JSOB db to the file storage
         Returns true if the operation was completed successfully
         """
-        raise Exception('Must be implemented in subclass')
\ No newline at end of file
+        raise Exception('Must be implemented in subclass')
+
+    def getJSONDBRevision(self, refresh:bool=True) -> str:
+        """
+        Returns an identifier of the stored version of the JSON db and its log, which changes every time either is written
+        It is cheaper to get than the JSON db, so it can be used to skip loading a db which did not change
+        If refresh is false, changes made by other clients of the storage since it last checked may not be included
+        Returns None if the storage cannot tell, in which case the JSON db is always loaded
+        """
+        return None
+
+    def batch(self):
+        """
+        Returns a context manager grouping the file operations made in it, so the storage can persist them together
+        e.g. writing a snapshot and truncating the log. By default the operations are not grouped
+        """
+        return contextlib.nullcontext()
+
+    def supportsJSONDBLog(self) -> bool:
+        """
+        Returns true if the file storage can persist the mutation log of the JSON db (see JSONMemeDBLog)
+        If false, the JSON db will write the whole database on every write
+        """
+        return False
+
+    def getJSONDBLog(self) -> list[dict]:
+        """
+        Returns the list of log entries appended since the last truncation, in the order they were appended
+        """
+        raise Exception('Must be implemented in subclass')
+
+    def appendJSONDBLog(self, entries:list[dict]) -> bool:
+        """
+        Appends the given log entries to the end of the stored log
+        Returns true if the operation was completed successfully
+        """
+        raise Exception('Must be implemented in subclass')
+
+    def truncateJSONDBLog(self, count:int=None) -> bool:
+        """
+        Removes the first `count` entries from the stored log, all entries are removed if count is None
+        Called once the entries have been compacted into a snapshot written with writeJSONDB
+        Returns true if the operation was completed successfully
+        """
+        raise Exception('Must be implemented in subclass')
+
+    def supportsArtifacts(self) -> bool:
+        """
+        Returns true if the file storage can keep artifacts derived from the JSON db next to it, e.g. the search index
+        """
+        return False
+
+    def getArtifact(self, name:str) -> bytes:
+        """
+        Returns the contents of the artifact with the given name, None if it does not exist
+        """
+        raise Exception('Must be implemented in subclass')
+
+    def writeArtifact(self, name:str, data:bytes) -> bool:
+        """
+        Writes the artifact with the given name, replacing any previous version of it
+        Returns true if the operation was completed successfully
+        """
+        raise Exception('Must be implemented in subclass')
@@ -1,22 +1,70 @@
 import os
 import json
+from apiutils.FileStorage.JSONCodec import JSONCodec
 from apiutils.FileStorage.JSONDBFileStorageInterface import JSONDBFileStorageInterface
-from apiutils.configs.ServerConfig import ServerConfig, ProjectEnvironment
+from apiutils.configs.ServerConfig import ServerConfig, ProjectEnvironment, JSONDBCodecOption
 
 class LocalFileStorage(JSONDBFileStorageInterface):
     """
     Stores the files to the repository project folder
+    The mutation log of the database is stored next to it as a JSON lines file
+    The database is written as pretty printed JSON by default, so the file in the repository stays readable and diffable,
+    it is read in any of the formats of JSONCodec
     """
-    def __init__(self):
+    def __init__(self, codecOption:JSONDBCodecOption=JSONDBCodecOption.JSON):
+        self.__codec = JSONCodec(codecOption)
         self.__dbFilePath = ServerConfig.path('data', 'db.json')
         if ServerConfig.PROJECT_ENVIRONMENT == ProjectEnvironment.TESTING:
             self.__dbFilePath = ServerConfig.path('data', 'testing_db.json')
+        self.__logFilePath = os.path.splitext(self.__dbFilePath)[0] + '.log.jsonl'
 
     def getJSONDB(self) -> dict:
-        with open(self.__dbFilePath, 'r') as file:
-            return json.load(file)
+        with open(self.__dbFilePath, 'rb') as file:
+            return JSONCodec.decode(file.read())
+
+    def getJSONDBRevision(self, refresh:bool=True) -> str:
+        # The modification time and size of both files change whenever they are written
+        fileStats = []
+        for path in (self.__dbFilePath, self.__logFilePath):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                fileStats.append(f'{stat.st_mtime_ns}:{stat.st_size}')
+            else:
+                fileStats.append('None')
+        return ','.join(fileStats)
 
     def writeJSONDB(self, db:dict) -> bool:
-        with open(self.__dbFilePath, 'w') as file:
-            json.dump(db, file, indent=4)
-        return True
\ No newline at end of file
+        with open(self.__dbFilePath, 'wb') as file:
+            file.write(self.__codec.encode(db))
+        return True
+
+    def supportsJSONDBLog(self) -> bool:
+        return True
+
+    def getJSONDBLog(self) -> list[dict]:
+        if not os.path.exists(self.__logFilePath):
+            return []
+
+        with open(self.__logFilePath, 'r') as file:
+            return [json.loads(line) for line in file if line.strip() != '']
+
+    def appendJSONDBLog(self, entries:list[dict]) -> bool:
+        with open(self.__logFilePath, 'a') as file:
+            for entry in entries:
+                file.write(json.dumps(entry) + '\n')
+        return True
+
+    def truncateJSONDBLog(self, count:int=None) -> bool:
+        remaining = []
+        if count is not None:
+            remaining = self.getJSONDBLog()[count:]
+
+        if len(remaining) == 0:
+            if os.path.exists(self.__logFilePath):
+                os.remove(self.__logFilePath)
+            return True
+
+        with open(self.__logFilePath, 'w') as file:
+            for entry in remaining:
+                file.write(json.dumps(entry) + '\n')
+        return True
@@ -0,0 +1,42 @@
+import os
+
+from apiutils.FileStorage.ThumbnailFileStorageInterface import ThumbnailFileStorageInterface
+from apiutils.configs.ServerConfig import ServerConfig, ProjectEnvironment
+
+
+class LocalThumbnailStorage(ThumbnailFileStorageInterface):
+    """
+    Stores the thumbnails as files in the repository project folder
+    """
+    def __init__(self):
+        self.__thumbnailDir = ServerConfig.path('data', 'thumbnails')
+        if ServerConfig.PROJECT_ENVIRONMENT == ProjectEnvironment.TESTING:
+            self.__thumbnailDir = ServerConfig.path('data', 'testing_thumbnails')
+
+    def __thumbnailPath(self, thumbnailID:str) -> str:
+        return os.path.join(self.__thumbnailDir, thumbnailID)
+
+    def writeThumbnail(self, thumbnailBytes:bytes) -> str:
+        thumbnailID = ThumbnailFileStorageInterface.makeThumbnailID(thumbnailBytes)
+        if self.hasThumbnail(thumbnailID):
+            return thumbnailID
+
+        os.makedirs(self.__thumbnailDir, exist_ok=True)
+        with open(self.__thumbnailPath(thumbnailID), 'wb') as file:
+            file.write(thumbnailBytes)
+        return thumbnailID
+
+    def readThumbnail(self, thumbnailID:str) -> bytes:
+        if not self.hasThumbnail(thumbnailID):
+            return None
+
+        with open(self.__thumbnailPath(thumbnailID), 'rb') as file:
+            return file.read()
+
+    def hasThumbnail(self, thumbnailID:str) -> bool:
+        return os.path.exists(self.__thumbnailPath(thumbnailID))
+
+    def deleteThumbnail(self, thumbnailID:str) -> bool:
+        if self.hasThumbnail(thumbnailID):
+            os.remove(self.__thumbnailPath(thumbnailID))
+        return True
@@ -1,15 +1,58 @@
-import json
-
+from apiutils.FileStorage.AsyncPushBulletFileServer import AsyncPushBulletFileServer
+from apiutils.FileStorage.JSONCodec import JSONCodec
 from apiutils.FileStorage.JSONDBFileStorageInterface import JSONDBFileStorageInterface
+from apiutils.FileStorage.PBFSMetadataCache import PBFSMetadataCache
+from apiutils.FileStorage.PBFSReadCache import PBFSReadCache
 from apiutils.FileStorage.PushBulletFileServer import PushBulletFileServer
+from apiutils.configs.ServerConfig import ServerConfig, JSONDBCodecOption
 
 class PBFSFileStorage(JSONDBFileStorageInterface):
-    def __init__(self, accessToken, serverIdentifier):
-        self.__pbfs = PushBulletFileServer(accessToken, serverIden=serverIdentifier, persistentStorage=True)
+    def __init__(self, accessToken, serverIdentifier, metadataCache:PBFSMetadataCache=None, asyncClient:bool=False,
+                 codecOption:JSONDBCodecOption=None, readCache:PBFSReadCache=None):
+        """
+        If no metadata cache is given, one is kept in the temporary directory so the file index is not downloaded on every start
+        Likewise for the read cache, so files which did not change (e.g. the DB snapshot) are not downloaded on every start
+        If asyncClient is true, the AsyncPushBulletFileServer is used, which runs the independent calls of a write concurrently
+        and reads the DB log files concurrently
+        The DB and its log files are written with the given codec (the JSON_DB_CODEC config by default), and read in any format
+        """
+        self.__codec = JSONCodec(codecOption if codecOption is not None else ServerConfig.JSON_DB_CODEC)
+        if metadataCache is None:
+            metadataCache = PBFSMetadataCache(PBFSMetadataCache.makeDefaultFilePath(accessToken))
+        if readCache is None:
+            readCache = PBFSReadCache(PBFSReadCache.makeDefaultDir(accessToken))
+        fileServerClass = AsyncPushBulletFileServer if asyncClient else PushBulletFileServer
+        self.__pbfs = fileServerClass(accessToken, serverIden=serverIdentifier, persistentStorage=True, metadataCache=metadataCache,
+                                      readCache=readCache)
         self.__dbFilePath = "dbFiles/db.json"
+        # Each append to the DB log is uploaded as its own numbered file in this directory, named "<number>-<entry count>.json"
+        # so the log can be truncated without reading it. Files written before the count was in the name are "<number>.json"
+        self.__logDirPath = "dbFiles/dbLog"
+        self.__artifactDirPath = "dbFiles/artifacts"
+
+    def getFileServer(self) -> PushBulletFileServer:
+        """
+        Returns the file server used by the storage, so other stores on the same server share its file index
+        """
+        return self.__pbfs
 
     def __uploadDBFile(self, db):
-        return self.__pbfs.write(self.__dbFilePath, json.dumps(db, indent=4), deleteOldVersion=False)
+        # The path keeps its .json name whatever the codec, the format is sniffed when it is read
+        return self.__pbfs.write(self.__dbFilePath, self.__codec.encode(db), deleteOldVersion=False)
+
+    def __getLogFiles(self) -> list[tuple[int, int, str]]:
+        """
+        Returns the number, entry count and path of each log file, in the order they were appended
+        The entry count is None for files whose name does not include it
+        """
+        logFiles = []
+        for name in self.__pbfs.listDir(self.__logDirPath):
+            number, _, count = name.split('.')[0].partition('-')
+            logFiles.append((int(number), int(count) if count != '' else None, f'{self.__logDirPath}/{name}'))
+        return sorted(logFiles)
+
+    def __logFilePath(self, number:int, count:int) -> str:
+        return f'{self.__logDirPath}/{number}-{count}.json'
 
     def getJSONDB(self) -> dict:
         # If it does not exist on the server, initialize it and then return empty dictionary
@@ -18,8 +61,74 @@ class PBFSFileStorage(JSONDBFileStorageInterface):
             return {}
 
         binary = self.__pbfs.read(self.__dbFilePath)
-        return json.loads(binary.decode("utf-8"))
+        return JSONCodec.decode(binary)
+
+    def getJSONDBRevision(self, refresh:bool=True) -> str:
+        # Every write pushes a new file, so the push identifiers of the DB and its log files identify their versions
+        if refresh:
+            self.__pbfs.refreshIndex()
+
+        idens = [self.__pbfs.getFileIden(self.__dbFilePath)]
+        idens += [self.__pbfs.getFileIden(path) for _, _, path in self.__getLogFiles()]
+        return ','.join(str(iden) for iden in idens)
 
     def writeJSONDB(self, db:dict) -> bool:
         path = self.__uploadDBFile(db)
-        return path is not None
\ No newline at end of file
+        return path is not None
+
+    def batch(self):
+        # the file index is uploaded once at the end of the batch, instead of after every written or deleted file
+        return self.__pbfs.batch()
+
+    def supportsJSONDBLog(self) -> bool:
+        return True
+
+    def getJSONDBLog(self) -> list[dict]:
+        logFiles = self.__getLogFiles()
+        binaries = self.__pbfs.readMany([path for _, _, path in logFiles])
+
+        entries = []
+        for (number, _, _), binary in zip(logFiles, binaries):
+            if binary is None:
+                raise Exception(f'Could not read DB log file #{number}: {self.__pbfs.errorMsg}')
+            entries += JSONCodec.decode(binary)
+        return entries
+
+    def appendJSONDBLog(self, entries:list[dict]) -> bool:
+        logFiles = self.__getLogFiles()
+        nextNumber = logFiles[-1][0] + 1 if len(logFiles) > 0 else 0
+        path = self.__pbfs.write(self.__logFilePath(nextNumber, len(entries)), self.__codec.encode(entries))
+        return path is not None
+
+    def truncateJSONDBLog(self, count:int=None) -> bool:
+        # Log files hold batches of entries, so only remove files that were completely compacted
+        removed = 0
+        with self.__pbfs.batch():
+            for _, fileEntryCount, path in self.__getLogFiles():
+                if count is not None:
+                    if fileEntryCount is None:
+                        # only files written before the entry count was in the name have to be read
+                        binary = self.__pbfs.read(path)
+                        if binary is None:
+                            return False
+                        fileEntryCount = len(JSONCodec.decode(binary))
+                    if removed + fileEntryCount > count:
+                        break
+                    removed += fileEntryCount
+
+                if self.__pbfs.deleteFile(path) != 0:
+                    return False
+        return True
+
+    def supportsArtifacts(self) -> bool:
+        return True
+
+    def getArtifact(self, name:str) -> bytes:
+        path = f'{self.__artifactDirPath}/{name}'
+        if not self.__pbfs.pathExistsInIndex(path):
+            return None
+        return self.__pbfs.read(path)
+
+    def writeArtifact(self, name:str, data:bytes) -> bool:
+        path = self.__pbfs.write(f'{self.__artifactDirPath}/{name}', data)
+        return path is not None
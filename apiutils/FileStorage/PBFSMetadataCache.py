@@ -0,0 +1,146 @@
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class PBFSMetadataCache:
+    """
+    Caches the PushBullet devices and the file index of a PushBullet File Server, persisted to a local JSON file so it
+    survives process restarts.
+    Cached devices are used as they are until the TTL expires, they are then validated by only requesting the devices
+    modified after the latest cached one. The file index is cached with the identifier of its push, which changes every
+    time the index is uploaded, so a cached index is only used if the server device still points to it.
+    """
+    DEFAULT_TTL_SECONDS = 60
+
+    class Fields:
+        Devices = 'devices'
+        ValidatedAt = 'validatedAt'
+        Index = 'index'
+        IndexIden = 'iden'
+        IndexContent = 'content'
+
+    def __init__(self, filePath:str, ttlSeconds:float=DEFAULT_TTL_SECONDS):
+        self.__filePath = filePath
+        self.__ttlSeconds = ttlSeconds
+        self.__lock = threading.Lock()
+        self.__data = self.__load()
+
+    @staticmethod
+    def makeDefaultFilePath(accessToken:str) -> str:
+        """
+        Returns the cache file path for the PushBullet account, in the temporary directory of the system
+        The file name uses a hash of the access token, so the token itself is not written to disk
+        """
+        tokenHash = hashlib.sha256(accessToken.encode()).hexdigest()[:16]
+        return os.path.join(tempfile.gettempdir(), f'pbfs_metadata_{tokenHash}.json')
+
+    def __emptyData(self) -> dict:
+        return {
+            PBFSMetadataCache.Fields.Devices: None,
+            PBFSMetadataCache.Fields.ValidatedAt: 0,
+            PBFSMetadataCache.Fields.Index: None
+        }
+
+    def __load(self) -> dict:
+        try:
+            with open(self.__filePath, 'r') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            # A missing or corrupt cache is the same as an empty one
+            return self.__emptyData()
+
+        if not isinstance(data, dict):
+            return self.__emptyData()
+        return {**self.__emptyData(), **data}
+
+    def __save(self):
+        # Written to a temporary file first, so a process reading the cache never sees a partial file
+        tempPath = f'{self.__filePath}.{os.getpid()}.tmp'
+        try:
+            with open(tempPath, 'w') as file:
+                json.dump(self.__data, file)
+            os.replace(tempPath, self.__filePath)
+        except OSError:
+            # The cache is only an optimization, the file server works the same without it
+            pass
+
+    def hasDevices(self) -> bool:
+        return self.__data[PBFSMetadataCache.Fields.Devices] is not None
+
+    def isExpired(self) -> bool:
+        return time.time() - self.__data[PBFSMetadataCache.Fields.ValidatedAt] > self.__ttlSeconds
+
+    def getDevices(self) -> list[dict]:
+        with self.__lock:
+            devices = self.__data[PBFSMetadataCache.Fields.Devices] or {}
+            return [dict(dev) for dev in devices.values()]
+
+    def getLatestModified(self) -> float:
+        """
+        Returns the latest modification time of the cached devices, used as the modified_after parameter to validate them
+        """
+        with self.__lock:
+            devices = self.__data[PBFSMetadataCache.Fields.Devices] or {}
+            return max((dev.get('modified', 0) for dev in devices.values()), default=0)
+
+    def setDevices(self, devices:list[dict]):
+        """
+        Replaces the cached devices with the full list of devices from the server
+        """
+        with self.__lock:
+            self.__data[PBFSMetadataCache.Fields.Devices] = {
+                dev['iden']: dev for dev in devices if dev.get('active', True)
+            }
+            self.__data[PBFSMetadataCache.Fields.ValidatedAt] = time.time()
+            self.__save()
+
+    def updateDevices(self, devices:list[dict]):
+        """
+        Updates the cached devices with the devices changed on the server, inactive devices have been deleted
+        An empty list marks the cached devices as validated
+        """
+        with self.__lock:
+            cached = self.__data[PBFSMetadataCache.Fields.Devices] or {}
+            for dev in devices:
+                if dev.get('active', True):
+                    cached[dev['iden']] = dev
+                else:
+                    cached.pop(dev['iden'], None)
+
+            self.__data[PBFSMetadataCache.Fields.Devices] = cached
+            self.__data[PBFSMetadataCache.Fields.ValidatedAt] = time.time()
+            self.__save()
+
+    def removeDevice(self, iden:str):
+        with self.__lock:
+            cached = self.__data[PBFSMetadataCache.Fields.Devices]
+            if cached is not None and cached.pop(iden, None) is not None:
+                self.__save()
+
+    def getIndex(self, indexIden:str) -> dict:
+        """
+        Returns a copy of the cached file index if it is the one uploaded with the given push identifier, None otherwise
+        """
+        with self.__lock:
+            index = self.__data[PBFSMetadataCache.Fields.Index]
+            if index is None or index[PBFSMetadataCache.Fields.IndexIden] != indexIden:
+                return None
+            return copy.deepcopy(index[PBFSMetadataCache.Fields.IndexContent])
+
+    def setIndex(self, indexIden:str, index:dict):
+        with self.__lock:
+            self.__data[PBFSMetadataCache.Fields.Index] = {
+                PBFSMetadataCache.Fields.IndexIden: indexIden,
+                PBFSMetadataCache.Fields.IndexContent: copy.deepcopy(index)
+            }
+            self.__save()
+
+    def clear(self):
+        with self.__lock:
+            self.__data = self.__emptyData()
+            self.__save()
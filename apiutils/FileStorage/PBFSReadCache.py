@@ -0,0 +1,192 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class PBFSReadCache:
+    """
+    Caches the contents of files read from a PushBullet File Server in a local directory, keyed by push identifier.
+    A push never changes once it is made (writing a file makes a new push), so a cached file is valid for as long as its
+    push exists, and reads of files which did not change since the last read (also by a previous process) are not
+    downloaded again.
+    The total size of the cached files is bounded, the least recently read files are evicted first.
+    """
+    DEFAULT_MAX_SIZE_BYTES = 128 * 1024 * 1024
+
+    def __init__(self, cacheDir:str, maxSizeBytes:int=DEFAULT_MAX_SIZE_BYTES):
+        self.__cacheDir = cacheDir
+        self.__maxSizeBytes = maxSizeBytes
+        self.__lock = threading.Lock()
+        # file name -> size, from the least to the most recently used
+        self.__entries = OrderedDict()
+        self.__totalSize = 0
+        self.__loadEntries()
+
+    @staticmethod
+    def makeDefaultDir(accessToken:str) -> str:
+        """
+        Returns the cache directory for the PushBullet account, in the temporary directory of the system
+        The directory name uses a hash of the access token, so the token itself is not written to disk
+        """
+        tokenHash = hashlib.sha256(accessToken.encode()).hexdigest()[:16]
+        return os.path.join(tempfile.gettempdir(), f'pbfs_read_cache_{tokenHash}')
+
+    @staticmethod
+    def __fileName(iden:str) -> str:
+        return hashlib.sha256(iden.encode()).hexdigest()
+
+    def __filePath(self, fileName:str) -> str:
+        return os.path.join(self.__cacheDir, fileName)
+
+    def __loadEntries(self):
+        try:
+            os.makedirs(self.__cacheDir, exist_ok=True)
+            files = [entry for entry in os.scandir(self.__cacheDir) if entry.is_file() and not entry.name.endswith('.tmp')]
+        except OSError:
+            return
+
+        # the modification time of a file is updated when it is read, so it orders the files by their last use
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+            size = entry.stat().st_size
+            self.__entries[entry.name] = size
+            self.__totalSize += size
+        self.__evict()
+
+    def __evict(self):
+        # Must be called with the lock held
+        while self.__totalSize > self.__maxSizeBytes and len(self.__entries) > 0:
+            fileName, size = self.__entries.popitem(last=False)
+            self.__totalSize -= size
+            try:
+                os.remove(self.__filePath(fileName))
+            except OSError:
+                pass
+
+    def __forget(self, fileName:str):
+        # Must be called with the lock held
+        size = self.__entries.pop(fileName, None)
+        if size is not None:
+            self.__totalSize -= size
+
+    def get(self, iden:str) -> bytes:
+        """
+        Returns the cached contents of the push, None if they are not cached
+        """
+        fileName = PBFSReadCache.__fileName(iden)
+        with self.__lock:
+            if fileName not in self.__entries:
+                return None
+
+            path = self.__filePath(fileName)
+            try:
+                with open(path, 'rb') as file:
+                    contents = file.read()
+                os.utime(path)
+            except OSError:
+                # removed from outside the cache, e.g. by the system cleaning the temporary directory
+                self.__forget(fileName)
+                return None
+
+            self.__entries.move_to_end(fileName)
+            return contents
+
+    def put(self, iden:str, contents:bytes):
+        """
+        Caches the contents of the push, files larger than the size of the cache are not cached
+        """
+        for _ in self.putBlocks(iden, [contents]):
+            pass
+
+    def putBlocks(self, iden:str, blocks):
+        """
+        Yields the blocks of the contents of the push while caching them, so the contents are never held whole in memory
+        The push is only cached once all of its blocks were read, not if reading them raises or stops early,
+        and files larger than the size of the cache are not cached
+        """
+        fileName = PBFSReadCache.__fileName(iden)
+        path = self.__filePath(fileName)
+        # Written to a temporary file first, so a process reading the cache never sees a partial file
+        tempPath = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        file = None
+        size = 0
+        try:
+            try:
+                os.makedirs(self.__cacheDir, exist_ok=True)
+                file = open(tempPath, 'wb')
+            except OSError:
+                # The cache is only an optimization, the file server works the same without it
+                file = None
+
+            for block in blocks:
+                size += len(block)
+                if file is not None:
+                    try:
+                        if size > self.__maxSizeBytes:
+                            raise OSError('The file is larger than the cache')
+                        file.write(block)
+                    except OSError:
+                        file.close()
+                        file = None
+                        PBFSReadCache.__removeFile(tempPath)
+                yield block
+
+            if file is not None:
+                file.close()
+                file = None
+                self.__addFile(fileName, tempPath, size)
+        finally:
+            if file is not None:
+                file.close()
+                PBFSReadCache.__removeFile(tempPath)
+
+    @staticmethod
+    def __removeFile(path:str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __addFile(self, fileName:str, tempPath:str, size:int):
+        with self.__lock:
+            try:
+                os.replace(tempPath, self.__filePath(fileName))
+            except OSError:
+                PBFSReadCache.__removeFile(tempPath)
+                return
+
+            self.__forget(fileName)
+            self.__entries[fileName] = size
+            self.__totalSize += size
+            self.__evict()
+
+    def remove(self, iden:str):
+        """
+        Removes the push from the cache, called when the push is deleted
+        """
+        fileName = PBFSReadCache.__fileName(iden)
+        with self.__lock:
+            if fileName not in self.__entries:
+                return
+            self.__forget(fileName)
+            try:
+                os.remove(self.__filePath(fileName))
+            except OSError:
+                pass
+
+    def getSize(self) -> int:
+        """
+        Returns the total size of the cached files in bytes
+        """
+        return self.__totalSize
+
+    def clear(self):
+        with self.__lock:
+            for fileName in self.__entries:
+                try:
+                    os.remove(self.__filePath(fileName))
+                except OSError:
+                    pass
+            self.__entries.clear()
+            self.__totalSize = 0
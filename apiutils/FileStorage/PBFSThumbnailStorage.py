@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+
+from apiutils.FileStorage.ThumbnailFileStorageInterface import ThumbnailFileStorageInterface
+from apiutils.FileStorage.PushBulletFileServer import PushBulletFileServer
+
+
+class PBFSThumbnailStorage(ThumbnailFileStorageInterface):
+    """
+    Stores the thumbnails as files in the PushBullet File Server
+    The file server should be shared with the PBFSFileStorage, so both write to the same file index
+    """
+    # Number of recently used thumbnails kept in memory, older ones are read from the read cache of the file server
+    CACHE_SIZE = 256
+
+    def __init__(self, pbfs:PushBulletFileServer):
+        self.__pbfs = pbfs
+        self.__thumbnailDir = 'thumbnails'
+        # Thumbnails never change for a given ID, so the recently used ones are kept in memory, least recently used first
+        self.__cache = OrderedDict()
+        self.__cacheLock = threading.Lock()
+
+    def __thumbnailPath(self, thumbnailID:str) -> str:
+        return f'{self.__thumbnailDir}/{thumbnailID}'
+
+    def __cacheThumbnail(self, thumbnailID:str, thumbnailBytes:bytes):
+        with self.__cacheLock:
+            self.__cache[thumbnailID] = thumbnailBytes
+            self.__cache.move_to_end(thumbnailID)
+            while len(self.__cache) > PBFSThumbnailStorage.CACHE_SIZE:
+                self.__cache.popitem(last=False)
+
+    def __getCachedThumbnail(self, thumbnailID:str) -> bytes:
+        with self.__cacheLock:
+            thumbnailBytes = self.__cache.get(thumbnailID)
+            if thumbnailBytes is not None:
+                self.__cache.move_to_end(thumbnailID)
+            return thumbnailBytes
+
+    def writeThumbnail(self, thumbnailBytes:bytes) -> str:
+        thumbnailID = ThumbnailFileStorageInterface.makeThumbnailID(thumbnailBytes)
+        if not self.hasThumbnail(thumbnailID):
+            if self.__pbfs.write(self.__thumbnailPath(thumbnailID), thumbnailBytes) is None:
+                return None
+
+        self.__cacheThumbnail(thumbnailID, thumbnailBytes)
+        return thumbnailID
+
+    def readThumbnail(self, thumbnailID:str) -> bytes:
+        thumbnailBytes = self.__getCachedThumbnail(thumbnailID)
+        if thumbnailBytes is not None:
+            return thumbnailBytes
+
+        thumbnailBytes = self.__pbfs.read(self.__thumbnailPath(thumbnailID))
+        if thumbnailBytes is not None:
+            self.__cacheThumbnail(thumbnailID, thumbnailBytes)
+        return thumbnailBytes
+
+    def hasThumbnail(self, thumbnailID:str) -> bool:
+        return thumbnailID in self.__cache or self.__pbfs.pathExistsInIndex(self.__thumbnailPath(thumbnailID))
+
+    def deleteThumbnail(self, thumbnailID:str) -> bool:
+        with self.__cacheLock:
+            self.__cache.pop(thumbnailID, None)
+
+        path = self.__thumbnailPath(thumbnailID)
+        if not self.__pbfs.pathExistsInIndex(path):
+            return True
+        return self.__pbfs.deleteFile(path) == 0
+
+    def batch(self):
+        # the file index is uploaded once for all the thumbnails written in the batch
+        return self.__pbfs.batch()
@@ -2,12 +2,20 @@ import json
 import mimetypes
 import os
 import sys
+import threading
 import time
+from contextlib import contextmanager
 from datetime import date, datetime
 
 import pytz
 import requests
+from requests.adapters import HTTPAdapter
 from tzlocal import get_localzone
+from urllib3.util.retry import Retry
+
+from apiutils.FileStorage.PBFSMetadataCache import PBFSMetadataCache
+from apiutils.FileStorage.PBFSReadCache import PBFSReadCache
+from apiutils.OutboundPolicy import Backend, getOutboundPolicy
 
 
 def prettify(d: dict) -> str:
@@ -54,6 +62,18 @@ class PushBulletFileServer():
 
     VERSION = 1.0
     DEVICE_MANUFACTURER = 'PushBullet File Server'
+
+    # Connection pool and retry defaults for the HTTP session
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_MAX_RETRIES = 3
+    DEFAULT_RETRY_BACKOFF_FACTOR = 0.5
+    # Responses with these status codes are retried, only for requests which are safe to repeat
+    __RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    __RETRY_METHODS = frozenset(['GET', 'HEAD', 'DELETE'])
+    # Files larger than this are split into chunks pushed separately, below the 25 MB limit of a single push
+    DEFAULT_CHUNK_SIZE = 24 * 1024 * 1024
+    # Downloaded files are read from the response in blocks of this size, so a chunk is never held whole in memory
+    DOWNLOAD_BLOCK_SIZE = 1024 * 1024
     
     def __init__ (  self, access_token, 
                     index: dict=None,
@@ -61,7 +81,13 @@ class PushBulletFileServer():
                     serverIden: str=None, # identity of the server
                     createServer:bool=False, # make the device if it does not exist
                     loadIndexFromServer: bool=False,
-                    persistentStorage:bool=False
+                    persistentStorage:bool=False,
+                    poolSize: int=DEFAULT_POOL_SIZE,
+                    maxRetries: int=DEFAULT_MAX_RETRIES,
+                    retryBackoffFactor: float=DEFAULT_RETRY_BACKOFF_FACTOR,
+                    metadataCache: PBFSMetadataCache=None,
+                    chunkSize: int=DEFAULT_CHUNK_SIZE,
+                    readCache: PBFSReadCache=None
                 ):
         '''
         PushBullet File Server Constructor
@@ -72,10 +98,21 @@ class PushBulletFileServer():
         - `serverIden` is the identifier string of the server device on PushBullet
         - `loadIndexFromServer` is used to load the file index from the server, will only work if file index was uploaded before using `upload_file_index()` or setting `persistent_storage`
         - `persistentStorage`, set to true if push bullet server storage should be persistent (i.e. file index is saved to server and loaded from server)
+        - `poolSize` is the number of kept-alive connections per host (PushBullet API, file upload and file download hosts)
+        - `maxRetries` is the number of times a request is retried on a connection error, or on a server error for requests which are safe to repeat
+        - `retryBackoffFactor` scales the exponential delay between retries, in seconds
+        - `metadataCache` caches the devices and file index between starts, so they are not fetched from the server every time
+        - `chunkSize` is the largest size of a single push, larger files are written as several chunks
+        - `readCache` keeps the contents of read files on disk, so files which did not change are not downloaded again
         '''
         # double underscore prepend means private members and methods
         self.__accessToken = access_token
         self.errorMsg = '' # used to track errors
+        self.__session = PushBulletFileServer.__makeSession(poolSize, maxRetries, retryBackoffFactor)
+        self.__policy = getOutboundPolicy(Backend.PUSHBULLET)
+        self.__metadataCache = metadataCache
+        self.__chunkSize = chunkSize
+        self.__readCache = readCache
         self.__serverIden = self.__getServerIden(serverName, serverIden, createServer)
 
         # if the storage is persistent, we want to upload the file index every time we do a file action
@@ -84,6 +121,14 @@ class PushBulletFileServer():
 
         self.__index = {}
         self.__indexIden = None
+        # Index uploads are serialized, and each snapshot of the index has a version so an older snapshot
+        # is never uploaded after a newer one
+        self.__indexUploadLock = threading.Lock()
+        self.__indexSnapshotVersion = 0
+        self.__uploadedIndexVersion = 0
+        # While a thread has a batch open, the index upload of its file operations is deferred to the end of its outermost
+        # batch. Batches are per thread, so the file operations of other threads still upload the index before returning
+        self.__batchState = threading.local()
 
         if index is not None:
             self.__index = index
@@ -97,6 +142,37 @@ class PushBulletFileServer():
         # print('Server Index:')
         # print(self.__index)
 
+    @staticmethod
+    def __makeSession(poolSize:int, maxRetries:int, retryBackoffFactor:float) -> requests.Session:
+        '''
+        Makes the HTTP session used for all the requests, it keeps connections alive so a request to a host
+        reuses the TLS connection of the previous one instead of opening a new one
+        '''
+        # Pushes are not safe to repeat, so POST requests are only retried when the connection could not be made
+        retry = Retry(
+            total=maxRetries,
+            backoff_factor=retryBackoffFactor,
+            status_forcelist=PushBulletFileServer.__RETRY_STATUS_CODES,
+            allowed_methods=PushBulletFileServer.__RETRY_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retry)
+
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def __request(self, method:str, url:str, **kwargs) -> requests.Response:
+        # the session already retries the requests, the policy adds the timeout and the PushBullet circuit breaker
+        return self.__policy.request(method, url, session=self.__session, retry=False, **kwargs)
+
+    def close(self):
+        '''
+        Closes the connections kept alive by the file server
+        '''
+        self.__session.close()
+
     def __getServerIden(self, name, iden, createServer):
         if iden is not None:
             return iden
@@ -115,12 +191,12 @@ class PushBulletFileServer():
     def __makeRequestHeader(self):
         return {'Access-Token': self.__accessToken}
 
-    def __getIndexFromServer(self):
+    def __getIndexFromServer(self, validateDevices:bool=False):
         '''
         Returns the index uploaded to the file server if any,
         Returns None if nothing was found
         '''
-        svrDev = self.getPBFSDevice(iden=self.__serverIden)
+        svrDev = self.__findPBFSDevice(self.__listDevices(validate=validateDevices), iden=self.__serverIden)
         if svrDev is None:
             return None, None
         
@@ -132,11 +208,20 @@ class PushBulletFileServer():
 
         if indexIden == 'None' or indexIden == '':
             return None, None
+
+        # the cached index can be used if it is still the one the device points to
+        if self.__metadataCache is not None:
+            cachedIndex = self.__metadataCache.getIndex(indexIden)
+            if cachedIndex is not None:
+                return cachedIndex, indexIden
         
         # get the file index using the identifier
-        indexFile = self.__pull(indexIden)
+        indexFile = self._pull(indexIden)
+        index = json.loads(indexFile['content'].decode('utf-8'))
 
-        return json.loads(indexFile['content'].decode('utf-8')), indexIden
+        if self.__metadataCache is not None:
+            self.__metadataCache.setIndex(indexIden, index)
+        return index, indexIden
 
     def successfulHTTPResponse(response:requests.Response):
         return 200 <= response.status_code and response.status_code <= 299
@@ -153,14 +238,62 @@ class PushBulletFileServer():
         
         return True
 
-    def __push(self, text=None, link: str = None, title: str=None, filepath: str =None, file=None, limitFileSize: bool = True) -> dict:
+    @staticmethod
+    def _checkFileSize(fileContents, limitFileSize: bool = True):
+        # checks if file is greater than 25 MB
+        if limitFileSize and ( (sys.getsizeof(fileContents) +33) / (1024*1024)) > 25:
+            raise exceptions.InvalidConfiguration('File size is too big!')
+
+    def _requestUpload(self, filename: str) -> dict:
+        '''
+        First step of pushing a file, requests an upload URL for the file from the server
+        It only depends on the file name, so it can be requested before the file contents are ready
+        Returns the upload request, which is passed to `_uploadFile` and `_pushUploadedFile`
+        '''
+        fileMimeType, _ = mimetypes.MimeTypes().guess_type(filename)
+        response = self.__request(
+            'POST',
+            '{}/upload-request'.format(PushBulletFileServer.PUSHBULLET_API),
+            headers = self.__makeRequestHeader(),
+            json = {
+                'file_name': filename,
+                'file_type': fileMimeType,
+            }
+        )
+
+        PushBulletFileServer.errIfBadResponse(response)
+        return response.json()
+
+    def _uploadFile(self, uploadRequest: dict, fileContents):
+        '''
+        Second step of pushing a file, uploads the file contents to the upload URL of the upload request
+        '''
+        response = self.__request(
+            'POST',
+            uploadRequest['upload_url'],
+            headers = self.__makeRequestHeader(),
+            files = {
+                'file' : fileContents
+            }
+        )
+        PushBulletFileServer.errIfBadResponse(response)
+
+    def _pushUploadedFile(self, uploadRequest: dict) -> dict:
+        '''
+        Last step of pushing a file, pushes the file uploaded with the upload request
+        Returns the push
+        '''
+        return self.__push(uploadRequest=uploadRequest)
+
+    def __push(self, text=None, link: str = None, title: str=None, filepath: str =None, file=None, limitFileSize: bool = True, uploadRequest: dict = None) -> dict:
         """
         Pushes text, URLS (links) and files to the pushbullet server
         - `filepath` is the path to the file on the local system
         - `file` is a tuple which is in the format of ( <file name>, <file binary content> )
         - `limit_file_size` is a boolean which limits file sizes to 25 MB, set to false if you use pushbullet premium
+        - `uploadRequest` is the upload request of a file already uploaded with `_uploadFile`
         """
-        if text is None and link is None and filepath is None and file is None:
+        if text is None and link is None and filepath is None and file is None and uploadRequest is None:
             # Nothing to push
             raise exceptions.InvalidParameters('Nothing to push!')
         
@@ -212,57 +345,28 @@ class PushBulletFileServer():
                 except ValueError:
                     raise exceptions.InvalidParameters('File tuple to push is used incorrectly!')
 
-            fileMimeType, _ = mimetypes.MimeTypes().guess_type(filename)
-
             # check if its under the limit
-            if limitFileSize:
-                # checks if file is greater than 25 MB
-                if ( (sys.getsizeof(fileContents) +33) / (1024*1024)) > 25:
-                    raise exceptions.InvalidConfiguration('File size is too big!')
-
-            # make upload request
-            # by here should have filename, file_mime_type, file_contents
-
-            response = requests.post(
-                '{}/upload-request'.format(PushBulletFileServer.PUSHBULLET_API),
-                headers = pushRequest['headers'],
-                json = {
-                    'file_name': filename,
-                    'file_type': fileMimeType,
-                }
-            )
-
-            PushBulletFileServer.errIfBadResponse(response)
+            PushBulletFileServer._checkFileSize(fileContents, limitFileSize)
 
-            # get upload url from upload request
-            # and us to upload acutal file
-            uploadResponse = response.json()
-
-            uploadURL = uploadResponse['upload_url']
-
-            response = requests.post(
-                uploadURL,
-                headers = pushRequest['headers'],
-                files = {
-                    'file' : fileContents
-                }
-            )
-            PushBulletFileServer.errIfBadResponse(response)
+            # upload the file, then push it below
+            uploadRequest = self._requestUpload(filename)
+            self._uploadFile(uploadRequest, fileContents)
 
+        if uploadRequest is not None:
             # populate push body
             pushBody['type'] = 'file'
-            pushBody['file_name'] = uploadResponse['file_name']
-            pushBody['file_type'] = uploadResponse['file_type']
-            pushBody['file_url'] = uploadResponse['file_url']
+            pushBody['file_name'] = uploadRequest['file_name']
+            pushBody['file_type'] = uploadRequest['file_type']
+            pushBody['file_url'] = uploadRequest['file_url']
         
         # push the contents
-        response = requests.post('{}/pushes'.format(PushBulletFileServer.PUSHBULLET_API), headers=pushRequest['headers'], json=pushBody)
+        response = self.__request('POST', '{}/pushes'.format(PushBulletFileServer.PUSHBULLET_API), headers=pushRequest['headers'], json=pushBody)
         PushBulletFileServer.errIfBadResponse(response)
 
         # return good success
         return response.json()
 
-    def __pull(self, identifier: str) -> dict:
+    def _pull(self, identifier: str) -> dict:
         '''
         Returns the server contents for the given identifier.
     
@@ -275,7 +379,7 @@ class PushBulletFileServer():
         `file_name`: Only included if the type is a file
         '''
         # get the response from the request
-        response = requests.get('{}/pushes/{}'.format(PushBulletFileServer.PUSHBULLET_API, identifier), headers=self.__makeRequestHeader())
+        response = self.__request('GET', '{}/pushes/{}'.format(PushBulletFileServer.PUSHBULLET_API, identifier), headers=self.__makeRequestHeader())
         PushBulletFileServer.errIfBadResponse(response)
 
         res = response.json()
@@ -296,21 +400,49 @@ class PushBulletFileServer():
             # get the file content from the url
             ret['file_name'] = res['file_name']
 
-            response = requests.get(res['file_url'])
-
             # return content in binary
-            ret['content'] = response.content
+            ret['content'] = b''.join(self.__downloadFile(res['file_url']))
 
         return ret
 
-    def __delete(self, identifier):
+    def __downloadFile(self, fileURL: str):
+        '''
+        Yields the binary contents of the pushed file at the URL in blocks, as they are downloaded
+        Raises a PushBulletFileServerException if the download fails, also after some blocks were yielded
+        '''
+        response = self.__request('GET', fileURL, stream=True)
+        try:
+            # an error body must not be returned (or cached by the read cache) as the file contents
+            PushBulletFileServer.errIfBadResponse(response)
+            yield from response.iter_content(PushBulletFileServer.DOWNLOAD_BLOCK_SIZE)
+        except requests.exceptions.RequestException as e:
+            raise PushBulletFileServerException(f'Download interrupted: {e}')
+        finally:
+            response.close()
+
+    def _pullFileBlocks(self, identifier: str):
+        '''
+        Yields the binary contents of the pushed file with the given identifier in blocks, as they are downloaded
+        '''
+        response = self.__request('GET', '{}/pushes/{}'.format(PushBulletFileServer.PUSHBULLET_API, identifier), headers=self.__makeRequestHeader())
+        PushBulletFileServer.errIfBadResponse(response)
+
+        res = response.json()
+        if res['type'] != 'file':
+            raise exceptions.InvalidParameters(f'Push {identifier} is not a file')
+        yield from self.__downloadFile(res['file_url'])
+
+    def _delete(self, identifier):
         '''
         Deletes push with the given identifier
         '''
-        res = requests.delete( '{}/pushes/{}'.format(PushBulletFileServer.PUSHBULLET_API, identifier), headers = self.__makeRequestHeader())
+        res = self.__request('DELETE', '{}/pushes/{}'.format(PushBulletFileServer.PUSHBULLET_API, identifier), headers = self.__makeRequestHeader())
 
         PushBulletFileServer.errIfBadResponse(res)
 
+        if self.__readCache is not None:
+            self.__readCache.remove(identifier)
+
     def __check_path( path:str):
         if not path.startswith('/'):
             raise exceptions.InvalidServerAddress(path)
@@ -422,7 +554,7 @@ class PushBulletFileServer():
             body['modified_after'] = str(modifiedAfter)
 
         # make the request
-        response = requests.get('{}/pushes'.format(PushBulletFileServer.PUSHBULLET_API), headers = self.__makeRequestHeader(), params = body)
+        response = self.__request('GET', '{}/pushes'.format(PushBulletFileServer.PUSHBULLET_API), headers = self.__makeRequestHeader(), params = body)
 
         PushBulletFileServer.errIfBadResponse(response)
 
@@ -461,7 +593,7 @@ class PushBulletFileServer():
 
         # delete the pushes
         for p in pushes:
-            self.__delete(p['iden'])
+            self._delete(p['iden'])
 
         return len(pushes)
 
@@ -480,10 +612,38 @@ class PushBulletFileServer():
             'has_sms': False
         }
 
-        response = requests.post('{}/devices'.format(PushBulletFileServer.PUSHBULLET_API), headers=headers, json=body)
+        response = self.__request('POST', '{}/devices'.format(PushBulletFileServer.PUSHBULLET_API), headers=headers, json=body)
         PushBulletFileServer.errIfBadResponse(response)
 
-        return response.json()
+        device = response.json()
+        if self.__metadataCache is not None:
+            self.__metadataCache.updateDevices([device])
+        return device
+
+    def __fetchDevices(self, modifiedAfter:float=None) -> list[dict]:
+        params = {}
+        if modifiedAfter is not None:
+            params['modified_after'] = str(modifiedAfter)
+
+        response = self.__request('GET', '{}/devices'.format(PushBulletFileServer.PUSHBULLET_API), headers=self.__makeRequestHeader(), params=params)
+        PushBulletFileServer.errIfBadResponse(response)
+        return response.json()['devices']
+
+    def __listDevices(self, validate:bool=False) -> list[dict]:
+        '''
+        Returns the devices of the PushBullet account, from the metadata cache if there is one
+        An expired cache is validated by only requesting the devices modified since the latest cached one,
+        set `validate` to validate the cache even if it has not expired
+        '''
+        if self.__metadataCache is None:
+            return self.__fetchDevices()
+
+        if not self.__metadataCache.hasDevices():
+            self.__metadataCache.setDevices(self.__fetchDevices())
+        elif validate or self.__metadataCache.isExpired():
+            self.__metadataCache.updateDevices(self.__fetchDevices(modifiedAfter=self.__metadataCache.getLatestModified()))
+
+        return self.__metadataCache.getDevices()
 
     def getPBFSDevice(self, name:str=None, iden:str=None):
         '''
@@ -495,14 +655,11 @@ class PushBulletFileServer():
         if name is not None and iden is not None:
             raise exceptions.InvalidParameters('Undetermined device search query (both name and identifier are set)')
 
-        headers =  self.__makeRequestHeader()
+        return self.__findPBFSDevice(self.__listDevices(), name=name, iden=iden)
 
+    @staticmethod
+    def __findPBFSDevice(devices:list[dict], name:str=None, iden:str=None):
         # filter by name and iden if they exist
-        response = requests.get('{}/devices'.format(PushBulletFileServer.PUSHBULLET_API), headers=headers)
-        PushBulletFileServer.errIfBadResponse(response)
-
-        devices = response.json()['devices']
-
         applicable_devices = list(filter(
         lambda dev: (dev.get('manufacturer') == PushBulletFileServer.DEVICE_MANUFACTURER) and (name is None or dev.get('nickname') == name) and (iden is None or dev.get('iden') == iden), 
         devices))
@@ -523,9 +680,12 @@ class PushBulletFileServer():
 
         devIden = devInfo['iden']
 
-        response = requests.delete('{}/devices/{}'.format(PushBulletFileServer.PUSHBULLET_API, devIden), headers=self.__makeRequestHeader())
+        response = self.__request('DELETE', '{}/devices/{}'.format(PushBulletFileServer.PUSHBULLET_API, devIden), headers=self.__makeRequestHeader())
         PushBulletFileServer.errIfBadResponse(response)
 
+        if self.__metadataCache is not None:
+            self.__metadataCache.removeDevice(devIden)
+
     def pathExistsInIndex(self, path:str) -> bool:
         ''' Checks if the given path exists in the index'''
         # get the parent directory if it exists
@@ -553,6 +713,20 @@ class PushBulletFileServer():
         return 0
 
 
+    def listDir(self, dirPath:str) -> list[str]:
+        ''' Returns the names of the files and directories in the given directory, an empty list if the directory does not exist'''
+        # adding throwaway so that get parent directory returns the directory itself
+        directory = None
+        try:
+            directory = self.__getParentDir(dirPath + '/throwaway')
+        except exceptions.UnreachableServerAddress:
+            return []
+
+        if not isinstance(directory, dict):
+            return []
+
+        return list(directory.keys())
+
     def deleteFile(self, filePath: str) -> int:
         '''
         Deletes file from server at given path
@@ -564,11 +738,12 @@ class PushBulletFileServer():
         
         filename = filePath.split('/')[-1]
         parentDir = self.__getParentDir(filePath)
-        fileIden = parentDir[filename]
+        fileEntry = parentDir[filename]
 
-        # delete the file from the server
+        # delete the file (all of its chunks) from the server
         try:
-            self.__delete(fileIden)
+            for fileIden in PushBulletFileServer._entryIdens(fileEntry):
+                self._delete(fileIden)
         except PushBulletFileServerException as e:
             self.errorMsg = 'Failed to delete file: {}'.format(e)
             return 1
@@ -576,15 +751,15 @@ class PushBulletFileServer():
         # remove the file from the index
         parentDir.pop(filename)
 
-        if self.__persistentStorage:
-            self.uploadFileIndex()
+        self._indexChanged()
 
         return 0
 
     def write(self, destPath: str, fileBinary, deleteOldVersion=True) -> str:
         ''' 
         Takes absolute file path using Linux addressing, e.g /path/to/file where / is the top most directory.
-        `binary_contents` is the binary contents of the file to be uploaded
+        `binary_contents` is the binary contents of the file to be uploaded, or a binary file object which is read one chunk at a time
+        Files larger than the chunk size are pushed as several chunks, which `read` joins back together
         Set deleteOldVersion to false if you wish to keep previous versions of the uploaded file
         Returns the uploaded path if successful
         '''
@@ -593,60 +768,237 @@ class PushBulletFileServer():
         
         # upload the contents to the pushbullet server first, make sure that is completed
         filename = destPath.split('/')[-1]
-        svrResponse = None
 
         try:
-            svrResponse = self.__push(file=(filename, fileBinary))
+            fileEntry = self._pushChunks(filename, fileBinary)
         except PushBulletFileServerException as e:
             # if something went wrong, then exit with the error
             self.errorMsg = 'Error: '+str(e)
             return None
 
-        newFileIden = svrResponse['iden']
-
         # add the file path to the index, with the server file identifier
-        parentDir = self.__getParentDir(destPath, makeDirsOk=True)
+        oldFileEntry = self._setIndexEntry(destPath, fileEntry)
 
-        # checks if there is a current file in the memory
-        oldFileIden = parentDir.get(filename)
-
-        # if there is then delete the old file since we are overwriting it
-        if deleteOldVersion and oldFileIden is not None:
+        # if there is an old version then delete it since we are overwriting it
+        if deleteOldVersion and oldFileEntry is not None:
              # delete the file from the server
             try:
-                self.__delete(oldFileIden)
+                for oldFileIden in PushBulletFileServer._entryIdens(oldFileEntry):
+                    self._delete(oldFileIden)
             except PushBulletFileServerException as e:
                 self.errorMsg = 'Failed to delete file: {}'.format(e)
 
-        # save the new file by updating the file index
-        parentDir[filename] = newFileIden
-
-        if self.__persistentStorage:
-            self.uploadFileIndex()
+        self._indexChanged()
 
         return destPath
 
+    def _fitsSinglePush(self, fileBinary) -> bool:
+        '''
+        Returns true if the file contents are written as a single push, false for file objects and contents larger than a chunk
+        '''
+        return not hasattr(fileBinary, 'read') and len(fileBinary) <= self.__chunkSize
+
+    def __iterChunks(self, fileBinary):
+        # file objects are read one chunk at a time, so the whole file is never in memory
+        if hasattr(fileBinary, 'read'):
+            while True:
+                chunk = fileBinary.read(self.__chunkSize)
+                if not chunk:
+                    return
+                yield chunk
+
+        if isinstance(fileBinary, str):
+            fileBinary = fileBinary.encode('utf-8')
+
+        if len(fileBinary) <= self.__chunkSize:
+            yield fileBinary
+            return
+
+        view = memoryview(fileBinary)
+        for start in range(0, len(fileBinary), self.__chunkSize):
+            yield bytes(view[start:start + self.__chunkSize])
+
+    def _pushChunks(self, filename: str, fileBinary):
+        '''
+        Pushes the file contents, one push per chunk
+        Returns the index entry of the file: the push identifier, or the list of the chunk identifiers if there are several chunks
+        If a chunk cannot be pushed, the chunks already pushed are deleted and the exception is raised
+        '''
+        chunkIdens = []
+        try:
+            for chunk in self.__iterChunks(fileBinary):
+                # the first chunk keeps the file name, so a file of a single chunk is pushed as before
+                chunkName = filename if len(chunkIdens) == 0 else f'{filename}.part{len(chunkIdens)}'
+                chunkIdens.append(self.__push(file=(chunkName, chunk))['iden'])
+        except PushBulletFileServerException:
+            for iden in chunkIdens:
+                try:
+                    self._delete(iden)
+                except PushBulletFileServerException:
+                    pass
+            raise
+
+        if len(chunkIdens) == 0:
+            # empty file object
+            chunkIdens.append(self.__push(file=(filename, b''))['iden'])
+
+        return chunkIdens[0] if len(chunkIdens) == 1 else chunkIdens
+
+    @staticmethod
+    def _entryIdens(fileEntry) -> list[str]:
+        # a file is a single push identifier, or a list of identifiers if it was written in chunks
+        return list(fileEntry) if isinstance(fileEntry, list) else [fileEntry]
+
+    def isChunked(self, filePath: str) -> bool:
+        '''
+        Returns true if the file was written as several chunks
+        '''
+        if not self.pathExistsInIndex(filePath):
+            return False
+        return isinstance(self.__getParentDir(filePath)[filePath.split('/')[-1]], list)
+
+    def _setIndexEntry(self, destPath: str, fileIden) -> str:
+        '''
+        Points the path in the file index to the pushed file with the given identifier (or list of chunk identifiers),
+        making its directories if needed
+        Returns the index entry of the file previously at the path, None if there was none
+        '''
+        destPath = PushBulletFileServer.__sanitize_path(destPath)
+        filename = destPath.split('/')[-1]
+        parentDir = self.__getParentDir(destPath, makeDirsOk=True)
+
+        oldFileIden = parentDir.get(filename)
+        parentDir[filename] = fileIden
+        return oldFileIden
+
+    def isPersistent(self) -> bool:
+        return self.__persistentStorage
+
+    @contextmanager
+    def batch(self):
+        '''
+        Defers the index uploads of the file operations made in the block, the index is uploaded once when the block exits,
+        so writing or deleting N files costs a single index upload instead of N
+        Batches can be nested, the index is uploaded when the outermost one exits (also if it exits with an exception,
+        since the files written in it were already pushed)
+        Only the file operations of the thread which opened the batch are deferred
+        '''
+        state = self.__batchState
+        if getattr(state, 'depth', 0) == 0:
+            state.depth = 0
+            state.changedIndex = False
+
+        state.depth += 1
+        try:
+            yield self
+        finally:
+            state.depth -= 1
+            if state.depth == 0 and state.changedIndex:
+                state.changedIndex = False
+                self.uploadFileIndex()
+
+    def _isBatching(self) -> bool:
+        '''
+        Returns true if the calling thread has a batch open
+        '''
+        return getattr(self.__batchState, 'depth', 0) > 0
+
+    def _indexChanged(self):
+        '''
+        Called after a file operation changed the index, uploads it if the storage is persistent
+        The upload is deferred to the end of the batch of the calling thread if it has one
+        '''
+        if not self.__persistentStorage:
+            return
+
+        if self._isBatching():
+            self.__batchState.changedIndex = True
+            return
+        self.uploadFileIndex()
+
+    def getFileIden(self, filePath: str) -> str:
+        '''
+        Returns the identifier of the push holding the file in the index, None if the file does not exist
+        The identifier changes every time the file is written, so it identifies the version of the file
+        '''
+        if not self.pathExistsInIndex(filePath):
+            return None
+        fileEntry = self.__getParentDir(filePath)[filePath.split('/')[-1]]
+        return ','.join(PushBulletFileServer._entryIdens(fileEntry))
+
+    def refreshIndex(self) -> bool:
+        '''
+        Replaces the file index with the one uploaded to the server, if another client uploaded a newer one
+        The server device is always checked (only the devices modified since the last check are requested when there is a
+        metadata cache), and the new index is only downloaded if the device points to another one
+        Returns true if the index changed
+        '''
+        with self.__indexUploadLock:
+            retrievedIndex, iden = self.__getIndexFromServer(validateDevices=True)
+            if retrievedIndex is None or iden == self.__indexIden:
+                return False
+
+            self.__index = retrievedIndex
+            self.__indexIden = iden
+            return True
+
     def read(self, file_path:str):
         ''' 
         Returns binary contents of file posted to server
         '''
+        chunks = []
+        for chunk in self.readChunks(file_path):
+            if chunk is None:
+                return None
+            chunks.append(chunk)
+
+        return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+    def readChunks(self, file_path:str):
+        '''
+        Yields the binary contents of the file in blocks as they are downloaded, so a large file can be streamed without
+        holding all of it, or even a whole chunk of it
+        Yields None (and stops) if the file does not exist or a chunk could not be pulled, with the error in `errorMsg`.
+        Blocks of the file may have been yielded before it
+        '''
         # get the file identifier
         if not self.pathExistsInIndex( file_path ):
             self.errorMsg = 'File does not exist!'
-            return None
+            yield None
+            return
         
         filename = file_path.split('/')[-1]
-        file_identifier = self.__getParentDir(file_path)[filename]
+        fileEntry = self.__getParentDir(file_path)[filename]
 
-        # retrieve the file contents from the pushbullet server
-        ret = None
+        # retrieve the file contents from the read cache, or the pushbullet server
         try:
-            ret = self.__pull(file_identifier)
+            for file_identifier in PushBulletFileServer._entryIdens(fileEntry):
+                yield from self.__pullFileContents(file_identifier)
         except PushBulletFileServerException as e:
             self.errorMsg = str(e)
-            return None
+            yield None
 
-        return ret['content']
+    def __pullFileContents(self, identifier: str):
+        '''
+        Yields the contents of the pushed file in blocks, from the read cache if it has them
+        '''
+        if self.__readCache is not None:
+            contents = self.__readCache.get(identifier)
+            if contents is not None:
+                yield contents
+                return
+
+        # raises if the push or its file could not be downloaded, the read cache only keeps fully downloaded files
+        blocks = self._pullFileBlocks(identifier)
+        if self.__readCache is not None:
+            blocks = self.__readCache.putBlocks(identifier, blocks)
+        yield from blocks
+
+    def readMany(self, filePaths: list[str]) -> list:
+        '''
+        Returns the binary contents of each of the files, None for a file which could not be read
+        '''
+        return [self.read(path) for path in filePaths]
 
     def uploadFileIndex(self):
         '''
@@ -654,21 +1006,58 @@ class PushBulletFileServer():
         (Makes the server now act like actual storage instead of RAM)
         Also deletes an older version if it exists
         '''
-        # Push the current version of the index and get the identifier
-        resp = self.__push(file=(PushBulletFileServer.__INDEX_FILE_NAME, json.dumps(self.__index).encode()))
-        newIden = resp['iden']
+        self._uploadIndex(self._makeIndexFile())
 
+    def _makeIndexFile(self) -> tuple[int, bytes]:
+        '''
+        Returns a snapshot of the file index to upload with `_uploadIndex`, with its version
+        '''
+        self.__indexSnapshotVersion += 1
+        return self.__indexSnapshotVersion, json.dumps(self.__index).encode()
 
-        # Store the identifier in the model of the server (JANK AF)
-        updatedDevice = {
-            'model': f'{PushBulletFileServer.__MODEL_INDEX_TAG}:{newIden}'
-        }
-        requests.post(f'{PushBulletFileServer.PUSHBULLET_API}/devices/{self.__serverIden}', headers=self.__makeRequestHeader(), json=updatedDevice)
-        
-        if self.__indexIden is not None:
-            self.__delete(self.__indexIden)
+    def _uploadIndex(self, indexFile: tuple[int, bytes], uploadRequest: dict = None):
+        '''
+        Pushes the index snapshot made with `_makeIndexFile`, points the server device to it and deletes the previous index
+        The snapshot is not uploaded if a newer one already was, since the newer one includes all its changes
+        - `uploadRequest` is an upload request for the index file, if it was requested beforehand with `_requestUpload`
+        '''
+        version, contents = indexFile
+
+        with self.__indexUploadLock:
+            if version <= self.__uploadedIndexVersion:
+                return
+
+            # Push the current version of the index and get the identifier
+            if uploadRequest is None:
+                uploadRequest = self._requestUpload(PushBulletFileServer.__INDEX_FILE_NAME)
+            self._uploadFile(uploadRequest, contents)
+            newIden = self._pushUploadedFile(uploadRequest)['iden']
+
+            # Store the identifier in the model of the server (JANK AF)
+            updatedDevice = {
+                'model': f'{PushBulletFileServer.__MODEL_INDEX_TAG}:{newIden}'
+            }
+            response = self.__request('POST', f'{PushBulletFileServer.PUSHBULLET_API}/devices/{self.__serverIden}', headers=self.__makeRequestHeader(), json=updatedDevice)
+
+            # the cache now points to the uploaded index, so the next start does not have to download it
+            if self.__metadataCache is not None and PushBulletFileServer.successfulHTTPResponse(response):
+                self.__metadataCache.updateDevices([response.json()])
+                self.__metadataCache.setIndex(newIden, json.loads(contents.decode('utf-8')))
+
+            oldIndexIden = self.__indexIden
             self.__indexIden = newIden
-        
+            self.__uploadedIndexVersion = version
+
+        if oldIndexIden is not None:
+            self._delete(oldIndexIden)
+
+    @staticmethod
+    def sanitizePath(path: str) -> str:
+        return PushBulletFileServer.__sanitize_path(path)
+
+    @staticmethod
+    def getIndexFileName() -> str:
+        return PushBulletFileServer.__INDEX_FILE_NAME
 
     def resetIndex(self):
         '''
@@ -682,16 +1071,24 @@ class PushBulletFileServer():
         Uploads file at `local_path` on local device to `server_path` on server
         '''
         with open(local_path, 'rb') as file:
-            return self.write(server_path, file.read())
+            # the file object is read one chunk at a time
+            return self.write(server_path, file)
 
     def readTo(self, server_path, local_path):
         '''
         Downloads file at `server_path` on server to `local_path` on local device
+        Raises a PushBulletFileServerException if the file could not be read, without leaving a partial file at `local_path`
         '''
-        with open(local_path, 'wb') as file:
-            content = self.read(server_path)
-            if content is not None:
-                file.write(content)
+        try:
+            with open(local_path, 'wb') as file:
+                for chunk in self.readChunks(server_path):
+                    if chunk is None:
+                        raise PushBulletFileServerException(f'Could not read "{server_path}": {self.errorMsg}')
+                    file.write(chunk)
+        except BaseException:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+            raise
 
 
     def getFileIndex(self):
@@ -0,0 +1,45 @@
+import contextlib
+import hashlib
+
+
+class ThumbnailFileStorageInterface:
+    def __init__(self):
+        '''
+        Ancestor class for the content-addressed blob stores used to keep meme thumbnails out of the JSON DB
+        Thumbnails are identified by the hash of their bytes, so a stored thumbnail never changes
+        '''
+        pass
+
+    @staticmethod
+    def makeThumbnailID(thumbnailBytes:bytes) -> str:
+        return hashlib.sha256(thumbnailBytes).hexdigest()
+
+    def writeThumbnail(self, thumbnailBytes:bytes) -> str:
+        """
+        Stores the thumbnail bytes, returning the thumbnail ID they can be read with
+        Returns None if the operation failed
+        """
+        raise Exception('Must be implemented in subclass')
+
+    def readThumbnail(self, thumbnailID:str) -> bytes:
+        """
+        Returns the bytes of the thumbnail with the given ID, None if it does not exist
+        """
+        raise Exception('Must be implemented in subclass')
+
+    def hasThumbnail(self, thumbnailID:str) -> bool:
+        raise Exception('Must be implemented in subclass')
+
+    def deleteThumbnail(self, thumbnailID:str) -> bool:
+        """
+        Deletes the thumbnail, the caller must check that no meme uses it since memes with the same thumbnail share its ID
+        Returns true if the thumbnail no longer exists
+        """
+        raise Exception('Must be implemented in subclass')
+
+    def batch(self):
+        """
+        Returns a context manager grouping the thumbnail writes made in it, so the storage can persist them together
+        By default the writes are not grouped
+        """
+        return contextlib.nullcontext()
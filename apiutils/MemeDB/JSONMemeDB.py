@@ -1,11 +1,25 @@
+import base64
+import bisect
+import contextlib
+import copy
+import hashlib
+import json
+import threading
+import uuid
+
+from apiutils.MemeDB.JSONMemeDBLog import JSONMemeDBLog
+from apiutils.ReadWriteLock import ReadWriteLock
 from apiutils.MemeManagement.MemeDBInterface import MemeDBInterface, MemeDBException
 from apiutils.FileStorage.JSONDBFileStorageInterface import JSONDBFileStorageInterface
+from apiutils.FileStorage.ThumbnailFileStorageInterface import ThumbnailFileStorageInterface
 from apiutils.MemeManagement.MemeContainer import MemeContainer
 from apiutils.MemeManagement.MemeMediaType import stringToMemeMediaType
 
 
 class JSONMemeDB(MemeDBInterface):
     instance = None
+    # Number of persisted log entries after which the log is compacted into a full snapshot
+    LOG_COMPACTION_THRESHOLD = 50
     class DBFields:
         NextID = "nextID"
         Items = "items"
@@ -16,13 +30,41 @@ class JSONMemeDB(MemeDBInterface):
             FileExt = "fileExt"
             Tags = "tags"
             Thumbnail = "thumbnail"
+            ThumbnailID = "thumbnailID"
+            ThumbnailVariants = "thumbnailVariants"
             MediaID = "mediaID"
             MediaURL = "mediaURL"
 
-    def __init__(self, fileStorage:JSONDBFileStorageInterface):
+    def __init__(self, fileStorage:JSONDBFileStorageInterface, thumbnailStorage:ThumbnailFileStorageInterface=None):
+        """
+        If a thumbnail storage is given, thumbnails are kept in it and the database only stores their thumbnail IDs
+        Otherwise, thumbnails are stored inline in the database as base64 strings
+        """
         self.db = None
-        self.__dbLock = False
+        # Readers of the database share the lock, changes to the database take it exclusively
+        self.__dbLock = ReadWriteLock()
         self.fileStorage = fileStorage
+        self.thumbnailStorage = thumbnailStorage
+        self.__log = JSONMemeDBLog()
+        # Serializes writes of the log and snapshots to the file storage, so log entries are persisted in order
+        self.__logWriteLock = threading.Lock()
+        self.__compactionThread = None
+        # Set when the database is replaced as a whole, the next write must then be a full snapshot
+        self.__needsSnapshot = False
+        # Hash of the database contents, only computed when requested for a database that was not loaded from a revision
+        self.__revision = None
+        # Number of changes made to the database in memory, the revision is derived from it and the stored revision
+        self.__changeCount = 0
+        # Identifies this instance in the revisions of unwritten changes, so they never match a stored revision
+        self.__instanceToken = uuid.uuid4().hex
+        # IDs of the items in ascending order, so memes are browsed in a stable order and a page is a slice of it
+        self.__sortedIDs = []
+        # Revision of the file storage the database was loaded from or last written to, loading the same revision is skipped
+        self.__storedRevision = None
+        # Change count the stored revision includes
+        self.__storedChangeCount = 0
+        # Called after the log is compacted into a snapshot
+        self.__compactionCallback = None
 
     @staticmethod
     def getSingleton():
@@ -31,19 +73,8 @@ class JSONMemeDB(MemeDBInterface):
         return JSONMemeDB.instance
 
     @staticmethod
-    def initSingleton(fileStorage:JSONDBFileStorageInterface):
-        JSONMemeDB.instance = JSONMemeDB(fileStorage)
-
-    def __isDBLocked(self):
-        return self.__dbLock
-
-    def __getDBLock(self):
-        while self.__isDBLocked():
-            pass
-        self.__dbLock = True
-
-    def __releaseDBLock(self):
-        self.__dbLock = False
+    def initSingleton(fileStorage:JSONDBFileStorageInterface, thumbnailStorage:ThumbnailFileStorageInterface=None):
+        JSONMemeDB.instance = JSONMemeDB(fileStorage, thumbnailStorage=thumbnailStorage)
 
     def __errIfUnloadedDB(self):
         if not self.isDBLoaded():
@@ -51,15 +82,32 @@ class JSONMemeDB(MemeDBInterface):
 
     def __getJSONItem(self, itemId, lockDB=True):
         self.__errIfUnloadedDB()
-        if lockDB:
-            self.__getDBLock()
-        it = self.db.get(JSONMemeDB.DBFields.Items).get(str(itemId))
+        if not lockDB:
+            return self.db.get(JSONMemeDB.DBFields.Items).get(str(itemId))
 
-        if lockDB:
-            self.__releaseDBLock()
-        return it
+        with self.__dbLock.readLocked():
+            return self.db.get(JSONMemeDB.DBFields.Items).get(str(itemId))
+
+    def __loadThumbnail(self, thumbnailID:str) -> bytes:
+        return self.thumbnailStorage.readThumbnail(thumbnailID)
 
     def __createMemeFromJSONItem(self, jsonItem):
+        thumbnailID = jsonItem.get(JSONMemeDB.DBFields.ItemFields.ThumbnailID)
+        if thumbnailID is not None and self.thumbnailStorage is not None:
+            # Thumbnail is loaded from the storage only when it is requested
+            return MemeContainer(
+                id=jsonItem[JSONMemeDB.DBFields.ItemFields.ID],
+                name=jsonItem[JSONMemeDB.DBFields.ItemFields.Name],
+                mediaTypeStr=jsonItem[JSONMemeDB.DBFields.ItemFields.MediaType],
+                tags=jsonItem[JSONMemeDB.DBFields.ItemFields.Tags],
+                fileExt=jsonItem[JSONMemeDB.DBFields.ItemFields.FileExt],
+                mediaID=jsonItem[JSONMemeDB.DBFields.ItemFields.MediaID],
+                mediaURL=jsonItem[JSONMemeDB.DBFields.ItemFields.MediaURL],
+                thumbnailID=thumbnailID,
+                thumbnailLoader=self.__loadThumbnail,
+                thumbnailVariantIDs=jsonItem.get(JSONMemeDB.DBFields.ItemFields.ThumbnailVariants)
+            )
+
         return MemeContainer(
             id=jsonItem[JSONMemeDB.DBFields.ItemFields.ID],
             name=jsonItem[JSONMemeDB.DBFields.ItemFields.Name],
@@ -68,15 +116,57 @@ class JSONMemeDB(MemeDBInterface):
             fileExt=jsonItem[JSONMemeDB.DBFields.ItemFields.FileExt],
             mediaID=jsonItem[JSONMemeDB.DBFields.ItemFields.MediaID],
             mediaURL=jsonItem[JSONMemeDB.DBFields.ItemFields.MediaURL],
-            thumbnail=jsonItem[JSONMemeDB.DBFields.ItemFields.Thumbnail]
+            thumbnail=jsonItem.get(JSONMemeDB.DBFields.ItemFields.Thumbnail)
             )
 
+    def __makeThumbnailFields(self, meme:MemeContainer) -> dict:
+        """
+        Returns the item fields to store for the thumbnail of the meme, writing it to the thumbnail storage if one is used
+        New thumbnail variants are only written with a thumbnail storage
+        Returns an empty dictionary if the meme has no thumbnail set
+        """
+        thumbnail = meme.getThumbnail(lazyLoad=False)
+        if self.thumbnailStorage is None:
+            if thumbnail is None:
+                return {}
+            return {JSONMemeDB.DBFields.ItemFields.Thumbnail: thumbnail}
+
+        if thumbnail is None:
+            thumbnailID = meme.getThumbnailID()
+
+        elif thumbnail == '':
+            thumbnailID = None
+
+        else:
+            thumbnailID = self.thumbnailStorage.writeThumbnail(base64.b64decode(thumbnail))
+            if thumbnailID is None:
+                raise MemeDBException('Could not write the thumbnail to the thumbnail storage')
+
+        fields = {}
+        if thumbnail is not None or thumbnailID is not None:
+            fields[JSONMemeDB.DBFields.ItemFields.Thumbnail] = ''
+            fields[JSONMemeDB.DBFields.ItemFields.ThumbnailID] = thumbnailID
+
+        variants = meme.getThumbnailVariants()
+        if variants is not None:
+            variantIDs = {}
+            for key, variantBytes in variants.items():
+                variantIDs[key] = self.thumbnailStorage.writeThumbnail(variantBytes)
+                if variantIDs[key] is None:
+                    raise MemeDBException(f'Could not write the {key} thumbnail variant to the thumbnail storage')
+            fields[JSONMemeDB.DBFields.ItemFields.ThumbnailVariants] = variantIDs
+        return fields
+
     def genNewID(self, lockdb=True) -> int:
         self.__errIfUnloadedDB()
+        if not lockdb:
+            return self.__takeNextID()
 
-        if lockdb:
-            self.__getDBLock()
+        with self.__dbLock.writeLocked():
+            return self.__takeNextID()
 
+    def __takeNextID(self) -> int:
+        # Must be called with the DB write lock held
         newId = self.db[JSONMemeDB.DBFields.NextID]
         while str(newId) in self.db[JSONMemeDB.DBFields.Items]:
             # If the id already exists, just skip it
@@ -84,80 +174,120 @@ class JSONMemeDB(MemeDBInterface):
 
         # Increment it
         self.db[JSONMemeDB.DBFields.NextID] = newId + 1
-
-        if lockdb:
-            self.__releaseDBLock()
-
+        self.__markChanged()
         return newId
 
     def __addItemToDB(self, meme:MemeContainer):
         self.__errIfUnloadedDB()
-        self.__getDBLock()
-        itemId = str(self.genNewID(lockdb=False))
-
-        self.db[JSONMemeDB.DBFields.Items][itemId] = {
-            JSONMemeDB.DBFields.ItemFields.ID           : int(itemId),
+        # The thumbnail and the fields of the meme are read before taking the lock, since they may upload the thumbnail
+        # or download the media (see MemeContainer.getMediaID)
+        thumbnailFields = self.__makeThumbnailFields(meme)
+        fields = {
             JSONMemeDB.DBFields.ItemFields.Name         : meme.getName(),
             JSONMemeDB.DBFields.ItemFields.MediaType    : meme.getMediaTypeString(),
             JSONMemeDB.DBFields.ItemFields.FileExt      : meme.getFileExt(),
             JSONMemeDB.DBFields.ItemFields.Tags         : meme.getTags(),
             JSONMemeDB.DBFields.ItemFields.MediaID      : meme.getMediaID(),
             JSONMemeDB.DBFields.ItemFields.MediaURL     : meme.getMediaURL(),
-            JSONMemeDB.DBFields.ItemFields.Thumbnail    : meme.getThumbnail(),
         }
 
-        self.__releaseDBLock()
+        with self.__dbLock.writeLocked():
+            itemId = str(self.__takeNextID())
+            item = {JSONMemeDB.DBFields.ItemFields.ID: int(itemId)}
+            item.update(fields)
+            item.update(thumbnailFields)
+            self.db[JSONMemeDB.DBFields.Items][itemId] = item
+            # new IDs are usually the largest, so this is mostly an append
+            bisect.insort(self.__sortedIDs, int(itemId))
+            self.__markChanged()
+            self.__log.record(JSONMemeDBLog.makeInsertEntry(itemId, item, self.db[JSONMemeDB.DBFields.NextID]))
         return itemId
 
     def __updateItemProperty(self, itemId:int, meme:MemeContainer) -> bool:
         self.__errIfUnloadedDB()
-        self.__getDBLock()
-        item = self.__getJSONItem(itemId, lockDB=False)
-
-        if item is None:
-            self.__releaseDBLock()
-            return False
-
+        # Read before taking the lock, since they may upload the thumbnail or download the media
+        thumbnailFields = self.__makeThumbnailFields(meme)
         name = meme.getName()
         tags = meme.getTags()
         fileExt = meme.getFileExt()
         mediaID = meme.getMediaID()
         mediaURL = meme.getMediaURL()
         mediaType = meme.getMediaTypeString()
-        thumbnail = meme.getThumbnail()
 
+        changed = {}
         if name is not None:
-            item[JSONMemeDB.DBFields.ItemFields.Name] = name
+            changed[JSONMemeDB.DBFields.ItemFields.Name] = name
         if tags is not None:
-            item[JSONMemeDB.DBFields.ItemFields.Tags] = tags
+            changed[JSONMemeDB.DBFields.ItemFields.Tags] = tags
         if fileExt is not None:
-            item[JSONMemeDB.DBFields.ItemFields.FileExt] = fileExt
+            changed[JSONMemeDB.DBFields.ItemFields.FileExt] = fileExt
         if mediaID is not None:
-            item[JSONMemeDB.DBFields.ItemFields.MediaID] = mediaID
+            changed[JSONMemeDB.DBFields.ItemFields.MediaID] = mediaID
         if mediaURL is not None:
-            item[JSONMemeDB.DBFields.ItemFields.MediaURL] = mediaURL
+            changed[JSONMemeDB.DBFields.ItemFields.MediaURL] = mediaURL
         if mediaType is not None:
-            item[JSONMemeDB.DBFields.ItemFields.MediaType] = mediaType
-        if thumbnail is not None:
-            item[JSONMemeDB.DBFields.ItemFields.Thumbnail] = thumbnail
-
-        self.__releaseDBLock()
-
+            changed[JSONMemeDB.DBFields.ItemFields.MediaType] = mediaType
+        changed.update(thumbnailFields)
+
+        with self.__dbLock.writeLocked():
+            item = self.__getJSONItem(itemId, lockDB=False)
+            if item is None:
+                return False
+
+            item.update(changed)
+            if len(changed) > 0:
+                self.__markChanged()
+                self.__log.record(JSONMemeDBLog.makeUpdateEntry(itemId, changed))
         return True
 
+    def __markChanged(self):
+        # Must be called with the DB write lock held
+        self.__revision = None
+        self.__changeCount += 1
+
     def initDB(self) -> None:
-        self.__getDBLock()
-        self.db = {
-            JSONMemeDB.DBFields.NextID: 0,
-            JSONMemeDB.DBFields.Items: {}
-        }
-        self.__releaseDBLock()
+        with self.__dbLock.writeLocked():
+            self.db = {
+                JSONMemeDB.DBFields.NextID: 0,
+                JSONMemeDB.DBFields.Items: {}
+            }
+            self.__log.clearPending()
+            self.__needsSnapshot = True
+            self.__markChanged()
+            self.__sortedIDs = []
+            self.__storedRevision = None
+
+    def __usesLog(self) -> bool:
+        return self.fileStorage.supportsJSONDBLog()
 
     def loadDB(self) -> bool:
-        self.__getDBLock()
-        self.db = self.fileStorage.getJSONDB()
-        res = self.db is not None
-        self.__releaseDBLock()
+        """
+        Loads the database and replays its log from the file storage
+        If the database is already loaded from the revision in the file storage and has no unwritten changes,
+        it is not downloaded again
+        """
+        # Storage calls can raise, so the lock is released with the context manager
+        with self.__dbLock.writeLocked():
+            # The revision is taken before the download, so a write made during it is loaded the next time
+            storedRevision = self.fileStorage.getJSONDBRevision()
+            if self.db is not None and storedRevision is not None and storedRevision == self.__storedRevision \
+                    and self.__changeCount == self.__storedChangeCount:
+                return True
+
+            self.db = self.fileStorage.getJSONDB()
+            res = self.db is not None
+
+            # Replay the mutations made since the last snapshot
+            entries = self.fileStorage.getJSONDBLog() if res and self.__usesLog() else []
+            for entry in entries:
+                JSONMemeDBLog.applyEntry(self.db, entry, JSONMemeDB.DBFields.Items, JSONMemeDB.DBFields.NextID)
+
+            self.__log.reset(persistedCount=len(entries))
+            self.__needsSnapshot = False
+            self.__revision = None
+            self.__sortedIDs = sorted(int(itemId) for itemId in self.db[JSONMemeDB.DBFields.Items]) if res else []
+            self.__storedRevision = storedRevision if res else None
+            self.__storedChangeCount = self.__changeCount
         return res
 
     def isDBLoaded(self) -> bool:
@@ -168,16 +298,179 @@ class JSONMemeDB(MemeDBInterface):
             return True
 
         # removes all the keys in the dict
-        self.db.clear()
-        self.db = None
+        with self.__dbLock.writeLocked():
+            self.db.clear()
+            self.db = None
+            self.__revision = None
+            self.__sortedIDs = []
+            self.__storedRevision = None
         return True
 
+    def supportsThumbnailVariants(self) -> bool:
+        """
+        Variants are only kept in the thumbnail storage, they would make the JSON file several times larger
+        """
+        return self.thumbnailStorage is not None
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Groups the thumbnail writes and database writes made in the context, see the batch of the file storages
+        """
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(self.fileStorage.batch())
+            if self.thumbnailStorage is not None:
+                stack.enter_context(self.thumbnailStorage.batch())
+            yield
+
     def writeDB(self) -> bool:
+        """
+        Persists the changes made to the database
+        If the file storage supports it, only the mutations made since the last write are appended to the DB log,
+        the log is compacted into a full snapshot in the background once it grows past LOG_COMPACTION_THRESHOLD entries
+        """
         self.__errIfUnloadedDB()
-        self.__getDBLock()
-        res =  self.fileStorage.writeJSONDB(self.db)
-        self.__releaseDBLock()
-        return res
+        if not self.__usesLog() or self.__needsSnapshot:
+            return self.compactDB()
+
+        with self.__logWriteLock:
+            with self.__dbLock.writeLocked():
+                entries = self.__log.takePending()
+                changeCount = self.__changeCount
+
+            if len(entries) > 0:
+                # the entries are restored if the append fails or raises, so they are appended the next time
+                appended = False
+                try:
+                    appended = self.fileStorage.appendJSONDBLog(entries)
+                finally:
+                    if not appended:
+                        with self.__dbLock.writeLocked():
+                            self.__log.restorePending(entries)
+                if not appended:
+                    return False
+                self.__log.markPersisted(len(entries))
+                self.__updateStoredRevision(changeCount)
+
+            needsCompaction = self.__log.getPersistedCount() >= JSONMemeDB.LOG_COMPACTION_THRESHOLD
+
+        if needsCompaction:
+            self.compactDBInBackground()
+        return True
+
+    def deleteUnusedThumbnails(self, thumbnailIDs:list[str]) -> int:
+        """
+        The memes using each thumbnail are not counted, so every item is checked, which is meant for batch jobs
+        """
+        self.__errIfUnloadedDB()
+        if self.thumbnailStorage is None:
+            return 0
+
+        unused = set(thumbnailID for thumbnailID in thumbnailIDs if thumbnailID)
+        with self.__dbLock.readLocked():
+            for item in self.db[JSONMemeDB.DBFields.Items].values():
+                unused.discard(item.get(JSONMemeDB.DBFields.ItemFields.ThumbnailID))
+                unused.difference_update((item.get(JSONMemeDB.DBFields.ItemFields.ThumbnailVariants) or {}).values())
+
+        # deleted outside the lock since the storage may do network I/O
+        return sum(1 for thumbnailID in unused if self.thumbnailStorage.deleteThumbnail(thumbnailID))
+
+    def getRevision(self) -> str:
+        """
+        Returns the revision of the file storage while the database has no unwritten changes, so it is the same across
+        processes loading it. Unwritten changes give a revision unique to this instance
+        The SHA-256 hex digest of the contents is only computed if the file storage has no revisions
+        """
+        self.__errIfUnloadedDB()
+        with self.__dbLock.readLocked():
+            if self.__storedRevision is None:
+                if self.__revision is None:
+                    self.__revision = hashlib.sha256(json.dumps(self.db, sort_keys=True).encode()).hexdigest()
+                return self.__revision
+            if self.__changeCount == self.__storedChangeCount:
+                return self.__storedRevision
+            return f"{self.__storedRevision}+{self.__instanceToken}:{self.__changeCount}"
+
+    def setCompactionCallback(self, callback) -> None:
+        """
+        Sets a function called with the revision of the snapshot after the log is compacted into it, or None to remove it
+        """
+        self.__compactionCallback = callback
+
+    def getDBSnapshot(self) -> dict:
+        """
+        Returns a deep copy of the JSON database, including any changes that have not been written
+        """
+        self.__errIfUnloadedDB()
+        with self.__dbLock.readLocked():
+            return copy.deepcopy(self.db)
+
+    def compactDB(self) -> bool:
+        """
+        Writes the whole database as a snapshot to the file storage and removes the log entries it includes
+        Returns true if the operation was completed successfully
+        """
+        self.__errIfUnloadedDB()
+        if not self.__usesLog():
+            with self.__dbLock.readLocked():
+                changeCount = self.__changeCount
+                res = self.fileStorage.writeJSONDB(self.db)
+            if res:
+                self.__updateStoredRevision(changeCount)
+            return res
+
+        with self.__logWriteLock:
+            # The snapshot includes pending entries, which no longer need to be appended to the log
+            with self.__dbLock.writeLocked():
+                snapshot = copy.deepcopy(self.db)
+                includedEntries = self.__log.takePending()
+                changeCount = self.__changeCount
+                replacesLog = self.__needsSnapshot
+                self.__needsSnapshot = False
+
+            compactedCount = self.__log.getPersistedCount()
+            # The snapshot and the removal of the log entries it includes are persisted together
+            with self.fileStorage.batch():
+                # the pending entries are restored if the write fails or raises, so they are written the next time
+                written = False
+                try:
+                    written = self.fileStorage.writeJSONDB(snapshot)
+                finally:
+                    if not written:
+                        with self.__dbLock.writeLocked():
+                            self.__log.restorePending(includedEntries)
+                            self.__needsSnapshot = self.__needsSnapshot or replacesLog
+                if not written:
+                    return False
+
+                if not self.fileStorage.truncateJSONDBLog(None if replacesLog else compactedCount):
+                    return False
+            self.__log.markCompacted(compactedCount)
+            self.__updateStoredRevision(changeCount)
+
+        callback = self.__compactionCallback
+        if callback is not None:
+            with self.__dbLock.readLocked():
+                compactedRevision = self.__storedRevision
+            callback(compactedRevision)
+        return True
+
+    def __updateStoredRevision(self, changeCount:int):
+        # The stored database now matches the database in memory up to changeCount (changes made since the write are
+        # still pending), so reloading it can be skipped. Changes by other clients are found when loading refreshes the revision
+        storedRevision = self.fileStorage.getJSONDBRevision(refresh=False)
+        with self.__dbLock.writeLocked():
+            self.__storedRevision = storedRevision
+            self.__storedChangeCount = changeCount
+
+    def compactDBInBackground(self):
+        """
+        Starts compacting the database log in a background thread, if a compaction is not already running
+        """
+        if self.__compactionThread is not None and self.__compactionThread.is_alive():
+            return
+        self.__compactionThread = threading.Thread(target=self.compactDB, daemon=True)
+        self.__compactionThread.start()
 
     def hasMeme(self, memeID:int) -> bool:
         self.__errIfUnloadedDB()
@@ -186,6 +479,14 @@ class JSONMemeDB(MemeDBInterface):
     def getMeme(self, itemID:int) -> MemeContainer:
         return self.__createMemeFromJSONItem(self.__getJSONItem(itemID))
 
+    def getMemes(self, itemIDs:list[int]) -> list[MemeContainer]:
+        self.__errIfUnloadedDB()
+        with self.__dbLock.readLocked():
+            items = self.db[JSONMemeDB.DBFields.Items]
+            jsonItems = [items.get(str(itemId)) for itemId in itemIDs]
+
+        return [None if it is None else self.__createMemeFromJSONItem(it) for it in jsonItems]
+
     def createMeme(self) -> int:
         itId = self.__addItemToDB(MemeContainer.makeEmptyMeme())
         return int(itId)
@@ -207,25 +508,54 @@ class JSONMemeDB(MemeDBInterface):
         """
         return self.__updateItemProperty(itemId, item)
 
+    def moveThumbnailsToStorage(self) -> int:
+        """
+        Moves the thumbnails stored inline in the database into the thumbnail storage
+        Write the database afterwards to persist the change
+        Returns the number of thumbnails moved
+        """
+        self.__errIfUnloadedDB()
+        if self.thumbnailStorage is None:
+            raise MemeDBException('No thumbnail storage configured for the database')
+
+        with self.__dbLock.readLocked():
+            inlineThumbnails = [
+                (item[JSONMemeDB.DBFields.ItemFields.ID], item[JSONMemeDB.DBFields.ItemFields.Thumbnail])
+                for item in self.db[JSONMemeDB.DBFields.Items].values()
+                if item.get(JSONMemeDB.DBFields.ItemFields.Thumbnail)
+            ]
+
+        with self.thumbnailStorage.batch():
+            for itemId, thumbnail in inlineThumbnails:
+                self.__updateItemProperty(itemId, MemeContainer(thumbnail=thumbnail))
+
+        return len(inlineThumbnails)
+
     def getGroupOfMemes(self, itemsPerPage:int, pageNo:int) -> list[MemeContainer]:
         self.__errIfUnloadedDB()
-        itemIds = list(self.db.get(JSONMemeDB.DBFields.Items).keys())
-        itemCount = len(itemIds)
         startOffset = (pageNo-1)  * itemsPerPage
 
-        if startOffset >= itemCount:
-            return []
+        with self.__dbLock.readLocked():
+            selectedIds = self.__sortedIDs[startOffset: startOffset+itemsPerPage]
+            return self.__createMemesFromIDs(selectedIds)
+
+    def getMemesAfter(self, afterID:int, count:int) -> list[MemeContainer]:
+        self.__errIfUnloadedDB()
 
+        with self.__dbLock.readLocked():
+            startOffset = 0 if afterID is None else bisect.bisect_right(self.__sortedIDs, afterID)
+            selectedIds = self.__sortedIDs[startOffset: startOffset+count]
+            return self.__createMemesFromIDs(selectedIds)
 
-        selectedIds = itemIds[startOffset: min(itemCount, startOffset+itemsPerPage)]
-        return [self.getMeme(i) for i in selectedIds]
+    def __createMemesFromIDs(self, itemIds:list[int]) -> list[MemeContainer]:
+        # Must be called with the DB lock held
+        items = self.db[JSONMemeDB.DBFields.Items]
+        return [self.__createMemeFromJSONItem(items[str(itemId)]) for itemId in itemIds]
 
     def getAllDBMemes(self) -> list[MemeContainer]:
         self.__errIfUnloadedDB()
-        self.__getDBLock()
-        res = [
-            self.__createMemeFromJSONItem(it)
-            for it in self.db.get(JSONMemeDB.DBFields.Items).values()
-        ]
-        self.__releaseDBLock()
-        return res
\ No newline at end of file
+        with self.__dbLock.readLocked():
+            return [
+                self.__createMemeFromJSONItem(it)
+                for it in self.db.get(JSONMemeDB.DBFields.Items).values()
+            ]
\ No newline at end of file
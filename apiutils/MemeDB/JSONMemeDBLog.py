@@ -0,0 +1,97 @@
+class JSONMemeDBLog:
+    """
+    Append-only log of the mutations made to the JSON DB since its last full snapshot.
+    Each entry is a small JSON dictionary describing a single item insert or update, so persisting an edit
+    costs bytes proportional to the edit instead of the size of the whole database.
+    Entries are recorded in memory as the database is changed, and are handed to the file storage when the database is written.
+    """
+    class EntryFields:
+        Op = 'op'
+        ItemID = 'id'
+        Fields = 'fields'
+        NextID = 'nextID'
+
+    class Ops:
+        Insert = 'insert'
+        Update = 'update'
+
+    def __init__(self):
+        # Entries recorded in memory that have not been written to the file storage
+        self.__pending = []
+        # Number of entries in the file storage that have not been compacted into a snapshot
+        self.__persistedCount = 0
+
+    @staticmethod
+    def makeInsertEntry(itemId:int, item:dict, nextID:int) -> dict:
+        return {
+            JSONMemeDBLog.EntryFields.Op: JSONMemeDBLog.Ops.Insert,
+            JSONMemeDBLog.EntryFields.ItemID: int(itemId),
+            JSONMemeDBLog.EntryFields.Fields: dict(item),
+            JSONMemeDBLog.EntryFields.NextID: nextID
+        }
+
+    @staticmethod
+    def makeUpdateEntry(itemId:int, fields:dict) -> dict:
+        return {
+            JSONMemeDBLog.EntryFields.Op: JSONMemeDBLog.Ops.Update,
+            JSONMemeDBLog.EntryFields.ItemID: int(itemId),
+            JSONMemeDBLog.EntryFields.Fields: dict(fields)
+        }
+
+    @staticmethod
+    def applyEntry(db:dict, entry:dict, itemsKey:str, nextIDKey:str):
+        """
+        Applies the mutation described by the log entry to the JSON db dictionary
+        """
+        itemId = str(entry[JSONMemeDBLog.EntryFields.ItemID])
+        fields = entry[JSONMemeDBLog.EntryFields.Fields]
+        op = entry[JSONMemeDBLog.EntryFields.Op]
+
+        if op == JSONMemeDBLog.Ops.Insert:
+            db[itemsKey][itemId] = dict(fields)
+            db[nextIDKey] = max(db[nextIDKey], entry[JSONMemeDBLog.EntryFields.NextID])
+
+        elif op == JSONMemeDBLog.Ops.Update:
+            item = db[itemsKey].get(itemId)
+            if item is None:
+                raise Exception(f'Log entry updates item "{itemId}" which is not in the database')
+            item.update(fields)
+
+        else:
+            raise Exception(f'Unknown log entry operation "{op}"')
+
+    def record(self, entry:dict):
+        self.__pending.append(entry)
+
+    def hasPending(self) -> bool:
+        return len(self.__pending) > 0
+
+    def takePending(self) -> list[dict]:
+        """
+        Removes and returns the entries that have not been written to the file storage
+        """
+        entries = self.__pending
+        self.__pending = []
+        return entries
+
+    def restorePending(self, entries:list[dict]):
+        """
+        Puts entries back at the front of the pending list, used when writing them to the file storage failed
+        """
+        self.__pending = entries + self.__pending
+
+    def clearPending(self):
+        self.__pending = []
+
+    def markPersisted(self, count:int):
+        self.__persistedCount += count
+
+    def markCompacted(self, count:int):
+        self.__persistedCount = max(0, self.__persistedCount - count)
+
+    def getPersistedCount(self) -> int:
+        return self.__persistedCount
+
+    def reset(self, persistedCount:int=0):
+        self.__pending = []
+        self.__persistedCount = persistedCount
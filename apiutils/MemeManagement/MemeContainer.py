@@ -1,3 +1,6 @@
+import base64
+from typing import Callable
+
 from apiutils.MemeManagement.MemeMediaType import MemeMediaType, memeMediaTypeToString, memeMediaTypeToInt, \
     stringToMemeMediaType
 from localMemeStorageServer.utils.LocalStorageUtils import cloudMemeNeedsToBeConvertedToLocal, getLocalVersionForCloudMeme
@@ -5,7 +8,16 @@ class MemeContainer:
     """
     Class used as a data container for meme information. It is not connected to the meme library or the meme database that created it.
     """
-    def __init__(self, id:int=None, name:str=None, mediaType: MemeMediaType =None, fileExt=None, tags:list[str]=None, mediaID=None, mediaURL=None, mediaTypeStr:str=None, thumbnail:str=None):
+    def __init__(self, id:int=None, name:str=None, mediaType: MemeMediaType =None, fileExt=None, tags:list[str]=None, mediaID=None, mediaURL=None, mediaTypeStr:str=None, thumbnail:str=None,
+                 thumbnailID:str=None, thumbnailLoader:Callable[[str], bytes]=None, thumbnailVariants:dict[str, bytes]=None,
+                 thumbnailVariantIDs:dict[str, str]=None):
+        """
+        If the thumbnail is kept out of the database, pass its thumbnailID and a thumbnailLoader which returns the thumbnail bytes for the ID
+        The thumbnail is then only loaded when it is requested
+        Thumbnail variants (other sizes and formats, see ThumbnailMaker.makeThumbnails) are keyed by their variant key
+        Pass the bytes of new variants as thumbnailVariants, or the IDs of stored variants as thumbnailVariantIDs, which are
+        loaded with the thumbnailLoader
+        """
         self.__id = id
         self.__name =     name
         self.__tags =     tags
@@ -14,6 +26,10 @@ class MemeContainer:
         self.__mediaURL = mediaURL
         self.__mediaType = None
         self.__thumbnail = thumbnail
+        self.__thumbnailID = thumbnailID
+        self.__thumbnailLoader = thumbnailLoader
+        self.__thumbnailVariants = thumbnailVariants
+        self.__thumbnailVariantIDs = thumbnailVariantIDs
 
         if mediaTypeStr is not None:
             self.__mediaType = stringToMemeMediaType(mediaTypeStr)
@@ -33,7 +49,8 @@ class MemeContainer:
             thumbnail=''
         )
 
-    def setProperty(self, id:int=None, name:str=None, mediaType:MemeMediaType =None, fileExt:str=None, tags:list[str]=None, mediaID:str=None, mediaURL:str=None, thumbnail:str=None):
+    def setProperty(self, id:int=None, name:str=None, mediaType:MemeMediaType =None, fileExt:str=None, tags:list[str]=None, mediaID:str=None, mediaURL:str=None, thumbnail:str=None,
+                    thumbnailVariants:dict[str, bytes]=None):
         """
         Set the property of the meme library item, any arguments left to None will not have the property value changed
         """
@@ -53,6 +70,11 @@ class MemeContainer:
             self.__mediaType = mediaType
         if thumbnail is not None:
             self.__thumbnail = thumbnail
+            # the thumbnail was replaced, so the stored thumbnail no longer applies
+            self.__thumbnailID = None
+        if thumbnailVariants is not None:
+            self.__thumbnailVariants = thumbnailVariants
+            self.__thumbnailVariantIDs = None
 
     def getID(self) -> int:
         return self.__id
@@ -79,9 +101,58 @@ class MemeContainer:
     def getFileExt(self) -> str:
         return self.__fileExt
 
-    def getThumbnail(self) -> str:
+    def getThumbnail(self, lazyLoad=True) -> str:
+        """
+        Returns the base64 encoded thumbnail
+        If lazyLoad is false, the thumbnail is not loaded from the thumbnail storage and None is returned if it has not been loaded
+        """
+        if self.__thumbnail is None and lazyLoad:
+            thumbnailBytes = self.getThumbnailBytes()
+            if thumbnailBytes is not None:
+                self.__thumbnail = base64.b64encode(thumbnailBytes).decode()
         return self.__thumbnail
 
+    def getThumbnailBytes(self) -> bytes:
+        if self.__thumbnail is not None:
+            return base64.b64decode(self.__thumbnail)
+
+        if self.__thumbnailID is None or self.__thumbnailLoader is None:
+            return None
+        return self.__thumbnailLoader(self.__thumbnailID)
+
+    def getThumbnailID(self) -> str:
+        return self.__thumbnailID
+
+    def getThumbnailVariants(self) -> dict[str, bytes]:
+        """
+        Returns the bytes of the variants set on the meme which have not been stored yet, None if there are none
+        """
+        return self.__thumbnailVariants
+
+    def getThumbnailVariantIDs(self) -> dict[str, str]:
+        """
+        Returns the IDs of the stored variants of the thumbnail by variant key, None if the meme has no stored variants
+        """
+        return self.__thumbnailVariantIDs
+
+    def getThumbnailVariantKeys(self) -> list[str]:
+        if self.__thumbnailVariants is not None:
+            return list(self.__thumbnailVariants)
+        if self.__thumbnailVariantIDs is not None:
+            return list(self.__thumbnailVariantIDs)
+        return []
+
+    def getThumbnailVariantBytes(self, key:str) -> bytes:
+        """
+        Returns the bytes of the thumbnail variant, None if the meme does not have the variant
+        """
+        if self.__thumbnailVariants is not None:
+            return self.__thumbnailVariants.get(key)
+
+        if self.__thumbnailVariantIDs is None or self.__thumbnailLoader is None or key not in self.__thumbnailVariantIDs:
+            return None
+        return self.__thumbnailLoader(self.__thumbnailVariantIDs[key])
+
     def __getCheckedCloud(self, autoConvertToLocal:bool) -> tuple[str, str]:
         if not (autoConvertToLocal and cloudMemeNeedsToBeConvertedToLocal(self.__mediaURL)):
             return self.__mediaID, self.__mediaURL
@@ -97,5 +168,5 @@ class MemeContainer:
 
     def __str__(self):
         converted = '{}'.format(', convertedToLocal' if cloudMemeNeedsToBeConvertedToLocal(self.__mediaURL) else '')
-        thStr = '...' if self.__thumbnail is not None else ''
+        thStr = '...' if self.__thumbnail is not None or self.__thumbnailID is not None else ''
         return f'Meme(id={self.__id}, name="{self.__name}", {self.__mediaType}, ext="{self.__fileExt}", tags={self.__tags}, cloudId={self.getMediaID()}, url={self.getMediaURL()}{converted}, thumbnail="{thStr}")'
\ No newline at end of file
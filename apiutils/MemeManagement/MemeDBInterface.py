@@ -1,3 +1,5 @@
+import contextlib
+
 from apiutils.MemeManagement.MemeContainer import MemeContainer
 
 class MemeDBException(Exception):
@@ -45,6 +47,41 @@ class MemeDBInterface:
         """
         raise Exception("Must implement in subclass")
 
+    def batch(self):
+        """
+        Returns a context manager grouping the changes and writes made in it, so the database can persist them together
+        By default they are not grouped
+        """
+        return contextlib.nullcontext()
+
+    def supportsThumbnailVariants(self) -> bool:
+        """
+        Returns true if the database stores the thumbnail variants of memes, otherwise they are dropped when a meme is written
+        """
+        return False
+
+    def deleteUnusedThumbnails(self, thumbnailIDs:list[str]) -> int:
+        """
+        Deletes the thumbnails (and thumbnail variants) with the given IDs from the thumbnail storage, unless a meme still uses them
+        e.g. the thumbnails a meme had before its thumbnails were made again
+        Returns the number of deleted thumbnails, by default thumbnails are not kept in a separate storage so none are deleted
+        """
+        return 0
+
+    def getRevision(self) -> str:
+        """
+        Returns an identifier of the current contents of the database, it changes whenever the database is changed
+        A database loaded from the same stored contents has the same revision, so it can be used to key data derived from it
+        """
+        raise Exception("Must implement in subclass")
+
+    def setCompactionCallback(self, callback) -> None:
+        """
+        Sets a function called with the revision of the snapshot after the database is compacted into it, or None to remove it
+        Databases that do not compact never call it
+        """
+        pass
+
     def hasMeme(self, memeID:int) -> bool:
         """
         Returns if the database contains the item id
@@ -59,6 +96,13 @@ class MemeDBInterface:
         """
         raise Exception("Must implement in subclass")
 
+    def getMemes(self, itemIDs:list[int]) -> list[MemeContainer]:
+        """
+        Returns the Meme Library items for the given itemIDs, in the same order as the IDs
+        The element for an ID which is not in the database is None
+        """
+        raise Exception("Must implement in subclass")
+
     def createMeme(self) -> int:
         """
         Creates an item in the database and returns the itemID
@@ -93,6 +137,16 @@ class MemeDBInterface:
         """
         raise Exception('Must implement in subclass')
 
+    def getMemesAfter(self, afterID:int, count:int) -> list[MemeContainer]:
+        """
+        Gets memes in ascending order of their IDs, starting after the given ID
+        Unlike pages, the memes following an ID do not shift when memes are added, so it is used for cursor pagination
+        :param afterID: The ID to start after, None to start from the first meme
+        :param count: The maximum number of memes to retrieve
+        :return: The list of Memes retrieved
+        """
+        raise Exception('Must implement in subclass')
+
     def getAllDBMemes(self) -> list[MemeContainer]:
         """
         Returns a list of all the memes in the database
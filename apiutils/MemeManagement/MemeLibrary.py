@@ -1,14 +1,23 @@
+import atexit
+import base64
 import os
 import csv
+import threading
+import traceback
+from collections import OrderedDict
 
 import requests
 
+from apiutils.DebouncedFlusher import DebouncedFlusher
+from apiutils.FileStorage.JSONDBFileStorageInterface import JSONDBFileStorageInterface
 from apiutils.MemeManagement.MemeDBInterface import MemeDBInterface, MemeDBException
 from apiutils.MemeManagement.MemeContainer import MemeContainer
 from apiutils.MemeManagement.MemeMediaType import getMediaTypeForExt, MemeMediaType
-from apiutils.MemeManagement.MemeLibrarySearcher import MemeLibrarySearcher, MemeSearchHit
+from apiutils.MemeManagement.MemeLibrarySearcher import MemeLibrarySearcher
 from apiutils.MemeManagement.MemeStorageInterface import MemeStorageInterface
+from apiutils.MemeManagement.ThumbnailPipeline import ThumbnailPipeline, ThumbnailStatus
 from apiutils.ThumbnailMaker import ThumbnailMaker
+from apiutils.VideoPreviewMaker import VideoPreviewMaker, VideoPreview
 
 
 class MemeLibraryException(Exception):
@@ -17,13 +26,92 @@ class MemeLibraryException(Exception):
         super().__init__(self.message)
 
 class MemeLibrary:
-    def __init__(self, db:MemeDBInterface, mediaStorage:MemeStorageInterface):
+    # Name of the artifact holding the archived search index, in file storages which support artifacts
+    SEARCH_INDEX_ARTIFACT_NAME = 'searchIndex.zip'
+    # Number of searches whose ranked results are cached, so the following pages of a search do not run it again
+    SEARCH_CACHE_SIZE = 128
+
+    def __init__(self, db:MemeDBInterface, mediaStorage:MemeStorageInterface, indexDir:str=None, flushIntervalSeconds:float=0,
+                 thumbnailWorkers:int=0, thumbnailVariants:list[tuple[tuple[int, int], str]]=None,
+                 videoPreviewMaker:VideoPreviewMaker=None):
         """
         Class to manage database of reaction memes, will handle the loading, reading and writing of the JSON db file
+        If an index directory is given, the search index is persisted to it (see indexLibraryIfStale), and saved again
+        for the written revision of the database when the database is compacted and when the process exits
+        If the flush interval is greater than 0, non-durable saves are written to the database at most once per interval
+        (see saveLibrary), otherwise every save is written immediately
+        If thumbnail workers is greater than 0, memes can be added with their thumbnail made in the background
+        (see addMemeToLibrary), otherwise thumbnails are always made when the meme is added
+        Thumbnail variants are the other (size, format) thumbnails made with the thumbnail of each meme, if the database
+        supports them (see MemeDBInterface.supportsThumbnailVariants)
+        If a video preview maker is given, the thumbnails of videos and animated images are made from their most informative
+        sampled frame instead of their first frame, and their preview strip is stored as a thumbnail variant
+        (see getThumbnailSource)
         """
         self.db = db
-        self.libSearcher = MemeLibrarySearcher()
+        self.libSearcher = MemeLibrarySearcher(indexDir=indexDir)
         self.mediaStorage = mediaStorage
+        self.videoPreviewMaker = videoPreviewMaker
+        # The file storage the archive of the persisted search index is kept in, set by indexLibraryIfStale
+        self.__artifactStorage = None
+
+        if self.libSearcher.isPersisted():
+            self.db.setCompactionCallback(self.__onDBCompacted)
+            # registered before the flusher, so it runs after the last flush
+            atexit.register(self.__savePersistedIndexIfChanged)
+
+        self.__flusher = None
+        if flushIntervalSeconds > 0:
+            self.__flusher = DebouncedFlusher(self.db.writeDB, flushIntervalSeconds)
+            # changes waiting for the next flush are written when the process exits
+            atexit.register(self.__flusher.close)
+
+        self.__thumbnailVariants = []
+        if thumbnailVariants is not None and db.supportsThumbnailVariants():
+            defaultKey = ThumbnailMaker.makeVariantKey(ThumbnailMaker.DEFAULT_SIZE, ThumbnailMaker.DEFAULT_FORMAT)
+            # the default thumbnail is always made, so it is not a variant
+            self.__thumbnailVariants = [
+                (tuple(size), tbFrmt) for size, tbFrmt in thumbnailVariants
+                if ThumbnailMaker.makeVariantKey(size, tbFrmt) != defaultKey
+            ]
+
+        self.__thumbnailPipeline = None
+        if thumbnailWorkers > 0:
+            self.__thumbnailPipeline = ThumbnailPipeline(self.__makeMemeThumbnail, self.__storeMemeThumbnail, workers=thumbnailWorkers)
+
+        # Ranked meme IDs of recent searches, least recently used first
+        # The library generation is part of the key and is incremented whenever the library changes,
+        # so results of a search that was running during a change are never used afterwards
+        self.__searchCache = OrderedDict()
+        self.__searchCacheLock = threading.Lock()
+        self.__generation = 0
+
+    def __invalidateSearchCache(self):
+        with self.__searchCacheLock:
+            self.__generation += 1
+            self.__searchCache.clear()
+
+    @staticmethod
+    def __normalizeQuery(query:str) -> str:
+        # Case is kept since the query parser treats upper case AND, OR and NOT as operators
+        return ' '.join(query.split())
+
+    def __searchMemeIDs(self, query:str, onlyMediaType:MemeMediaType, excludeMediaType:MemeMediaType) -> list[int]:
+        with self.__searchCacheLock:
+            key = (self.__generation, MemeLibrary.__normalizeQuery(query), onlyMediaType, excludeMediaType)
+            memeIDs = self.__searchCache.get(key)
+            if memeIDs is not None:
+                self.__searchCache.move_to_end(key)
+                return memeIDs
+
+        memeIDs = self.libSearcher.searchMemeIDs(query, onlyMediaType=onlyMediaType, excludeMediaType=excludeMediaType)
+
+        with self.__searchCacheLock:
+            self.__searchCache[key] = memeIDs
+            self.__searchCache.move_to_end(key)
+            while len(self.__searchCache) > MemeLibrary.SEARCH_CACHE_SIZE:
+                self.__searchCache.popitem(last=False)
+        return memeIDs
 
     def hasMeme(self, itemId:int):
         return self.db.hasMeme(itemId)
@@ -33,6 +121,13 @@ class MemeLibrary:
             raise MemeLibraryException("Item ID does not exist in db")
         return self.db.getMeme(itemId)
 
+    def getMemes(self, itemIds:list[int]) -> list[MemeContainer]:
+        """
+        Returns the memes for the given IDs in a single database lookup, in the same order as the IDs
+        The element for an ID which does not exist in the db is None
+        """
+        return self.db.getMemes(itemIds)
+
     def uploadMemeMedia(self, itemId:int, mediaBinary: bytes) -> str:
         """
         Uploads the media binary to the cloud and associates it with the item pointed to by the item ID
@@ -54,24 +149,94 @@ class MemeLibrary:
         mediaID, mediaURL = self.mediaStorage.uploadMedia(mediaBinary, fileExt)
         return mediaID, mediaURL
 
-    def __makeB64Thumbnail(self, mediaID:str, mediaType:MemeMediaType) -> str:
-        imgBytes = None
+    def getThumbnailSource(self, mediaID:str, mediaType:MemeMediaType) -> tuple[bytes, dict[str, bytes]]:
+        """
+        Returns the image bytes the thumbnail of the media is made from, the media itself for images and a frame for videos,
+        and the bytes of the variants made along with it by key (the preview strip of videos and animated images), empty
+        if there are none
+        If the preview cannot be made, the thumbnail is made from the frame of the media storage, or the image itself
+        """
         if mediaType == MemeMediaType.IMAGE:
-            imgBytes = self.mediaStorage.getMedia(mediaID)
+            imageBytes = self.mediaStorage.getMedia(mediaID)
+            if self.videoPreviewMaker is not None and VideoPreviewMaker.isAnimated(imageBytes):
+                try:
+                    preview = self.videoPreviewMaker.makeAnimationPreview(imageBytes, makeStrip=self.db.supportsThumbnailVariants())
+                    return preview.frameBytes, MemeLibrary.__getPreviewVariants(preview)
+                except Exception as e:
+                    print(f'Could not make the preview of animated image {mediaID}, using its first frame: {e}')
+            return imageBytes, {}
 
         elif mediaType == MemeMediaType.VIDEO:
-            imgBytes = self.mediaStorage.videoToThumbnail(mediaID)
+            if self.videoPreviewMaker is not None:
+                try:
+                    return self.__makeVideoPreview(mediaID)
+                except Exception as e:
+                    print(f'Could not make the preview of video {mediaID}, using its first frame: {e}')
+            return self.mediaStorage.videoToThumbnail(mediaID), {}
+
+        raise Exception('Unknown media type for conversion')
+
+    def __makeVideoPreview(self, mediaID:str) -> tuple[bytes, dict[str, bytes]]:
+        # the strip is stored as a variant, so it is only made if the database stores variants
+        preview = self.videoPreviewMaker.makePreview(
+            self.mediaStorage.getVideoSource(mediaID), makeStrip=self.db.supportsThumbnailVariants()
+        )
+        return preview.frameBytes, MemeLibrary.__getPreviewVariants(preview)
+
+    @staticmethod
+    def __getPreviewVariants(preview:VideoPreview) -> dict[str, bytes]:
+        if preview.stripBytes is None:
+            return {}
+        return {VideoPreviewMaker.STRIP_VARIANT_KEY: preview.stripBytes}
+
+    def getThumbnailVariants(self) -> list[tuple[tuple[int, int], str]]:
+        """
+        Returns the (size, format) variants made with the thumbnail of each meme, empty if variants are not made
+        """
+        return list(self.__thumbnailVariants)
 
-        else:
-            raise Exception('Unknown media type for conversion')
+    @staticmethod
+    def makeThumbnailContainer(imageBytes:bytes, variants:list[tuple[tuple[int, int], str]],
+                               extraVariants:dict[str, bytes]=None) -> MemeContainer:
+        """
+        Makes the thumbnail and its variants from one decode of the image
+        The thumbnail is always made at the default size and format, which the API serves it as, other sizes are variants
+        Returns a meme container with only the thumbnail and the variants set, to update a meme with
+        :param extraVariants: Variants which are already made, stored with the others e.g. the preview strip of a video
+        """
+        tbSize, tbFrmt = ThumbnailMaker.DEFAULT_SIZE, ThumbnailMaker.DEFAULT_FORMAT
+        thumbnails = ThumbnailMaker.makeThumbnails(imageBytes, [(tbSize, tbFrmt)] + variants)
+        thumbnail = thumbnails.pop(ThumbnailMaker.makeVariantKey(tbSize, tbFrmt))
+        if extraVariants is not None:
+            thumbnails.update(extraVariants)
+        return MemeContainer(
+            thumbnail=base64.b64encode(thumbnail).decode(),
+            thumbnailVariants=thumbnails if len(thumbnails) > 0 else None
+        )
+
+    def __makeThumbnails(self, mediaID:str, mediaType:MemeMediaType) -> MemeContainer:
+        imgBytes, extraVariants = self.getThumbnailSource(mediaID, mediaType)
+        return MemeLibrary.makeThumbnailContainer(imgBytes, self.__thumbnailVariants, extraVariants=extraVariants)
+
+    def __makeMemeThumbnail(self, memeID:int) -> MemeContainer:
+        meme = self.getMeme(memeID)
+        return self.__makeThumbnails(meme.getMediaID(), meme.getMediaType())
 
-        # now create thumbnail
-        thumbnailB64 = ThumbnailMaker.makeBase64Thumbnail(imgBytes)
-        return thumbnailB64
+    def __storeMemeThumbnail(self, memeID:int, thumbnails:MemeContainer):
+        if not self.db.updateMeme(memeID, thumbnails):
+            raise MemeLibraryException(f'Could not store the thumbnail of meme {memeID}')
+        # written with the next flush, like the meme it belongs to
+        self.saveLibrary(durable=False)
 
-    def addMemeToLibrary(self, name=None, fileExt=None, tags=None, mediaID=None, mediaURL=None, addMemeToIndex:bool=False) -> MemeContainer:
+    def hasBackgroundThumbnails(self) -> bool:
+        return self.__thumbnailPipeline is not None
+
+    def addMemeToLibrary(self, name=None, fileExt=None, tags=None, mediaID=None, mediaURL=None, addMemeToIndex:bool=False,
+                         backgroundThumbnail:bool=False) -> MemeContainer:
         """
         Creates a new item in the database with the available fields
+        If background thumbnail is true and the library has thumbnail workers, the meme is added without a thumbnail and
+        its thumbnail is made and stored by a worker afterwards (see getThumbnailStatus)
         Returns a MemeLibraryItem if operation was successful else None
         Note: This makes changes to the database loaded in memory, save/write the Library to push the changes to the remote database
         """
@@ -79,22 +244,52 @@ class MemeLibrary:
         mediaType = getMediaTypeForExt(fileExt)
         meme = MemeContainer(id=None, name=name, mediaType=mediaType, fileExt=fileExt, tags=tags, mediaID=mediaID, mediaURL=mediaURL)
 
-        if fileExt is not None and mediaID is not None:
-            th = None
+        makesThumbnail = fileExt is not None and mediaID is not None
+        inBackground = makesThumbnail and backgroundThumbnail and self.__thumbnailPipeline is not None
+
+        if makesThumbnail and not inBackground:
             try:
-                th = self.__makeB64Thumbnail(mediaID, mediaType)
+                thumbnails = self.__makeThumbnails(mediaID, mediaType)
             except Exception as e:
                 raise MemeLibraryException(f'Could not make thumbnail: {e}')
 
-            meme.setProperty(thumbnail=th)
+            meme.setProperty(thumbnail=thumbnails.getThumbnail(), thumbnailVariants=thumbnails.getThumbnailVariants())
 
         if not self.db.addMemeToDB(meme):
             return None
 
-        if addMemeToIndex and not self.libSearcher.hasIndex():
+        if addMemeToIndex:
             self.indexMeme(meme)
+        # after the meme is queued for the index, so a search cannot cache results without it under the new generation
+        self.__invalidateSearchCache()
+
+        if inBackground:
+            # the meme has its ID once it is in the database
+            self.__thumbnailPipeline.submit(meme.getID())
         return meme
 
+    def getThumbnailStatus(self, memeID:int) -> ThumbnailStatus:
+        """
+        Returns whether the thumbnail of the meme is ready, still being made in the background, or missing
+        """
+        if self.__thumbnailPipeline is not None:
+            status = self.__thumbnailPipeline.getStatus(memeID)
+            if status is not None:
+                return status
+
+        meme = self.getMeme(memeID)
+        if meme.getThumbnailID() is not None or meme.getThumbnail(lazyLoad=False):
+            return ThumbnailStatus.READY
+        return ThumbnailStatus.NONE
+
+    def waitForThumbnails(self, timeout:float=None) -> bool:
+        """
+        Waits for the thumbnails being made in the background, returns true if they all finished before the timeout
+        """
+        if self.__thumbnailPipeline is None:
+            return True
+        return self.__thumbnailPipeline.waitForJobs(timeout=timeout)
+
     def addAndUploadMeme(self, mediaBinary:bytes, name:str, fileExt:str, tags:list[str], addMemeToIndex:bool=False) -> MemeContainer:
         """
         Uploads the mediaBinary to the configured meme media storage and configures a new entry in the database
@@ -124,17 +319,25 @@ class MemeLibrary:
     def editMeme(self, itemId:int, name: str = None, tags:list[str] = None) -> bool:
         """
         Edits a meme in the database, allows you to edit the name or tags of the meme
+        The meme's document in the library index is updated with the changes, without re-indexing the library
         Note: This makes changes to the database loaded in memory, save/write the Library to push the changes to the remote database
         Returns true if the operation was completed
         """
         if not self.hasMeme(itemId):
             raise MemeLibraryException(f'ID "{itemId}" does not exist in database')
 
-        return self.db.updateMeme(itemId, MemeContainer(name=name, tags=tags))
+        if not self.db.updateMeme(itemId, MemeContainer(name=name, tags=tags)):
+            return False
+
+        if self.libSearcher.hasIndex():
+            self.libSearcher.updateMeme(self.getMeme(itemId))
+        # after the index is updated, so a search cannot cache results from before the edit under the new generation
+        self.__invalidateSearchCache()
+        return True
 
     def addMemeThumbnail(self, memeID:int):
         """
-        Creates the base64 encoded thumbnail and adds it to the database for the meme with the given memeID
+        Creates the base64 encoded thumbnail and its variants and adds them to the database for the meme with the given memeID
         """
         if not self.hasMeme(memeID):
             raise MemeLibraryException(f'ID "{memeID}" does not exist in database')
@@ -146,13 +349,12 @@ class MemeLibrary:
         if mediaID is None:
             raise MemeLibraryException('No Cloud ID is available for meme')
 
-        th = None
         try:
-            th = self.__makeB64Thumbnail(mediaID, mediaType)
+            thumbnails = self.__makeThumbnails(mediaID, mediaType)
         except Exception as e:
             raise MemeLibraryException(f'Could not make thumbnail: {e}')
 
-        meme.setProperty(thumbnail=th)
+        meme.setProperty(thumbnail=thumbnails.getThumbnail(), thumbnailVariants=thumbnails.getThumbnailVariants())
         return self.db.updateMeme(memeID, meme)
 
     def makeLibraryFromCSV(self, csvFile):
@@ -190,18 +392,97 @@ class MemeLibrary:
                 mediaType = getMediaTypeForExt(fileExt)
                 self.db.addMemeToDB(MemeContainer(None, name, mediaType, fileExt, tags, cloudId, cloudURL))
 
+        self.__invalidateSearchCache()
+
     def indexLibrary(self):
         """
         Indexes all the memes in the library, if index already exists, it is re-indexed
         """
         self.libSearcher.indexMemeList(self.db.getAllDBMemes())
+        self.__invalidateSearchCache()
+
+    def indexLibraryIfStale(self, artifactStorage:JSONDBFileStorageInterface=None) -> bool:
+        """
+        Opens the persisted search index if it was built from the current revision of the database, otherwise indexes the library
+        If the artifact storage supports artifacts, an archive of the index is kept in it, so processes without a local copy
+        of the index (e.g. a fresh serverless instance) can download it instead of indexing the library.
+        The archive is uploaded after the library is indexed, and again when the database is compacted or the process exits
+        Returns true if the library had to be indexed
+        """
+        if not self.libSearcher.isPersisted():
+            self.indexLibrary()
+            return True
+
+        if artifactStorage is not None and artifactStorage.supportsArtifacts():
+            self.__artifactStorage = artifactStorage
+
+        revision = self.db.getRevision()
+        if self.libSearcher.openPersistedIndex(revision):
+            self.__invalidateSearchCache()
+            return False
+
+        if self.__artifactStorage is not None:
+            archive = self.__artifactStorage.getArtifact(MemeLibrary.SEARCH_INDEX_ARTIFACT_NAME)
+            if archive is not None and self.libSearcher.openIndexArchive(archive, revision):
+                self.__invalidateSearchCache()
+                return False
+
+        self.indexLibrary()
+        self.__savePersistedIndex(revision)
+        return True
+
+    def __savePersistedIndex(self, revision:str):
+        """
+        Records that the persisted index matches the given DB revision, and uploads its archive to the artifact storage
+        The upload is not retried if it fails, the archive is uploaded again the next time the index is saved
+        """
+        self.libSearcher.savePersistedRevision(revision)
+        if self.__artifactStorage is None:
+            return
+
+        try:
+            if not self.__artifactStorage.writeArtifact(MemeLibrary.SEARCH_INDEX_ARTIFACT_NAME, self.libSearcher.makeIndexArchive()):
+                print('Could not upload the search index archive')
+        except Exception as e:
+            print(f'Could not upload the search index archive: {e}')
+            traceback.print_exc()
+
+    def __onDBCompacted(self, compactedRevision:str):
+        """
+        Saves the persisted search index for the compacted database, unless it was changed again since the compaction,
+        since the index would then be saved for a revision no other process can load
+        """
+        if self.db.isDBLoaded() and self.db.getRevision() == compactedRevision:
+            self.__savePersistedIndexIfChanged()
+
+    def __savePersistedIndexIfChanged(self):
+        """
+        Saves the persisted search index for the current revision of the database, so the next start can open it instead
+        of indexing the library. Called when the database is compacted and when the process exits, not on every write
+        since the whole index is archived and uploaded
+        """
+        if not self.libSearcher.hasIndex() or not self.db.isDBLoaded():
+            return
+
+        try:
+            # memes waiting to be indexed are in the database, so they are committed first
+            self.libSearcher.commitPendingMemes()
+            revision = self.db.getRevision()
+            if self.libSearcher.getPersistedRevision() != revision:
+                self.__savePersistedIndex(revision)
+        except Exception as e:
+            print(f'Could not save the search index: {e}')
+            traceback.print_exc()
 
     def indexMeme(self, meme:MemeContainer):
         """
         Adds the given meme to the library index, if index is not present, then the library is indexed again
+        The meme is searchable once the searcher commits its batch of added memes, at the latest before the next search
         """
         if not self.libSearcher.hasIndex():
+            # the meme is in the library, so it is included when the library is indexed
             self.indexLibrary()
+            return
 
         self.libSearcher.indexMeme(meme)
 
@@ -215,8 +496,11 @@ class MemeLibrary:
         :param onlyMediaType: Search results should only be of this meme media type
         :return: The list of meme URLs
         """
-        results = self.libSearcher.search(query, itemsPerPage, pageNo, onlyMediaType=onlyMediaType, excludeMediaType=excludeMediaType)
-        return [ self.getMeme(hit.memeID) for hit in results]
+        # pages of the same search are slices of its cached ranked results
+        memeIDs = self.__searchMemeIDs(query, onlyMediaType, excludeMediaType)
+        startOffset = (pageNo - 1) * itemsPerPage
+        memes = self.getMemes(memeIDs[startOffset: startOffset + itemsPerPage])
+        return [ meme for meme in memes if meme is not None]
 
     def browseMemes(self, itemsPerPage:int, pageNo:int) -> list[MemeContainer]:
         """
@@ -226,16 +510,59 @@ class MemeLibrary:
         """
         return self.db.getGroupOfMemes(itemsPerPage, pageNo)
 
-    def saveLibrary(self) -> bool:
+    def browseMemesAfter(self, afterID:int, count:int) -> list[MemeContainer]:
+        """
+        Browse the repository of memes in ascending order of their IDs, starting after the given meme ID
+        :param afterID: The ID of the last meme already browsed, None to start from the first meme
+        :param count: The maximum number of memes to retrieve
+        """
+        return self.db.getMemesAfter(afterID, count)
+
+    def saveLibrary(self, durable:bool=True) -> bool:
         """
         Saves the contents of the library to the database
-        Returns true if the operation was completed successfully
+        If durable is false and the library has a flush interval, the library is only marked as changed and is written
+        in the background with any other changes made during the interval, or when the process exits
+        Returns true if the operation was completed successfully, always true for a non-durable save with a flush interval
+        """
+        if self.__flusher is None:
+            return self.db.writeDB()
+
+        if durable:
+            return self.__flusher.flushNow()
+
+        self.__flusher.markDirty()
+        return True
+
+    def hasUnsavedChanges(self) -> bool:
         """
-        return self.db.writeDB()
+        Returns true if there are non-durable saves that have not been written to the database yet
+        """
+        return self.__flusher is not None and self.__flusher.isDirty()
 
     def loadLibrary(self) -> bool:
         """
         Loads the library from the database
         Returns true if the operation was completed successfully
         """
-        return self.db.loadDB()
\ No newline at end of file
+        self.__invalidateSearchCache()
+        return self.db.loadDB()
+
+    def reloadLibrary(self, artifactStorage:JSONDBFileStorageInterface=None) -> bool:
+        """
+        Loads the library from the database again, e.g. after the database was changed by another client
+        Changes which were not written are discarded, call saveLibrary first to keep them
+        The database skips the download if its stored revision did not change, and the library is only indexed again
+        (see indexLibraryIfStale) if the contents of the database changed
+        Returns true if the operation was completed successfully
+        """
+        if self.__flusher is not None:
+            self.__flusher.discard()
+        revision = self.db.getRevision() if self.db.isDBLoaded() else None
+        if not self.db.loadDB():
+            return False
+
+        if self.db.getRevision() != revision:
+            self.__invalidateSearchCache()
+            self.indexLibraryIfStale(artifactStorage=artifactStorage)
+        return True
\ No newline at end of file
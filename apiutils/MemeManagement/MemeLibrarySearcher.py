@@ -1,14 +1,19 @@
+import io
+import os
+import threading
+import zipfile
 from contextlib import contextmanager
 
 from whoosh import query
 from whoosh.analysis import StemmingAnalyzer
 from whoosh.fields import Schema, TEXT, KEYWORD, STORED, NUMERIC
 from whoosh.qparser import OrGroup, MultifieldParser
-from whoosh.filedb.filestore import RamStorage
-from whoosh.searching import Searcher, Hit
+from whoosh.filedb.filestore import RamStorage, FileStorage
+from whoosh.searching import Searcher
 
 from apiutils.MemeManagement.MemeContainer import MemeContainer
-from apiutils.MemeManagement.MemeMediaType import intToMemeMediaType, MemeMediaType, memeMediaTypeToInt
+from apiutils.MemeManagement.MemeMediaType import MemeMediaType, memeMediaTypeToInt
+from apiutils.ReadWriteLock import ReadWriteLock
 
 
 class MemeLibrarySearcherException(Exception):
@@ -16,19 +21,6 @@ class MemeLibrarySearcherException(Exception):
         self.message = message
         super().__init__(self.message)
 
-class MemeSearchHit:
-    """
-    A container class used to store a hit in the search.
-    A hit meaning a matching item in the index
-    """
-    def __init__(self, hit: Hit):
-        # SCHEMA_FIELDS_RELEVANT_HERE
-        # Hit class should have properties for all the storable fields
-        self.memeID = hit['memeID']
-        self.name = hit['name']
-        self.mediaType = intToMemeMediaType(hit['mediaType'],)
-        self.memeURL = hit['memeURL']
-
 class MemeLibrarySearcher:
     """
     Implements indexing and searching of memes for MemeLibrary
@@ -36,12 +28,27 @@ class MemeLibrarySearcher:
     # Note: This has been configured to use a specific set of field names: memeID, name, tags
     # If the fields have been changed be sure to change all places marked with the comment:
     # SCHEMA_FIELDS_RELEVANT_HERE
-    def __init__(self):
+
+    # Memes added with indexMeme are committed to the index in batches, a batch is committed once it has this many memes,
+    # when the oldest meme in it has waited this many seconds, or before the next search, whichever comes first
+    INDEX_BATCH_SIZE = 20
+    INDEX_BATCH_MAX_DELAY_SECONDS = 2.0
+
+    # Name of the index in its storage, and of the file next to a persisted index holding the DB revision it was built from
+    INDEX_NAME = 'memes'
+    REVISION_FILE_NAME = 'dbRevision.txt'
+
+    def __init__(self, indexDir:str=None):
+        """
+        If an index directory is given, the index is persisted to it and can be opened again on the next start
+        (see openPersistedIndex), otherwise the index is kept in memory
+        """
         # we create our scheme here
         # Each keyword argument is a field name in the schema
         # SCHEMA_FIELDS_RELEVANT_HERE
+        # memeID is unique so a meme's document can be updated or deleted without re-indexing the library
         self.__schema = Schema(
-            memeID=STORED,
+            memeID=NUMERIC(stored=True, unique=True),
             memeURL=STORED,
             name=TEXT(stored=True, analyzer=StemmingAnalyzer()),
             mediaType=NUMERIC(stored=True),
@@ -59,75 +66,232 @@ class MemeLibrarySearcher:
 
         # other initi
         self.__index = None
-        self.__indexStorage = RamStorage()
-        self.__indexLock = None
-
-    # TODO: Is our mutex/semaphore lock stuff configured correctly, ELEC 377 review
-    def __isIndexLocked(self):
-        return self.__indexLock
+        self.__indexDir = indexDir
+        if indexDir is None:
+            self.__indexStorage = RamStorage()
+        else:
+            os.makedirs(indexDir, exist_ok=True)
+            self.__indexStorage = FileStorage(indexDir)
+        # Searches share the lock and run in parallel, changes to the index take it exclusively
+        self.__indexLock = ReadWriteLock()
 
-    def __getIndexLock(self):
-        # wait till index unlocks
-        while self.__isIndexLocked():
-            pass
+        # Documents of memes waiting to be committed to the index, keyed by meme ID
+        self.__pendingDocuments = {}
+        self.__pendingLock = threading.Lock()
+        self.__pendingTimer = None
 
-        self.__indexLock = True
-
-    def __releaseIndexLock(self):
-        self.__indexLock = False
+    def __makeMemeDocument(self, meme:MemeContainer) -> dict:
+        # SCHEMA_FIELDS_RELEVANT_HERE
+        return dict(memeID=meme.getID(),
+                    name=meme.getName(),
+                    tags=','.join(meme.getTags()),
+                    memeURL=meme.getMediaURL(),
+                    mediaType=meme.getMediaTypeInt()
+                    )
 
     def __addMemeToWriter(self, indexWriter, meme:MemeContainer):
-        # SCHEMA_FIELDS_RELEVANT_HERE
-        indexWriter.add_document(memeID=meme.getID(),
-                                 name=meme.getName(),
-                                 tags=','.join(meme.getTags()),
-                                 memeURL=meme.getMediaURL(),
-                                 mediaType=meme.getMediaTypeInt()
-                                 )
+        indexWriter.add_document(**self.__makeMemeDocument(meme))
+
+    def __errIfNoIndex(self):
+        if self.__index is None:
+            raise MemeLibrarySearcherException('Database has not been indexed')
 
     def hasIndex(self) -> bool:
         return self.__index is not None
 
+    def isPersisted(self) -> bool:
+        return self.__indexDir is not None
+
+    def __revisionFilePath(self) -> str:
+        return os.path.join(self.__indexDir, MemeLibrarySearcher.REVISION_FILE_NAME)
+
+    def getPersistedRevision(self) -> str:
+        """
+        Returns the DB revision the persisted index was built from, None if the index is not persisted,
+        or if it has been changed since it was built
+        """
+        if not self.isPersisted() or not os.path.exists(self.__revisionFilePath()):
+            return None
+
+        with open(self.__revisionFilePath(), 'r') as file:
+            return file.read().strip()
+
+    def savePersistedRevision(self, revision:str):
+        """
+        Records that the persisted index was built from the given DB revision, call it right after indexMemeList
+        """
+        if not self.isPersisted():
+            raise MemeLibrarySearcherException('Index is not persisted')
+
+        with open(self.__revisionFilePath(), 'w') as file:
+            file.write(revision)
+
+    def __clearPersistedRevision(self):
+        # Once the persisted index is changed it no longer matches the revision it was built from,
+        # the changes are only known to match the database once it has been written
+        if self.isPersisted() and os.path.exists(self.__revisionFilePath()):
+            os.remove(self.__revisionFilePath())
+
+    def openPersistedIndex(self, revision:str) -> bool:
+        """
+        Opens the index persisted in the index directory if it was built from the given DB revision
+        The index files are memory mapped instead of being read into memory
+        Returns false if there is no persisted index or it is stale, the library should then be indexed again
+        """
+        if self.getPersistedRevision() != revision or not self.__indexStorage.index_exists(MemeLibrarySearcher.INDEX_NAME):
+            return False
+
+        with self.__pendingLock:
+            self.__pendingDocuments.clear()
+            self.__cancelPendingTimer()
+
+            with self.__indexLock.writeLocked():
+                self.__index = self.__indexStorage.open_index(MemeLibrarySearcher.INDEX_NAME)
+        return True
+
+    def makeIndexArchive(self) -> bytes:
+        """
+        Returns a zip archive of the persisted index directory, including its revision file
+        It can be opened by the searcher of another process with openIndexArchive
+        """
+        if not self.isPersisted():
+            raise MemeLibrarySearcherException('Index is not persisted')
+
+        buffer = io.BytesIO()
+        with self.__indexLock.readLocked(), zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for fileName in os.listdir(self.__indexDir):
+                archive.write(os.path.join(self.__indexDir, fileName), arcname=fileName)
+        return buffer.getvalue()
+
+    def openIndexArchive(self, archiveBytes:bytes, revision:str) -> bool:
+        """
+        Replaces the persisted index with the one in the archive made by makeIndexArchive, and opens it if it was built
+        from the given DB revision
+        Returns false if the archived index is stale
+        """
+        if not self.isPersisted():
+            raise MemeLibrarySearcherException('Index is not persisted')
+
+        with zipfile.ZipFile(io.BytesIO(archiveBytes), 'r') as archive:
+            try:
+                archivedRevision = archive.read(MemeLibrarySearcher.REVISION_FILE_NAME).decode().strip()
+            except KeyError:
+                return False
+
+            if archivedRevision != revision:
+                return False
+
+            with self.__indexLock.writeLocked():
+                self.__index = None
+                self.__indexStorage.clean()
+                archive.extractall(self.__indexDir)
+
+        return self.openPersistedIndex(revision)
+
     def indexMemeList(self, memes:list[MemeContainer]):
         """
         Indexes all the memes in the library, if index already exists, it is re-indexed
         :return:
         """
-        self.__getIndexLock()
+        with self.__indexLock.writeLocked():
+            # Creates a fresh index
+            self.__clearPersistedRevision()
+            self.__index = self.__indexStorage.create_index(self.__schema, indexname=MemeLibrarySearcher.INDEX_NAME)
 
-        # Creates a fresh index
-        self.__index = self.__indexStorage.create_index(self.__schema)
+            # open the writer to add documents to the index
+            writer = self.__index.writer()
+            for meme in memes:
+                self.__addMemeToWriter(writer, meme)
+            writer.commit()
 
-        # open the writer to add documents to the index
-        writer = self.__index.writer()
-        for meme in memes:
-            self.__addMemeToWriter(writer, meme)
-        writer.commit()
+        # pending memes are in the library given to the fresh index
+        with self.__pendingLock:
+            self.__pendingDocuments.clear()
+            self.__cancelPendingTimer()
 
-        # release the lock
-        self.__releaseIndexLock()
+    def __cancelPendingTimer(self):
+        if self.__pendingTimer is not None:
+            self.__pendingTimer.cancel()
+            self.__pendingTimer = None
 
     def indexMeme(self, meme:MemeContainer):
-        self.__getIndexLock()
-        writer = self.__index.writer()
-        self.__addMemeToWriter(writer, meme)
-        self.__releaseIndexLock()
+        """
+        Adds the meme to the index, the meme is committed with the next batch of added memes (see INDEX_BATCH_SIZE)
+        """
+        self.__errIfNoIndex()
+        with self.__pendingLock:
+            self.__pendingDocuments[meme.getID()] = self.__makeMemeDocument(meme)
+            batchFull = len(self.__pendingDocuments) >= MemeLibrarySearcher.INDEX_BATCH_SIZE
+
+            if not batchFull and self.__pendingTimer is None:
+                self.__pendingTimer = threading.Timer(MemeLibrarySearcher.INDEX_BATCH_MAX_DELAY_SECONDS, self.commitPendingMemes)
+                self.__pendingTimer.daemon = True
+                self.__pendingTimer.start()
+
+        if batchFull:
+            self.commitPendingMemes()
+
+    def hasPendingMemes(self) -> bool:
+        return len(self.__pendingDocuments) > 0
+
+    def commitPendingMemes(self):
+        """
+        Commits the memes waiting to be added to the index in a single write
+        """
+        # The pending lock is held until the commit is done, so an update of a pending meme cannot be overwritten by it
+        # Lock order is always the pending lock and then the index lock
+        with self.__pendingLock:
+            documents = list(self.__pendingDocuments.values())
+            self.__pendingDocuments.clear()
+            self.__cancelPendingTimer()
+
+            if len(documents) == 0:
+                return
+
+            with self.__indexLock.writeLocked():
+                self.__clearPersistedRevision()
+                writer = self.__index.writer()
+                for document in documents:
+                    # update, so a meme committed twice does not have duplicate documents
+                    writer.update_document(**document)
+                writer.commit()
+
+    def updateMeme(self, meme:MemeContainer):
+        """
+        Replaces the indexed document of the meme with its current information, the meme is added if it was not indexed
+        """
+        self.__errIfNoIndex()
+        # the updated document replaces a pending one, otherwise the pending one would overwrite it when committed
+        with self.__pendingLock:
+            self.__pendingDocuments.pop(meme.getID(), None)
+
+            with self.__indexLock.writeLocked():
+                self.__clearPersistedRevision()
+                writer = self.__index.writer()
+                # SCHEMA_FIELDS_RELEVANT_HERE
+                writer.update_document(**self.__makeMemeDocument(meme))
+                writer.commit()
 
     @contextmanager
     def getSearcher(self) -> Searcher:
-        if self.__index is None:
-            raise MemeLibrarySearcherException('Database has not been indexed')
+        self.__errIfNoIndex()
+
+        with self.__indexLock.readLocked():
+            searcher = self.__index.searcher()
+            try:
+                yield searcher
+            finally:
+                searcher.close()
 
-        self.__getIndexLock()
-        searcher = self.__index.searcher()
-        try:
-            yield searcher
-        finally:
-            searcher.close()
-            self.__releaseIndexLock()
 
+    def searchMemeIDs(self, queryStr:str, onlyMediaType: MemeMediaType=None, excludeMediaType: MemeMediaType = None) -> list[int]:
+        """
+        Returns the IDs of all the memes matching the query, in ranked order
+        """
+        # make recently added memes searchable
+        if self.hasPendingMemes():
+            self.commitPendingMemes()
 
-    def search(self, queryStr:str, itemsPerPage, pageNo, onlyMediaType: MemeMediaType=None, excludeMediaType: MemeMediaType = None) -> list[MemeSearchHit]:
         q = self.__queryParser.parse(queryStr)
         filterTypeQuery = None
         excludeTypeQuery = None
@@ -140,11 +304,5 @@ class MemeLibrarySearcher:
             if excludeMediaType is not None:
                 excludeTypeQuery = query.Term("mediaType", str(memeMediaTypeToInt(excludeMediaType)))
 
-            results = s.search_page(q, pageNo, pagelen=itemsPerPage, filter=filterTypeQuery, mask=excludeTypeQuery)
-            resultCount = results.scored_length()
-            startOffset = (pageNo - 1) * itemsPerPage
-
-            if startOffset < resultCount:
-                return [ MemeSearchHit(hit) for hit in results ]
-
-            return []
\ No newline at end of file
+            results = s.search(q, limit=None, filter=filterTypeQuery, mask=excludeTypeQuery)
+            return [hit['memeID'] for hit in results]
@@ -25,4 +25,11 @@ class MemeStorageInterface:
         Returns the bytes for a thumbnail image created from the video at the cloud ID
         Do not perform regular thumbnail compression since the image will be passed through a thumbnail maker
         """
-        raise Exception("Must implement in subclass")
\ No newline at end of file
+        raise Exception("Must implement in subclass")
+
+    def getVideoSource(self, cloudID) -> str:
+        """
+        Returns the URL of the video at the cloud ID which ffmpeg can read, so the video can be streamed by ffmpeg
+        instead of being downloaded (see VideoPreviewMaker)
+        """
+        raise Exception("Must implement in subclass")
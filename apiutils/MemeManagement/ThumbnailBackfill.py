@@ -0,0 +1,263 @@
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable
+
+from apiutils.MemeManagement.MemeContainer import MemeContainer
+from apiutils.MemeManagement.MemeLibrary import MemeLibrary, MemeLibraryException
+from apiutils.ThumbnailMaker import ThumbnailMaker
+
+
+def _makeThumbnailInWorker(source:tuple[bytes, dict[str, bytes]], variants:list) -> MemeContainer:
+    # Runs in a worker process, so it must be a module level function
+    imageBytes, extraVariants = source
+    return MemeLibrary.makeThumbnailContainer(imageBytes, variants, extraVariants=extraVariants)
+
+
+class BackfillProgress:
+    """
+    Counts of a thumbnail backfill run, passed to the progress callback after every meme
+    """
+    def __init__(self, total:int, skipped:int):
+        self.total = total
+        # memes done by a previous run with the same settings
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.startTime = time.monotonic()
+
+    def getFinishedCount(self) -> int:
+        return self.skipped + self.done + self.failed
+
+    def getRate(self) -> float:
+        """
+        Returns the memes finished per second by this run
+        """
+        elapsed = time.monotonic() - self.startTime
+        return (self.done + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    def getETASeconds(self) -> float:
+        rate = self.getRate()
+        remaining = self.total - self.getFinishedCount()
+        return remaining / rate if rate > 0 else None
+
+    def toDict(self) -> dict:
+        return {
+            'total': self.total,
+            'skipped': self.skipped,
+            'done': self.done,
+            'failed': self.failed,
+        }
+
+
+class ThumbnailBackfill:
+    """
+    Makes the thumbnails of many memes of the library at once, e.g. to regenerate every thumbnail after changing
+    ThumbnailMaker.DEFAULT_SIZE, or to make the thumbnails of a new size or format for every meme
+    - The default thumbnail is always made at the default size and format, other sizes and formats are made as variants
+    - The media of the memes is downloaded by a pool of threads, so at most `downloadWorkers` downloads run at the same time
+      (the frames of videos are sampled by ffmpeg in these threads too, if the library has a video preview maker)
+    - The thumbnails are made by a pool of processes, since decoding the images is CPU bound, along with the thumbnail
+      variants of the library (see MemeLibrary.getThumbnailVariants) from the same decode
+    - At most `maxInFlight` memes are downloaded or being made at a time, which bounds the media bytes held in memory
+    - The thumbnails are stored every `checkpointEvery` memes in one batch of database writes, followed by the progress
+      file. If the run is interrupted, running it again with the same progress file and settings skips the stored memes
+    - The thumbnails and variants the stored thumbnails replace are then deleted, unless another meme uses them
+    """
+    DEFAULT_DOWNLOAD_WORKERS = 8
+    DEFAULT_CHECKPOINT_EVERY = 50
+
+    def __init__(self, memeLib:MemeLibrary, tbSize:tuple[int, int]=None, tbFrmt:str=None, processes:int=None,
+                 downloadWorkers:int=DEFAULT_DOWNLOAD_WORKERS, maxInFlight:int=None, progressFilePath:str=None,
+                 checkpointEvery:int=DEFAULT_CHECKPOINT_EVERY):
+        """
+        :param tbSize: The size of a thumbnail variant to make along with the variants of the library, ThumbnailMaker.DEFAULT_SIZE if not given
+        :param tbFrmt: The format of that variant, ThumbnailMaker.DEFAULT_FORMAT if not given. If both are the default,
+        only the default thumbnail and the variants of the library are made
+        :param processes: The number of worker processes, the number of CPUs if not given
+        :param progressFilePath: The file the progress is saved to, so an interrupted run can be resumed. Not saved if not given
+        """
+        self.memeLib = memeLib
+        self.tbSize = tuple(tbSize) if tbSize is not None else ThumbnailMaker.DEFAULT_SIZE
+        self.tbFrmt = tbFrmt if tbFrmt is not None else ThumbnailMaker.DEFAULT_FORMAT
+        self.variants = memeLib.getThumbnailVariants()
+        variantKey = ThumbnailMaker.makeVariantKey(self.tbSize, self.tbFrmt)
+        defaultKey = ThumbnailMaker.makeVariantKey(ThumbnailMaker.DEFAULT_SIZE, ThumbnailMaker.DEFAULT_FORMAT)
+        if variantKey != defaultKey and variantKey not in [ThumbnailMaker.makeVariantKey(*variant) for variant in self.variants]:
+            if not memeLib.db.supportsThumbnailVariants():
+                raise MemeLibraryException(f'Cannot make {variantKey} thumbnails, the database does not store thumbnail variants')
+            self.variants.append((self.tbSize, self.tbFrmt))
+        self.processes = processes if processes is not None else (os.cpu_count() or 1)
+        self.downloadWorkers = downloadWorkers
+        self.maxInFlight = maxInFlight if maxInFlight is not None else downloadWorkers + 2 * self.processes
+        self.progressFilePath = progressFilePath
+        self.checkpointEvery = checkpointEvery
+
+        self.__doneIDs = set()
+        self.__failures = {}
+
+    def __getSettings(self) -> dict:
+        return {
+            'size': list(ThumbnailMaker.DEFAULT_SIZE),
+            'format': ThumbnailMaker.DEFAULT_FORMAT,
+            'variants': [ThumbnailMaker.makeVariantKey(size, tbFrmt) for size, tbFrmt in self.variants],
+            'videoPreview': self.memeLib.videoPreviewMaker is not None,
+        }
+
+    def __loadProgress(self):
+        self.__doneIDs = set()
+        self.__failures = {}
+        if self.progressFilePath is None or not os.path.exists(self.progressFilePath):
+            return
+
+        with open(self.progressFilePath, 'r') as file:
+            progress = json.load(file)
+
+        # Thumbnails made with other settings have to be made again
+        if progress.get('settings') != self.__getSettings():
+            return
+        self.__doneIDs = set(progress.get('done', []))
+
+    def __saveProgress(self):
+        if self.progressFilePath is None:
+            return
+
+        progress = {
+            'settings': self.__getSettings(),
+            'done': sorted(self.__doneIDs),
+            'failed': {str(memeID): error for memeID, error in self.__failures.items()},
+        }
+        # Written to a temporary file first, so an interrupted write does not lose the progress
+        tempPath = f'{self.progressFilePath}.tmp'
+        with open(tempPath, 'w') as file:
+            json.dump(progress, file)
+        os.replace(tempPath, self.progressFilePath)
+
+    def clearProgress(self):
+        """
+        Deletes the progress file, so the next run makes every thumbnail again
+        """
+        self.__doneIDs = set()
+        self.__failures = {}
+        if self.progressFilePath is not None and os.path.exists(self.progressFilePath):
+            os.remove(self.progressFilePath)
+
+    def getFailures(self) -> dict[int, str]:
+        """
+        Returns the error for each meme whose thumbnail could not be made in the last run
+        """
+        return dict(self.__failures)
+
+    @staticmethod
+    def __getThumbnailIDs(meme:MemeContainer) -> list[str]:
+        return [meme.getThumbnailID()] + list((meme.getThumbnailVariantIDs() or {}).values())
+
+    def __checkpoint(self, madeThumbnails:list[tuple[int, MemeContainer]]):
+        """
+        Stores the made thumbnails and writes the library, then records them as done in the progress file
+        The replaced thumbnails are deleted once the library which no longer uses them is written
+        """
+        replacedIDs = []
+        if len(madeThumbnails) > 0:
+            with self.memeLib.db.batch():
+                for memeID, thumbnails in madeThumbnails:
+                    replacedIDs += ThumbnailBackfill.__getThumbnailIDs(self.memeLib.db.getMeme(memeID))
+                    if not self.memeLib.db.updateMeme(memeID, thumbnails):
+                        raise Exception(f'Could not store the thumbnail of meme {memeID}')
+                if not self.memeLib.saveLibrary():
+                    raise Exception('Could not save the meme library')
+
+        self.__doneIDs.update(memeID for memeID, _ in madeThumbnails)
+        self.__saveProgress()
+
+        if len(replacedIDs) > 0:
+            # the stored thumbnails are content-addressed, so an unchanged thumbnail has the same ID and is still used
+            try:
+                with self.memeLib.db.batch():
+                    self.memeLib.db.deleteUnusedThumbnails(replacedIDs)
+            except Exception:
+                # the thumbnails are stored, a thumbnail which could not be deleted only takes up space
+                traceback.print_exc()
+
+    def run(self, memeIDs:list[int]=None, onProgress:Callable[[BackfillProgress], None]=None) -> BackfillProgress:
+        """
+        Makes and stores the thumbnails of the memes with the given IDs, all the memes with media if not given
+        Memes stored by a previous run with the same progress file and settings are skipped
+        Failures are recorded (see getFailures) and do not stop the run, they are retried by the next run
+        :param onProgress: Called after every meme which is finished
+        """
+        self.__loadProgress()
+
+        if memeIDs is None:
+            memes = self.memeLib.db.getAllDBMemes()
+        else:
+            memes = [meme for meme in self.memeLib.getMemes(memeIDs) if meme is not None]
+        memes = [meme for meme in memes if meme.getMediaID() is not None]
+
+        todo = [meme for meme in memes if meme.getID() not in self.__doneIDs]
+        progress = BackfillProgress(len(memes), len(memes) - len(todo))
+        if onProgress is not None:
+            onProgress(progress)
+
+        madeThumbnails = []
+
+        def finish(memeID:int, thumbnails:MemeContainer=None, error:Exception=None):
+            if error is None:
+                madeThumbnails.append((memeID, thumbnails))
+                progress.done += 1
+            else:
+                self.__failures[memeID] = str(error)
+                progress.failed += 1
+
+            if len(madeThumbnails) >= self.checkpointEvery:
+                self.__checkpoint(madeThumbnails)
+                madeThumbnails.clear()
+
+            if onProgress is not None:
+                onProgress(progress)
+
+        memeIter = iter(todo)
+        # future -> the meme it is for, and whether it downloads the media or makes the thumbnail
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.downloadWorkers, thread_name_prefix='thumbnail-download') as downloads, \
+                ProcessPoolExecutor(max_workers=self.processes) as makers:
+            try:
+                while True:
+                    while len(pending) < self.maxInFlight:
+                        meme = next(memeIter, None)
+                        if meme is None:
+                            break
+                        future = downloads.submit(self.memeLib.getThumbnailSource, meme.getMediaID(), meme.getMediaType())
+                        pending[future] = (meme.getID(), True)
+
+                    if len(pending) == 0:
+                        break
+
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        memeID, isDownload = pending.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            finish(memeID, error=e)
+                            continue
+
+                        if isDownload:
+                            future = makers.submit(_makeThumbnailInWorker, result, self.variants)
+                            pending[future] = (memeID, False)
+                        else:
+                            finish(memeID, thumbnails=result)
+            except BaseException:
+                # The thumbnails made so far are kept, so they are skipped when the run is resumed
+                for future in pending:
+                    future.cancel()
+                try:
+                    self.__checkpoint(madeThumbnails)
+                except Exception:
+                    traceback.print_exc()
+                raise
+
+        self.__checkpoint(madeThumbnails)
+        return progress
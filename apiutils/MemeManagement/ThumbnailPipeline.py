@@ -0,0 +1,122 @@
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from enum import Enum
+from typing import Callable
+
+from apiutils.MemeManagement.MemeContainer import MemeContainer
+
+
+class ThumbnailStatus(Enum):
+    # The thumbnail is waiting for a worker or being made
+    PENDING = 'pending'
+    READY = 'ready'
+    # Making the thumbnail failed, the meme has no thumbnail
+    FAILED = 'failed'
+    # The meme has no thumbnail and none is being made (e.g. it was added without media)
+    NONE = 'none'
+
+
+class ThumbnailPipeline:
+    """
+    Makes the thumbnails of memes in a pool of worker threads, so adding a meme does not wait for its media to be
+    downloaded and decoded.
+    A job makes the thumbnail with `makeThumbnail` and hands it to `onThumbnail`, which stores it with the meme.
+    The pipeline only keeps the status of unfinished and failed jobs, so clients can poll for the thumbnail. The meme of a
+    finished job has its thumbnail stored, and the errors of the most recent MAX_FAILED_JOBS failed jobs are kept.
+    """
+    DEFAULT_WORKERS = 2
+    MAX_FAILED_JOBS = 1024
+
+    def __init__(self, makeThumbnail: Callable[[int], MemeContainer], onThumbnail: Callable[[int, MemeContainer], None],
+                 workers:int=DEFAULT_WORKERS):
+        """
+        :param makeThumbnail: Returns a meme container with the thumbnail (and its variants) of the meme ID set
+        :param onThumbnail: Stores the thumbnail made for the meme ID
+        :param workers: The number of thumbnails made at the same time
+        """
+        self.__makeThumbnail = makeThumbnail
+        self.__onThumbnail = onThumbnail
+        self.__executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='thumbnail')
+        self.__lock = threading.Lock()
+        # meme ID -> the (token, future) of its latest unfinished job, and the error of its failed job (least recent failure first)
+        # The token identifies the job, so an older job of the meme which finishes later does not remove the newer one
+        self.__futures = {}
+        self.__failures = OrderedDict()
+
+    def submit(self, memeID:int) -> Future:
+        """
+        Queues a job which makes the thumbnail of the meme, the meme is pending until the job finishes
+        """
+        with self.__lock:
+            self.__failures.pop(memeID, None)
+            job = object()
+            future = self.__executor.submit(self.__runJob, memeID, job)
+            self.__futures[memeID] = (job, future)
+        return future
+
+    def __runJob(self, memeID:int, job:object):
+        try:
+            thumbnail = self.__makeThumbnail(memeID)
+            self.__onThumbnail(memeID, thumbnail)
+        except Exception as e:
+            # Nothing waits on the job, so the error is kept for getError and logged
+            print(f'Could not make the thumbnail of meme {memeID}: {e}')
+            traceback.print_exc()
+            self.__finishJob(memeID, job, str(e))
+            return
+
+        self.__finishJob(memeID, job)
+
+    def __finishJob(self, memeID:int, job:object, error:str=None):
+        with self.__lock:
+            # a newer job of the meme was submitted while this one ran, its status is the one that matters
+            latestJob, _ = self.__futures.get(memeID, (None, None))
+            if latestJob is not job:
+                return
+
+            self.__futures.pop(memeID)
+            if error is not None:
+                self.__failures[memeID] = error
+                while len(self.__failures) > ThumbnailPipeline.MAX_FAILED_JOBS:
+                    self.__failures.popitem(last=False)
+
+    def getStatus(self, memeID:int) -> ThumbnailStatus:
+        """
+        Returns PENDING if the meme has an unfinished job, FAILED if its latest job failed (and is one of the most recent
+        failures), otherwise None, e.g. if its job succeeded and the thumbnail is stored with the meme
+        """
+        with self.__lock:
+            if memeID in self.__futures:
+                return ThumbnailStatus.PENDING
+            if memeID in self.__failures:
+                return ThumbnailStatus.FAILED
+            return None
+
+    def getError(self, memeID:int) -> str:
+        """
+        Returns the error of the latest job of the meme if it failed, otherwise None
+        """
+        with self.__lock:
+            return self.__failures.get(memeID)
+
+    def getPendingCount(self) -> int:
+        with self.__lock:
+            return len(self.__futures)
+
+    def waitForJobs(self, timeout:float=None) -> bool:
+        """
+        Waits for the jobs submitted so far to finish
+        Returns true if they all finished before the timeout
+        """
+        with self.__lock:
+            futures = [future for _, future in self.__futures.values()]
+        _, notDone = wait(futures, timeout=timeout)
+        return len(notDone) == 0
+
+    def shutdown(self, wait:bool=True):
+        """
+        Stops accepting jobs, if wait is true the queued jobs are finished first, otherwise they are cancelled
+        """
+        self.__executor.shutdown(wait=wait, cancel_futures=not wait)
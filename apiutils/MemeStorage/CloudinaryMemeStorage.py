@@ -1,8 +1,8 @@
 import cloudinary
 import cloudinary.uploader
-import requests
 
 from apiutils.MemeManagement.MemeStorageInterface import MemeStorageInterface
+from apiutils.OutboundPolicy import Backend, getOutboundPolicy
 from apiutils.configs.ServerConfig import ServerConfig
 
 
@@ -14,9 +14,13 @@ class CloudinaryMemeStorage(MemeStorageInterface):
             api_key = ServerConfig.CLOUDINARY_API_KEY,
             api_secret = ServerConfig.CLOUDINARY_API_SECRET,
         )
+        self.__policy = getOutboundPolicy(Backend.CLOUDINARY)
 
     def uploadMedia(self, mediaBinary:bytes, fileExt) -> tuple[str, str]:
-        resp = cloudinary.uploader.upload(mediaBinary, folder="memes", resource_type="auto")
+        # uploads are not idempotent, so they are not retried
+        resp = self.__policy.call(
+            cloudinary.uploader.upload, mediaBinary, folder="memes", resource_type="auto", timeout=self.__policy.readTimeout
+        )
         if 'public_id' not in resp:
             return None, None
 
@@ -26,10 +30,13 @@ class CloudinaryMemeStorage(MemeStorageInterface):
 
     def getMedia(self, cloudID) -> bytes:
         url = cloudinary.utils.cloudinary_url(cloudID)[0]
-        resp = requests.get(url)
+        resp = self.__policy.request('GET', url)
         return resp.content
 
     def videoToThumbnail(self, cloudID) -> bytes:
         url = cloudinary.CloudinaryVideo(cloudID).video_thumbnail(start_offset=0)
-        resp = requests.get(url)
-        return resp.content
\ No newline at end of file
+        resp = self.__policy.request('GET', url)
+        return resp.content
+
+    def getVideoSource(self, cloudID) -> str:
+        return cloudinary.utils.cloudinary_url(cloudID, resource_type='video')[0]
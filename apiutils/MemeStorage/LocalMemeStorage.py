@@ -1,18 +1,18 @@
-import requests
 from apiutils.MemeManagement.MemeStorageInterface import MemeStorageInterface, MemeStorageException
+from apiutils.OutboundPolicy import Backend, getOutboundPolicy
 
 class LocalMemeStorage(MemeStorageInterface):
     """
     Communicates with local meme storage server running on port 5001
     """
     def __init__(self):
-        pass
+        self.__policy = getOutboundPolicy(Backend.LOCAL_MEME_STORAGE)
 
     def storageServer(self, route):
         return f'http://127.0.0.1:5001/{route}'
 
     def uploadMedia(self, mediaBinary:bytes, fileExt) -> tuple[str, str]:
-        resp = requests.post(self.storageServer(f'local/upload?fileExt={fileExt}'), data=mediaBinary)
+        resp = self.__policy.request('POST', self.storageServer(f'local/upload?fileExt={fileExt}'), data=mediaBinary)
         if not resp.ok:
             raise MemeStorageException('Local storage server failed!')
 
@@ -20,13 +20,16 @@ class LocalMemeStorage(MemeStorageInterface):
         return res['payload']['mediaID'], res['payload']['mediaURL']
 
     def getMedia(self, mediaID) -> bytes:
-        resp = requests.get(self.storageServer(f'local/meme/{mediaID}'))
+        resp = self.__policy.request('GET', self.storageServer(f'local/meme/{mediaID}'))
         if not resp.ok:
             raise MemeStorageException('Local storage server failed!')
         return resp.content
 
     def videoToThumbnail(self, mediaID) -> bytes:
-        resp = requests.get(self.storageServer(f'local/thumbnail/{mediaID}'))
+        resp = self.__policy.request('GET', self.storageServer(f'local/thumbnail/{mediaID}'))
         if not resp.ok:
             raise MemeStorageException('Local storage server failed!')
-        return resp.content
\ No newline at end of file
+        return resp.content
+
+    def getVideoSource(self, mediaID) -> str:
+        return self.storageServer(f'local/meme/{mediaID}')
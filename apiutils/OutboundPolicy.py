@@ -0,0 +1,235 @@
+import random
+import threading
+import time
+from enum import Enum
+
+import requests
+
+
+class CircuitOpenException(Exception):
+    """
+    Raised instead of making a call to a backend whose circuit breaker is open
+    """
+    def __init__(self, backend:str, retryInSeconds:float):
+        self.backend = backend
+        self.message = f'The {backend} backend is unavailable, retrying in {retryInSeconds:.0f}s'
+        super().__init__(self.message)
+
+
+class CircuitState(Enum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Fails calls to a backend fast once it looks down, instead of letting every request wait for it to time out
+    - Closed: calls are made, the breaker opens after `failureThreshold` consecutive failures
+    - Open: calls fail immediately with CircuitOpenException, for `resetTimeoutSeconds`
+    - Half-open: a single trial call is let through, its success closes the breaker and its failure opens it again
+    """
+    def __init__(self, name:str, failureThreshold:int, resetTimeoutSeconds:float):
+        self.name = name
+        self.__failureThreshold = failureThreshold
+        self.__resetTimeoutSeconds = resetTimeoutSeconds
+        self.__lock = threading.Lock()
+        self.__state = CircuitState.CLOSED
+        self.__consecutiveFailures = 0
+        self.__openedAt = 0
+        self.__trialInProgress = False
+        self.__totalFailures = 0
+        self.__totalRejected = 0
+
+    def __updateState(self):
+        # Must be called with the lock held
+        if self.__state == CircuitState.OPEN and time.monotonic() - self.__openedAt >= self.__resetTimeoutSeconds:
+            self.__state = CircuitState.HALF_OPEN
+            self.__trialInProgress = False
+
+    def beforeCall(self):
+        """
+        Raises CircuitOpenException if the call cannot be made
+        """
+        with self.__lock:
+            self.__updateState()
+            if self.__state == CircuitState.CLOSED:
+                return
+
+            if self.__state == CircuitState.HALF_OPEN and not self.__trialInProgress:
+                self.__trialInProgress = True
+                return
+
+            self.__totalRejected += 1
+            retryIn = max(0.0, self.__resetTimeoutSeconds - (time.monotonic() - self.__openedAt))
+            raise CircuitOpenException(self.name, retryIn)
+
+    def recordSuccess(self):
+        with self.__lock:
+            self.__state = CircuitState.CLOSED
+            self.__consecutiveFailures = 0
+            self.__trialInProgress = False
+
+    def recordFailure(self):
+        with self.__lock:
+            self.__consecutiveFailures += 1
+            self.__totalFailures += 1
+            if self.__state == CircuitState.HALF_OPEN or self.__consecutiveFailures >= self.__failureThreshold:
+                self.__state = CircuitState.OPEN
+                self.__openedAt = time.monotonic()
+                self.__trialInProgress = False
+
+    def getState(self) -> CircuitState:
+        with self.__lock:
+            self.__updateState()
+            return self.__state
+
+    def toDict(self) -> dict:
+        with self.__lock:
+            self.__updateState()
+            return {
+                'backend': self.name,
+                'state': self.__state.value,
+                'consecutiveFailures': self.__consecutiveFailures,
+                'totalFailures': self.__totalFailures,
+                'totalRejected': self.__totalRejected,
+            }
+
+
+class OutboundPolicy:
+    """
+    The policy for the calls made to one backend (e.g. PushBullet, Cloudinary): every call has a timeout, idempotent calls
+    are retried with bounded exponential backoff, and all calls go through the circuit breaker of the backend
+    Get the shared policy of a backend with getOutboundPolicy
+    """
+    # Exceptions which mean the backend could not be reached or did not answer in time
+    RETRYABLE_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    # Responses with these status codes are failures of the backend, not of the request
+    FAILURE_STATUS_CODES = (429, 500, 502, 503, 504)
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+    def __init__(self, name:str, connectTimeout:float, readTimeout:float, maxRetries:int=2, backoffFactor:float=0.5,
+                 maxBackoffSeconds:float=8, failureThreshold:int=5, resetTimeoutSeconds:float=30):
+        """
+        :param connectTimeout: Seconds to wait for the connection to the backend
+        :param readTimeout: Seconds to wait for the backend between bytes of its response
+        :param maxRetries: Times an idempotent call is retried after a failure
+        :param backoffFactor: The n-th retry waits backoffFactor * 2^(n-1) seconds (with jitter), at most maxBackoffSeconds
+        """
+        self.name = name
+        self.connectTimeout = connectTimeout
+        self.readTimeout = readTimeout
+        self.maxRetries = maxRetries
+        self.__backoffFactor = backoffFactor
+        self.__maxBackoffSeconds = maxBackoffSeconds
+        self.breaker = CircuitBreaker(name, failureThreshold, resetTimeoutSeconds)
+
+    def getTimeout(self) -> tuple[float, float]:
+        return self.connectTimeout, self.readTimeout
+
+    def __backoff(self, retryNo:int):
+        delay = min(self.__maxBackoffSeconds, self.__backoffFactor * (2 ** (retryNo - 1)))
+        time.sleep(delay * random.uniform(0.5, 1))
+
+    def __run(self, send, attempts:int, isFailure):
+        """
+        Makes the call up to `attempts` times through the circuit breaker, until it does not fail
+        If the breaker opens between attempts, the outcome of the last attempt is returned (or raised) instead
+        """
+        lastResult, lastError = None, None
+        for attempt in range(attempts):
+            if attempt > 0:
+                self.__backoff(attempt)
+
+            try:
+                self.breaker.beforeCall()
+            except CircuitOpenException:
+                if attempt == 0:
+                    raise
+                break
+
+            try:
+                lastResult, lastError = send(), None
+            except OutboundPolicy.RETRYABLE_EXCEPTIONS as e:
+                self.breaker.recordFailure()
+                lastResult, lastError = None, e
+                continue
+            except Exception:
+                self.breaker.recordFailure()
+                raise
+
+            if not isFailure(lastResult):
+                self.breaker.recordSuccess()
+                return lastResult
+            self.breaker.recordFailure()
+
+        if lastError is not None:
+            raise lastError
+        return lastResult
+
+    def call(self, func, *args, idempotent:bool=False, **kwargs):
+        """
+        Calls the function under the policy, it should pass getTimeout() (or readTimeout) on to the calls it makes
+        An exception raised by the function is a failure of the backend, the call is only retried if it is idempotent and
+        the exception is one of RETRYABLE_EXCEPTIONS
+        Raises CircuitOpenException without calling the function if the backend is considered down
+        """
+        attempts = self.maxRetries + 1 if idempotent else 1
+        return self.__run(lambda: func(*args, **kwargs), attempts, lambda result: False)
+
+    def request(self, method:str, url:str, session:requests.Session=None, retry:bool=True, **kwargs) -> requests.Response:
+        """
+        Makes the HTTP request under the policy, with the backend timeout unless the request sets its own
+        Requests with an idempotent method are retried on connection errors and on the FAILURE_STATUS_CODES responses,
+        set retry to false if the session already retries them
+        The response is returned whatever its status, a response with one of the FAILURE_STATUS_CODES counts as a failure
+        of the backend
+        Raises CircuitOpenException without making the request if the backend is considered down
+        """
+        kwargs.setdefault('timeout', self.getTimeout())
+        send = session.request if session is not None else requests.request
+        idempotent = retry and method.upper() in OutboundPolicy.IDEMPOTENT_METHODS
+        attempts = self.maxRetries + 1 if idempotent else 1
+        return self.__run(
+            lambda: send(method, url, **kwargs),
+            attempts,
+            lambda response: response.status_code in OutboundPolicy.FAILURE_STATUS_CODES
+        )
+
+
+class Backend:
+    PUSHBULLET = 'pushbullet'
+    CLOUDINARY = 'cloudinary'
+    LOCAL_MEME_STORAGE = 'localMemeStorage'
+
+
+# Timeouts of each backend, as (connect timeout, read timeout) in seconds
+BACKEND_TIMEOUTS = {
+    Backend.PUSHBULLET: (5, 30),
+    Backend.CLOUDINARY: (5, 60),
+    Backend.LOCAL_MEME_STORAGE: (2, 30),
+}
+DEFAULT_TIMEOUT = (5, 30)
+
+_policies = {}
+_policiesLock = threading.Lock()
+
+
+def getOutboundPolicy(backend:str) -> OutboundPolicy:
+    """
+    Returns the policy shared by all the calls to the backend, so they share its circuit breaker
+    """
+    with _policiesLock:
+        if backend not in _policies:
+            connectTimeout, readTimeout = BACKEND_TIMEOUTS.get(backend, DEFAULT_TIMEOUT)
+            _policies[backend] = OutboundPolicy(backend, connectTimeout, readTimeout)
+        return _policies[backend]
+
+
+def getBreakerStates() -> list[dict]:
+    """
+    Returns the state of the circuit breaker of every backend called so far, for monitoring
+    """
+    with _policiesLock:
+        policies = list(_policies.values())
+    return [policy.breaker.toDict() for policy in policies]
@@ -0,0 +1,57 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+    Lock that allows any number of concurrent readers or a single writer.
+    Writers are preferred: once a writer is waiting, new readers wait until it has finished,
+    so a steady stream of readers cannot starve writers.
+    The lock is not re-entrant, a thread holding it must not acquire it again.
+    """
+    def __init__(self):
+        self.__condition = threading.Condition(threading.Lock())
+        self.__activeReaders = 0
+        self.__writerActive = False
+        self.__waitingWriters = 0
+
+    def acquireRead(self):
+        with self.__condition:
+            while self.__writerActive or self.__waitingWriters > 0:
+                self.__condition.wait()
+            self.__activeReaders += 1
+
+    def releaseRead(self):
+        with self.__condition:
+            self.__activeReaders -= 1
+            if self.__activeReaders == 0:
+                self.__condition.notify_all()
+
+    def acquireWrite(self):
+        with self.__condition:
+            self.__waitingWriters += 1
+            while self.__writerActive or self.__activeReaders > 0:
+                self.__condition.wait()
+            self.__waitingWriters -= 1
+            self.__writerActive = True
+
+    def releaseWrite(self):
+        with self.__condition:
+            self.__writerActive = False
+            self.__condition.notify_all()
+
+    @contextmanager
+    def readLocked(self):
+        self.acquireRead()
+        try:
+            yield
+        finally:
+            self.releaseRead()
+
+    @contextmanager
+    def writeLocked(self):
+        self.acquireWrite()
+        try:
+            yield
+        finally:
+            self.releaseWrite()
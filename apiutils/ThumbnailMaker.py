@@ -1,10 +1,147 @@
 import base64
+import math
 from io import BytesIO
 from PIL import Image
 
+try:
+    # registers the AVIF format with Pillow, AVIF thumbnails can only be made with it
+    import pillow_avif
+except ImportError:
+    pillow_avif = None
+
 class ThumbnailMaker:
     DEFAULT_SIZE = (100, 100)
     DEFAULT_FORMAT = 'jpeg'
+    # Encoder options of the thumbnail formats, other formats are encoded with the defaults of Pillow
+    FORMAT_OPTIONS = {
+        'webp': {'quality': 75, 'method': 6},
+        'avif': {'quality': 60},
+    }
+    # Images are first reduced by an integer factor to no less than this many times the thumbnail size, which is cheap,
+    # and only then resampled to the thumbnail size. See the reducing_gap of Image.resize
+    REDUCING_GAP = 2.0
+    # Modes the thumbnail formats cannot store, converted to RGB
+    CONVERTED_MODES = ('1', 'RGBA', 'LA', 'P', 'PA', 'CMYK', 'I', 'F')
+
+    @staticmethod
+    def fitSize(imageSize:tuple[int, int], tbSize:tuple[int, int]) -> tuple[int, int]:
+        """
+        Returns the size of the thumbnail of an image of the given size, which fits in tbSize and keeps the aspect ratio
+        Images smaller than tbSize are not enlarged
+        """
+        width, height = imageSize
+        scale = min(1.0, tbSize[0] / width, tbSize[1] / height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    @staticmethod
+    def openReduced(imageBytes:bytes, tbSize:tuple[int, int]) -> Image.Image:
+        """
+        Opens the image reduced by an integer factor, to no less than REDUCING_GAP times the size of its thumbnail for tbSize,
+        and converted to a mode the thumbnail formats can store
+        Only the reduced image is converted, and JPEGs are not decoded at full size at all
+        """
+        image = Image.open(BytesIO(imageBytes))
+        fitWidth, fitHeight = ThumbnailMaker.fitSize(image.size, tbSize)
+        minWidth = math.ceil(fitWidth * ThumbnailMaker.REDUCING_GAP)
+        minHeight = math.ceil(fitHeight * ThumbnailMaker.REDUCING_GAP)
+
+        # JPEGs are decoded at the smallest scale (down to 1/8) that is still at least the minimum size, so most of the
+        # pixels are never decoded. This does nothing for other formats
+        image.draft(None, (minWidth, minHeight))
+
+        isBilevel = image.mode == '1'
+        if image.mode in ('P', 'PA'):
+            # the palette is expanded first, palette images cannot be reduced
+            image = image.convert('RGB')
+        elif isBilevel:
+            # bilevel images cannot be reduced either, they are reduced as grayscale and converted like the other modes after
+            image = image.convert('L')
+
+        factor = min(image.width // minWidth, image.height // minHeight)
+        if factor > 1:
+            image = image.reduce(factor)
+        if isBilevel:
+            return image.convert('RGB')
+        return ThumbnailMaker.toThumbnailMode(image)
+
+    @staticmethod
+    def toThumbnailMode(image:Image.Image) -> Image.Image:
+        if image.mode in ThumbnailMaker.CONVERTED_MODES:
+            return image.convert('RGB')
+        return image
+
+    @staticmethod
+    def resizeToFit(image:Image.Image, tbSize:tuple[int, int]) -> Image.Image:
+        """
+        Returns the image resized to fit in tbSize, see fitSize
+        """
+        size = ThumbnailMaker.fitSize(image.size, tbSize)
+        if size == image.size:
+            return image
+        return image.resize(size, Image.Resampling.BICUBIC)
+
+    @staticmethod
+    def isFormatSupported(tbFrmt:str) -> bool:
+        """
+        Returns true if Pillow can encode thumbnails in the format e.g. "webp" needs Pillow built with libwebp
+        """
+        Image.init()
+        return tbFrmt.upper() in Image.SAVE
+
+    @staticmethod
+    def makeVariantKey(tbSize:tuple[int, int], tbFrmt:str) -> str:
+        """
+        Returns the name of a thumbnail variant e.g. "200x200.webp"
+        """
+        return f'{tbSize[0]}x{tbSize[1]}.{tbFrmt.lower()}'
+
+    @staticmethod
+    def parseVariantKey(key:str) -> tuple[tuple[int, int], str]:
+        size, tbFrmt = key.split('.')
+        width, height = size.split('x')
+        return (int(width), int(height)), tbFrmt
+
+    @staticmethod
+    def selectVariant(keys, tbSize:tuple[int, int], tbFrmt:str) -> str:
+        """
+        Returns the key of the variant to serve for the requested size and format: the variant itself, otherwise the smallest
+        variant of the format which is at least as large. Returns None if there is no such variant
+        Keys of other variants, which are not sized thumbnails (e.g. the preview strip of a video), are ignored
+        """
+        candidates = []
+        for key in keys:
+            try:
+                size, frmt = ThumbnailMaker.parseVariantKey(key)
+            except ValueError:
+                continue
+            if frmt == tbFrmt.lower() and size[0] >= tbSize[0] and size[1] >= tbSize[1]:
+                candidates.append((size[0] * size[1], key))
+        return min(candidates)[1] if len(candidates) > 0 else None
+
+    @staticmethod
+    def encode(image:Image.Image, tbFrmt:str) -> bytes:
+        buffered = BytesIO()
+        image.save(buffered, format=tbFrmt, **ThumbnailMaker.FORMAT_OPTIONS.get(tbFrmt.lower(), {}))
+        return buffered.getvalue()
+
+    @staticmethod
+    def makeThumbnails(imageBytes:bytes, variants:list[tuple[tuple[int, int], str]]) -> dict[str, bytes]:
+        """
+        Makes the thumbnails of the image for each (size, format) variant, returning their bytes by variant key
+        The image is decoded once, reduced for the largest size, and each size is resized from it and encoded once per format
+        """
+        largestSize = (max(size[0] for size, _ in variants), max(size[1] for size, _ in variants))
+        image = ThumbnailMaker.openReduced(imageBytes, largestSize)
+
+        resized = {}
+        thumbnails = {}
+        for size, tbFrmt in variants:
+            size = tuple(size)
+            if size not in resized:
+                resized[size] = ThumbnailMaker.resizeToFit(image, size)
+            thumbnails[ThumbnailMaker.makeVariantKey(size, tbFrmt)] = ThumbnailMaker.encode(resized[size], tbFrmt)
+        return thumbnails
+
     @staticmethod
     def makeBase64Thumbnail(imageBytes:bytes, tbSize=None, tbFrmt=None) -> str:
         if tbSize is None:
@@ -12,15 +149,9 @@ class ThumbnailMaker:
         if tbFrmt is None:
             tbFrmt = ThumbnailMaker.DEFAULT_FORMAT
 
-        image = Image.open(BytesIO(imageBytes))
-
-        if image.mode in ("RGBA", "P"):
-            image = image.convert("RGB")
+        image = ThumbnailMaker.resizeToFit(ThumbnailMaker.openReduced(imageBytes, tbSize), tbSize)
 
-        image.thumbnail(tbSize)
         buffered = BytesIO()
         image.save(buffered, format=tbFrmt)
         img_str = base64.b64encode(buffered.getvalue())
         return img_str.decode()
-
-
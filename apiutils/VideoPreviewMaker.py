@@ -0,0 +1,223 @@
+import os
+import subprocess
+import tempfile
+import threading
+from io import BytesIO
+
+from PIL import Image, ImageSequence, ImageStat, features
+
+from apiutils.ThumbnailMaker import ThumbnailMaker
+
+
+class VideoPreviewException(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class VideoPreview:
+    """
+    The result of VideoPreviewMaker.makePreview
+    """
+    def __init__(self, frameBytes:bytes, stripBytes:bytes=None):
+        # The most informative sampled frame as PNG, to make the thumbnail of the video from
+        self.frameBytes = frameBytes
+        # The sampled frames as an animated WebP, None if it was not made
+        self.stripBytes = stripBytes
+
+
+class VideoPreviewMaker:
+    """
+    Makes the preview of a video with ffmpeg, instead of using its first frame (which is often black)
+    - ffmpeg reads the video itself (from a URL or a path) and samples `frameCount` frames spread over the video in one pass,
+      writing them downscaled to its output as a stream of PPM images, so the video is never loaded into memory here
+    - The frame with the highest variance of its luminance (the least uniform frame) is picked for the thumbnail
+    - The sampled frames can also be made into a tiny animated WebP preview strip
+    Animated images (e.g. GIFs) get the same preview from `frameCount` of their frames, which are decoded by Pillow
+    since the image is downloaded anyway
+    """
+    DEFAULT_FRAME_COUNT = 8
+    # The sampled frames are downscaled to fit in this size, large enough for every thumbnail variant
+    FRAME_SIZE = (480, 480)
+    STRIP_SIZE = (160, 160)
+    STRIP_FRAME_DURATION_MS = 400
+    STRIP_QUALITY = 50
+    # Only the start of long videos is sampled, so a long video does not have to be decoded to the end
+    MAX_SAMPLED_SECONDS = 120
+    TIMEOUT_SECONDS = 60
+    MAX_ERROR_LENGTH = 500
+    # The variant key the preview strip is stored under with the thumbnail variants of a meme
+    STRIP_VARIANT_KEY = 'preview.webp'
+
+    def __init__(self, ffmpegPath:str='ffmpeg', frameCount:int=DEFAULT_FRAME_COUNT):
+        """
+        :param ffmpegPath: The ffmpeg executable, ffprobe is expected next to it
+        """
+        self.ffmpegPath = ffmpegPath
+        ffmpegDir, ffmpegName = os.path.split(ffmpegPath)
+        self.ffprobePath = os.path.join(ffmpegDir, ffmpegName.replace('ffmpeg', 'ffprobe'))
+        self.frameCount = max(1, frameCount)
+
+    @staticmethod
+    def canMakeStrip() -> bool:
+        return features.check('webp_anim')
+
+    @staticmethod
+    def __start(args:list[str], errorFile) -> tuple[subprocess.Popen, threading.Timer]:
+        """
+        Starts the process and a timer which kills it after TIMEOUT_SECONDS, cancel the timer once the process exits
+        The output is read while the process runs, so the timeout cannot be passed to communicate or wait
+        The errors are written to the given file rather than a pipe, since a pipe which is only read after the output would
+        block the process once it is full
+        """
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=errorFile)
+        killTimer = threading.Timer(VideoPreviewMaker.TIMEOUT_SECONDS, process.kill)
+        killTimer.daemon = True
+        killTimer.start()
+        return process, killTimer
+
+    def getDuration(self, source:str) -> float:
+        """
+        Returns the duration of the video in seconds, None if ffprobe cannot tell it
+        """
+        process, killTimer = VideoPreviewMaker.__start(
+            [self.ffprobePath, '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', source],
+            subprocess.DEVNULL
+        )
+        out, _ = process.communicate()
+        killTimer.cancel()
+        try:
+            duration = float(out.decode().strip())
+        except ValueError:
+            return None
+        return duration if duration > 0 else None
+
+    @staticmethod
+    def __readPPMFrame(stream) -> Image.Image:
+        """
+        Reads the next PPM image written by ffmpeg ("P6\\n<width> <height>\\n<max value>\\n" and the RGB bytes)
+        Returns None at the end of the stream
+        """
+        magic = stream.readline()
+        if magic == b'':
+            return None
+        if magic.strip() != b'P6':
+            raise VideoPreviewException('Unexpected output from ffmpeg')
+
+        width, height = (int(dim) for dim in stream.readline().split())
+        stream.readline()
+        pixels = stream.read(width * height * 3)
+        if len(pixels) != width * height * 3:
+            return None
+        return Image.frombytes('RGB', (width, height), pixels)
+
+    def sampleFrames(self, source:str) -> list[Image.Image]:
+        """
+        Returns frames sampled evenly over the video, in one ffmpeg pass over it
+        :param source: The URL or path of the video, read by ffmpeg
+        """
+        duration = self.getDuration(source)
+        sampledSeconds = min(duration, VideoPreviewMaker.MAX_SAMPLED_SECONDS) if duration is not None else None
+        # without a duration, a frame is sampled every second from the start
+        fps = self.frameCount / sampledSeconds if sampledSeconds is not None else 1
+        width, height = VideoPreviewMaker.FRAME_SIZE
+
+        args = [
+            self.ffmpegPath, '-hide_banner', '-loglevel', 'error', '-t', str(VideoPreviewMaker.MAX_SAMPLED_SECONDS),
+            '-i', source, '-an', '-sn',
+            '-vf', f'fps={fps:.6f},scale={width}:{height}:force_original_aspect_ratio=decrease',
+            '-frames:v', str(self.frameCount), '-f', 'image2pipe', '-c:v', 'ppm', 'pipe:1'
+        ]
+        frames = []
+        with tempfile.TemporaryFile() as errorFile:
+            process, killTimer = VideoPreviewMaker.__start(args, errorFile)
+            try:
+                while True:
+                    frame = VideoPreviewMaker.__readPPMFrame(process.stdout)
+                    if frame is None:
+                        break
+                    frames.append(frame)
+            finally:
+                process.stdout.close()
+                process.wait()
+                killTimer.cancel()
+
+            if len(frames) == 0:
+                errorFile.seek(0)
+                # the last errors explain why ffmpeg stopped
+                errors = errorFile.read().decode(errors='replace').strip()[-VideoPreviewMaker.MAX_ERROR_LENGTH:]
+                raise VideoPreviewException(f'ffmpeg did not output any frames: {errors}')
+        return frames
+
+    @staticmethod
+    def isAnimated(imageBytes:bytes) -> bool:
+        """
+        Returns true if the image has several frames, e.g. an animated GIF. Only the header of the image is read
+        """
+        try:
+            with Image.open(BytesIO(imageBytes)) as image:
+                return getattr(image, 'n_frames', 1) > 1
+        except Exception:
+            return False
+
+    def sampleAnimationFrames(self, imageBytes:bytes) -> list[Image.Image]:
+        """
+        Returns frames sampled evenly over the animated image, downscaled to fit in FRAME_SIZE
+        """
+        frames = []
+        with Image.open(BytesIO(imageBytes)) as image:
+            frameCount = min(self.frameCount, image.n_frames)
+            sampled = {frameNo * image.n_frames // frameCount for frameNo in range(frameCount)}
+            # the frames of GIFs are deltas of the previous ones, so they are decoded in order
+            for frameNo, frame in enumerate(ImageSequence.Iterator(image)):
+                if frameNo in sampled:
+                    frames.append(ThumbnailMaker.resizeToFit(frame.convert('RGB'), VideoPreviewMaker.FRAME_SIZE))
+                    if len(frames) == len(sampled):
+                        break
+        return frames
+
+    @staticmethod
+    def getFrameScore(frame:Image.Image) -> float:
+        """
+        Returns how informative the frame is, the variance of its luminance. Black, white and faded frames score low
+        """
+        return ImageStat.Stat(frame.convert('L')).var[0]
+
+    @staticmethod
+    def makeStrip(frames:list[Image.Image]) -> bytes:
+        """
+        Returns the frames as an animated WebP, downscaled to fit in STRIP_SIZE
+        """
+        stripFrames = [ThumbnailMaker.resizeToFit(frame, VideoPreviewMaker.STRIP_SIZE) for frame in frames]
+        buffered = BytesIO()
+        stripFrames[0].save(
+            buffered, format='webp', save_all=True, append_images=stripFrames[1:],
+            duration=VideoPreviewMaker.STRIP_FRAME_DURATION_MS, loop=0, quality=VideoPreviewMaker.STRIP_QUALITY
+        )
+        return buffered.getvalue()
+
+    def makePreview(self, source:str, makeStrip:bool=True) -> VideoPreview:
+        """
+        Samples the frames of the video and returns its most informative frame, and the preview strip if makeStrip is true
+        (and Pillow can make animated WebPs)
+        """
+        return VideoPreviewMaker.__makePreviewFromFrames(self.sampleFrames(source), makeStrip)
+
+    def makeAnimationPreview(self, imageBytes:bytes, makeStrip:bool=True) -> VideoPreview:
+        """
+        Same as makePreview, for an animated image (see isAnimated)
+        """
+        return VideoPreviewMaker.__makePreviewFromFrames(self.sampleAnimationFrames(imageBytes), makeStrip)
+
+    @staticmethod
+    def __makePreviewFromFrames(frames:list[Image.Image], makeStrip:bool) -> VideoPreview:
+        bestFrame = max(frames, key=VideoPreviewMaker.getFrameScore)
+
+        # PNG, so the frame is not compressed twice before it is made into the thumbnail
+        buffered = BytesIO()
+        bestFrame.save(buffered, format='png')
+
+        stripBytes = None
+        if makeStrip and VideoPreviewMaker.canMakeStrip():
+            stripBytes = VideoPreviewMaker.makeStrip(frames)
+        return VideoPreview(buffered.getvalue(), stripBytes)
@@ -3,10 +3,16 @@ import os
 from apiutils.FileStorage.JSONDBFileStorageInterface import JSONDBFileStorageInterface
 from apiutils.FileStorage.PBFSFileStorage import PBFSFileStorage
 from apiutils.FileStorage.LocalFileStorage import LocalFileStorage
+from apiutils.FileStorage.ThumbnailFileStorageInterface import ThumbnailFileStorageInterface
+from apiutils.FileStorage.LocalThumbnailStorage import LocalThumbnailStorage
+from apiutils.FileStorage.PBFSThumbnailStorage import PBFSThumbnailStorage
 from apiutils.MemeManagement.MemeLibrary import MemeLibrary
 from apiutils.MemeManagement.MemeStorageInterface import MemeStorageInterface
 from apiutils.MemeStorage.CloudinaryMemeStorage import CloudinaryMemeStorage
-from apiutils.configs.ServerConfig import ServerConfig, JSONDBFileStorageOption, MemeStorageOption
+from apiutils.ThumbnailMaker import ThumbnailMaker
+from apiutils.VideoPreviewMaker import VideoPreviewMaker
+from apiutils.configs.ServerConfig import ServerConfig, JSONDBFileStorageOption, MemeStorageOption, \
+    ThumbnailStorageOption
 from localMemeStorageServer.utils.LocalStorageUtils import makeLocalMemeStorage
 
 
@@ -14,11 +20,65 @@ def getServerFileStorage() -> JSONDBFileStorageInterface:
     if ServerConfig.JSON_DB_FILE_STORAGE == JSONDBFileStorageOption.LOCAL:
         return LocalFileStorage()
     elif ServerConfig.JSON_DB_FILE_STORAGE == JSONDBFileStorageOption.PBFS:
-        return PBFSFileStorage(ServerConfig.PBFS_ACCESS_TOKEN, ServerConfig.PBFS_SERVER_IDENTIFIER)
+        return PBFSFileStorage(ServerConfig.PBFS_ACCESS_TOKEN, ServerConfig.PBFS_SERVER_IDENTIFIER,
+                               asyncClient=ServerConfig.PBFS_ASYNC_CLIENT, codecOption=ServerConfig.JSON_DB_CODEC)
     else:
         raise Exception(f'Unrecognized file storage: "{ServerConfig.JSON_DB_FILE_STORAGE}"')
 
 
+def getServerThumbnailStorage(fileStorage:JSONDBFileStorageInterface) -> ThumbnailFileStorageInterface:
+    """
+    Returns the thumbnail storage for the server, None if thumbnails are stored inline in the JSON DB
+    The PBFS thumbnail storage shares the file server of the JSON DB file storage when it is also PBFS
+    """
+    if ServerConfig.THUMBNAIL_STORAGE == ThumbnailStorageOption.NONE:
+        return None
+    elif ServerConfig.THUMBNAIL_STORAGE == ThumbnailStorageOption.LOCAL:
+        return LocalThumbnailStorage()
+    elif ServerConfig.THUMBNAIL_STORAGE == ThumbnailStorageOption.PBFS:
+        if isinstance(fileStorage, PBFSFileStorage):
+            return PBFSThumbnailStorage(fileStorage.getFileServer())
+        return PBFSThumbnailStorage(PBFSFileStorage(ServerConfig.PBFS_ACCESS_TOKEN, ServerConfig.PBFS_SERVER_IDENTIFIER).getFileServer())
+    else:
+        raise Exception(f'Unrecognized thumbnail storage: "{ServerConfig.THUMBNAIL_STORAGE}"')
+
+
+def getServerThumbnailVariants() -> list[tuple[tuple[int, int], str]]:
+    """
+    Returns the (size, format) thumbnail variants configured for the server, every variant size in every variant format
+    Formats Pillow cannot encode are left out
+    """
+    formats = []
+    for tbFrmt in ServerConfig.THUMBNAIL_VARIANT_FORMATS:
+        if ThumbnailMaker.isFormatSupported(tbFrmt):
+            formats.append(tbFrmt)
+        else:
+            print(f'Thumbnail variants in the "{tbFrmt}" format are not made, Pillow cannot encode it')
+
+    return [((size, size), tbFrmt) for size in ServerConfig.THUMBNAIL_VARIANT_SIZES for tbFrmt in formats]
+
+
+def getServerVideoPreviewMaker() -> VideoPreviewMaker:
+    """
+    Returns the video preview maker for the server, None if the thumbnails of videos are made from their first frame
+    """
+    if ServerConfig.VIDEO_PREVIEW_FRAMES <= 0:
+        return None
+    return VideoPreviewMaker(ffmpegPath=ServerConfig.FFMPEG_PATH, frameCount=ServerConfig.VIDEO_PREVIEW_FRAMES)
+
+
+def getServerSearchIndexDir() -> str:
+    """
+    Returns the absolute path of the directory the search index is persisted to, None if the index is kept in memory
+    Relative paths are resolved from the project root
+    """
+    if ServerConfig.SEARCH_INDEX_DIR == '':
+        return None
+    if os.path.isabs(ServerConfig.SEARCH_INDEX_DIR):
+        return ServerConfig.SEARCH_INDEX_DIR
+    return ServerConfig.path(ServerConfig.SEARCH_INDEX_DIR)
+
+
 def getServerMemeStorage() -> MemeStorageInterface:
     if ServerConfig.MEME_STORAGE == MemeStorageOption.LOCAL:
         return makeLocalMemeStorage()
@@ -16,6 +16,17 @@ class JSONDBFileStorageOption(Enum):
     LOCAL = 'local'
     PBFS = 'pbfs'
 
+class JSONDBCodecOption(Enum):
+    JSON = 'json'
+    COMPACT = 'compact'
+    GZIP = 'gzip'
+    ZSTD = 'zstd'
+
+class ThumbnailStorageOption(Enum):
+    NONE = 'none'
+    LOCAL = 'local'
+    PBFS = 'pbfs'
+
 class ProjectEnvironment(Enum):
     PROD = 'production'
     DEV = 'development'
@@ -55,12 +66,45 @@ class ServerConfig:
     # The file storage being used for the JSON DB, either PushBullet or PBFS
     JSON_DB_FILE_STORAGE = JSONDBFileStorageOption.PBFS
 
+    # Where meme thumbnails are stored, either local or PBFS. If none, thumbnails are stored inline in the JSON DB
+    THUMBNAIL_STORAGE = ThumbnailStorageOption.NONE
+
+    # Directory the search index is persisted to, so it is only rebuilt when the database has changed. If empty, the index
+    # is built in memory on every start. With the PBFS file storage, an archive of the index is also kept next to the DB
+    SEARCH_INDEX_DIR = ''
+
     # The access token for the PushBullet account
     PBFS_ACCESS_TOKEN = ''
 
     # The server identifier for the device used in PushBullet as the PBFS
     PBFS_SERVER_IDENTIFIER = ''
 
+    # The format the JSON DB is stored in by the PBFS file storage, see JSONCodec. Files are read in any of the formats
+    JSON_DB_CODEC = JSONDBCodecOption.GZIP
+
+    # If greater than 0, changes from the API are written to the database at most once per this many seconds (and on exit)
+    # instead of on every request. A crash loses at most this many seconds of changes
+    DB_FLUSH_INTERVAL_SECONDS = 0.0
+
+    # If greater than 0, memes added through the API get their thumbnail made in the background by this many worker threads
+    # and the API responds before the thumbnail is ready. Only use on long-running servers, not serverless functions which
+    # may be frozen after the response
+    THUMBNAIL_WORKERS = 0
+
+    # Sizes (the largest width and height in pixels) and formats of the thumbnail variants made with the thumbnail of each
+    # meme, every size is made in every format. Variants are only stored with a thumbnail storage (THUMBNAIL_STORAGE)
+    THUMBNAIL_VARIANT_SIZES = []
+    THUMBNAIL_VARIANT_FORMATS = ['webp']
+
+    # If greater than 0, the thumbnails of videos and animated images are made from the most informative of this many sampled
+    # frames instead of their first frame, and a preview strip of the frames is stored with the thumbnail variants. Videos
+    # are sampled by ffmpeg and ffprobe, which are not available on serverless deployments
+    VIDEO_PREVIEW_FRAMES = 0
+    FFMPEG_PATH = 'ffmpeg'
+
+    # If true, the PBFS file storage uses the async PushBullet client, which overlaps independent PushBullet calls
+    PBFS_ASYNC_CLIENT = False
+
     # The list of access tokens used by the server for privileged activity.
     ALLOWED_ACCESS_TOKENS = []
 
@@ -75,8 +119,18 @@ class ServerConfig:
             'MEME_DB': ServerConfig.MEME_DB,
             'MEME_STORAGE': ServerConfig.MEME_STORAGE,
             'JSON_DB_FILE_STORAGE': ServerConfig.JSON_DB_FILE_STORAGE,
+            'THUMBNAIL_STORAGE': ServerConfig.THUMBNAIL_STORAGE,
+            'SEARCH_INDEX_DIR': ServerConfig.SEARCH_INDEX_DIR,
             'PBFS_ACCESS_TOKEN': ServerConfig.PBFS_ACCESS_TOKEN,
             'PBFS_SERVER_IDENTIFIER': ServerConfig.PBFS_SERVER_IDENTIFIER,
+            'PBFS_ASYNC_CLIENT': ServerConfig.PBFS_ASYNC_CLIENT,
+            'DB_FLUSH_INTERVAL_SECONDS': ServerConfig.DB_FLUSH_INTERVAL_SECONDS,
+            'THUMBNAIL_WORKERS': ServerConfig.THUMBNAIL_WORKERS,
+            'THUMBNAIL_VARIANT_SIZES': ServerConfig.THUMBNAIL_VARIANT_SIZES,
+            'THUMBNAIL_VARIANT_FORMATS': ServerConfig.THUMBNAIL_VARIANT_FORMATS,
+            'VIDEO_PREVIEW_FRAMES': ServerConfig.VIDEO_PREVIEW_FRAMES,
+            'FFMPEG_PATH': ServerConfig.FFMPEG_PATH,
+            'JSON_DB_CODEC': ServerConfig.JSON_DB_CODEC,
             'ALLOWED_ACCESS_TOKENS': ServerConfig.ALLOWED_ACCESS_TOKENS
         }
 
@@ -92,8 +146,18 @@ class ServerConfig:
             'MEME_DB': False,
             'MEME_STORAGE': False,
             'JSON_DB_FILE_STORAGE': False,
+            'THUMBNAIL_STORAGE': False,
+            'SEARCH_INDEX_DIR': False,
             'PBFS_ACCESS_TOKEN': True,
             'PBFS_SERVER_IDENTIFIER': True,
+            'PBFS_ASYNC_CLIENT': False,
+            'DB_FLUSH_INTERVAL_SECONDS': False,
+            'THUMBNAIL_WORKERS': False,
+            'THUMBNAIL_VARIANT_SIZES': False,
+            'THUMBNAIL_VARIANT_FORMATS': False,
+            'VIDEO_PREVIEW_FRAMES': False,
+            'FFMPEG_PATH': False,
+            'JSON_DB_CODEC': False,
             'ALLOWED_ACCESS_TOKENS': True
         }
 
@@ -101,6 +165,7 @@ class ServerConfig:
     def setConfigFromEnvDict(env: dict):
         # These are the expected keys for the config variables either in JSON or with environment variables
         # Multiple access tokens (for allowedAccessTokens) are separated with a semicolon e.g. "token1;token2"
+        # So are the thumbnail variant sizes and formats e.g. "200;400" and "webp;jpeg"
         projEnv = env.get('RMSVR_PROJECT_ENVIRONMENT')
         cloudName = env.get('RMSVR_CLOUDINARY_CLOUD_NAME')
         apiKey = env.get('RMSVR_CLOUDINARY_API_KEY')
@@ -108,8 +173,18 @@ class ServerConfig:
         memeDB = env.get('RMSVR_MEME_DB')
         memeStorage = env.get('RMSVR_MEME_STORAGE')
         dbFileStorage = env.get('RMSVR_JSON_DB_FILE_STORAGE')
+        thumbnailStorage = env.get('RMSVR_THUMBNAIL_STORAGE')
+        searchIndexDir = env.get('RMSVR_SEARCH_INDEX_DIR')
         pbfsAccessToken = env.get('RMSVR_PBFS_ACCESS_TOKEN')
         pbfsServerIden = env.get('RMSVR_PBFS_SERVER_IDENTIFIER')
+        pbfsAsyncClient = env.get('RMSVR_PBFS_ASYNC_CLIENT')
+        dbFlushInterval = env.get('RMSVR_DB_FLUSH_INTERVAL_SECONDS')
+        thumbnailWorkers = env.get('RMSVR_THUMBNAIL_WORKERS')
+        thumbnailVariantSizes = env.get('RMSVR_THUMBNAIL_VARIANT_SIZES')
+        thumbnailVariantFormats = env.get('RMSVR_THUMBNAIL_VARIANT_FORMATS')
+        videoPreviewFrames = env.get('RMSVR_VIDEO_PREVIEW_FRAMES')
+        ffmpegPath = env.get('RMSVR_FFMPEG_PATH')
+        jsonDBCodec = env.get('RMSVR_JSON_DB_CODEC')
         allowedAccessTokens = env.get('RMSVR_ALLOWED_ACCESS_TOKENS')
 
         if projEnv is not None:
@@ -134,12 +209,42 @@ class ServerConfig:
             ServerConfig.JSON_DB_FILE_STORAGE = getTypeForValString(JSONDBFileStorageOption,
                                                                 dbFileStorage)
 
+        if thumbnailStorage is not None:
+            ServerConfig.THUMBNAIL_STORAGE = getTypeForValString(ThumbnailStorageOption, thumbnailStorage)
+
+        if searchIndexDir is not None:
+            ServerConfig.SEARCH_INDEX_DIR = searchIndexDir
+
         if pbfsAccessToken is not None:
             ServerConfig.PBFS_ACCESS_TOKEN = pbfsAccessToken
 
         if pbfsServerIden is not None:
             ServerConfig.PBFS_SERVER_IDENTIFIER = pbfsServerIden
 
+        if pbfsAsyncClient is not None:
+            ServerConfig.PBFS_ASYNC_CLIENT = str(pbfsAsyncClient).lower() == 'true'
+
+        if dbFlushInterval is not None:
+            ServerConfig.DB_FLUSH_INTERVAL_SECONDS = float(dbFlushInterval)
+
+        if thumbnailWorkers is not None:
+            ServerConfig.THUMBNAIL_WORKERS = int(thumbnailWorkers)
+
+        if thumbnailVariantSizes is not None:
+            ServerConfig.THUMBNAIL_VARIANT_SIZES = [int(size) for size in thumbnailVariantSizes.split(';') if size.strip() != '']
+
+        if thumbnailVariantFormats is not None:
+            ServerConfig.THUMBNAIL_VARIANT_FORMATS = [frmt.strip().lower() for frmt in thumbnailVariantFormats.split(';') if frmt.strip() != '']
+
+        if videoPreviewFrames is not None:
+            ServerConfig.VIDEO_PREVIEW_FRAMES = int(videoPreviewFrames)
+
+        if ffmpegPath is not None:
+            ServerConfig.FFMPEG_PATH = ffmpegPath
+
+        if jsonDBCodec is not None:
+            ServerConfig.JSON_DB_CODEC = getTypeForValString(JSONDBCodecOption, jsonDBCodec)
+
         if pbfsAccessToken is not None:
             ServerConfig.PBFS_ACCESS_TOKEN = pbfsAccessToken
 
@@ -195,7 +300,11 @@ class ServerConfig:
         props['MEME_DB'] =  props['MEME_DB'].value
         props['MEME_STORAGE'] =  props['MEME_STORAGE'].value
         props['JSON_DB_FILE_STORAGE'] =  props['JSON_DB_FILE_STORAGE'].value
+        props['THUMBNAIL_STORAGE'] =  props['THUMBNAIL_STORAGE'].value
+        props['JSON_DB_CODEC'] =  props['JSON_DB_CODEC'].value
         props['ALLOWED_ACCESS_TOKENS'] = ','.join(props['ALLOWED_ACCESS_TOKENS'])
+        props['THUMBNAIL_VARIANT_SIZES'] = ';'.join(str(size) for size in props['THUMBNAIL_VARIANT_SIZES'])
+        props['THUMBNAIL_VARIANT_FORMATS'] = ';'.join(props['THUMBNAIL_VARIANT_FORMATS'])
         jsonDict = dict()
         for ky in props:
             jsonDict[f'RMSVR_{ky}'] = props[ky]
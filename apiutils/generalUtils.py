@@ -4,21 +4,24 @@ import os
 import requests
 
 from apiutils.FileStorage.PBFSFileStorage import PBFSFileStorage
+from apiutils.FileStorage.PBFSMetadataCache import PBFSMetadataCache
+from apiutils.FileStorage.PushBulletFileServer import PushBulletFileServer
 from apiutils.FileStorage.LocalFileStorage import LocalFileStorage
 from apiutils.MemeDB.JSONMemeDB import JSONMemeDB
-from apiutils.configs.ServerConfig import ServerConfig
+from apiutils.configs.ServerConfig import ServerConfig, ThumbnailStorageOption
+from apiutils.configs.ServerComponents import getServerFileStorage, getServerThumbnailStorage
 from localMemeStorageServer.utils.LocalStorageUtils import makeLocalMemeStorage
 
 def getServerName(serverIden):
-    # make request
-    res = requests.get('https://api.pushbullet.com/v2/devices',
-                       headers={'Access-Token': ServerConfig.PBFS_ACCESS_TOKEN})
-    devices = res.json()['devices']
-    foundNames = [ d['nickname'] for d in devices if d['iden'] == serverIden]
-    if len(foundNames) < 1:
+    # uses the same device cache as the PBFS file storage, so the devices are not listed on every call
+    metadataCache = PBFSMetadataCache(PBFSMetadataCache.makeDefaultFilePath(ServerConfig.PBFS_ACCESS_TOKEN))
+    pbfs = PushBulletFileServer(ServerConfig.PBFS_ACCESS_TOKEN, index={}, metadataCache=metadataCache)
+    device = pbfs.getPBFSDevice(iden=serverIden)
+    if device is None:
         raise Exception('No identifier found!')
 
-    return foundNames[0]
+    return device['nickname']
+
 def uploadLocalJSONDBToPBFS(serverIdentifier:str = ServerConfig.PBFS_SERVER_IDENTIFIER):
     """
     Saves data/db.json into PBFS so it matches
@@ -31,10 +34,14 @@ def uploadLocalJSONDBToPBFS(serverIdentifier:str = ServerConfig.PBFS_SERVER_IDEN
         return
 
     pbfs = PBFSFileStorage(ServerConfig.PBFS_ACCESS_TOKEN, serverIdentifier)
-    lcfs = LocalFileStorage()
-    db = lcfs.getJSONDB()
+    localDB = JSONMemeDB(LocalFileStorage())
+    localDB.loadDB()
+    db = localDB.getDBSnapshot()
     print('Writing data/db.json')
-    pbfs.writeJSONDB(db)
+    with pbfs.batch():
+        pbfs.writeJSONDB(db)
+        # The uploaded snapshot replaces the cloud database, so its log no longer applies
+        pbfs.truncateJSONDBLog()
     print('Done')
 
 def downloadPBFSJSONDBToLocal(serverIdentifier:str = ServerConfig.PBFS_SERVER_IDENTIFIER):
@@ -46,10 +53,28 @@ def downloadPBFSJSONDBToLocal(serverIdentifier:str = ServerConfig.PBFS_SERVER_ID
     if res != 'y':
         print('Exited!')
         return
-    pbfs = PBFSFileStorage(ServerConfig.PBFS_ACCESS_TOKEN, serverIdentifier)
+    cloudDB = JSONMemeDB(PBFSFileStorage(ServerConfig.PBFS_ACCESS_TOKEN, serverIdentifier))
+    cloudDB.loadDB()
     lcfs = LocalFileStorage()
-    db = pbfs.getJSONDB()
-    lcfs.writeJSONDB(db)
+    lcfs.writeJSONDB(cloudDB.getDBSnapshot())
+    lcfs.truncateJSONDBLog()
+
+def moveThumbnailsToThumbnailStorage():
+    """
+    Moves the thumbnails stored inline in the server's JSON DB into the configured thumbnail storage (RMSVR_THUMBNAIL_STORAGE)
+    """
+    if ServerConfig.THUMBNAIL_STORAGE == ThumbnailStorageOption.NONE:
+        print('No thumbnail storage is configured!')
+        return
+
+    fileStorage = getServerFileStorage()
+    memeDB = JSONMemeDB(fileStorage, thumbnailStorage=getServerThumbnailStorage(fileStorage))
+    memeDB.loadDB()
+    print('Moving thumbnails...')
+    moved = memeDB.moveThumbnailsToStorage()
+    print(f'Moved {moved} thumbnails, writing DB...')
+    memeDB.compactDB()
+    print('Done')
 
 def downloadNewMemesFromCloud(jsonDB:JSONMemeDB):
     cloudMapPath = ServerConfig.path('localMemeStorageServer', 'storage', 'cloudMap.json')
@@ -2,9 +2,8 @@ import json
 import os
 import socket
 
-import requests
-
 from os.path import join
+from apiutils.OutboundPolicy import Backend, getOutboundPolicy
 from apiutils.configs.ServerConfig import ServerConfig, MemeStorageOption
 
 def get_ip():
@@ -74,7 +73,7 @@ def getLocalVersionForCloudMeme(cloudID:str, cloudURL:str, fileExt:str) -> tuple
     print(f'Downloading {cloudID} to local repository ({cloudURL})')
 
     # download the meme from cloudinary
-    resp = requests.get(cloudURL)
+    resp = getOutboundPolicy(Backend.CLOUDINARY).request('GET', cloudURL)
     if not resp.ok:
         raise Exception('Failed URL request!')
 
@@ -13,6 +13,7 @@ if project_dir not in sys.path:
 
 from apiutils.configs.ServerConfig import ServerConfig
 from apiutils.FileStorage.PBFSFileStorage import PBFSFileStorage
+from apiutils.MemeDB.JSONMemeDB import JSONMemeDB
 from apiutils.generalUtils import getServerName
 
 PROD_ENV_JSON = "C:\\Users\\omnic\\OneDrive\\Computer Collection\\Reaction Meme Server\\config_jsons\\prodenv.json"
@@ -85,7 +86,11 @@ def main():
         log_info(
             f'Connected to PBFS File Storage: accessToken={accessToken}, serverIdentifier={serverIden} ({getServerName(serverIden)})')
         log_info('Downloading JSON DB...')
-        db = pbfs.getJSONDB()
+        # Load through the meme DB so the changes in the DB log are included in the backup
+        memeDB = JSONMemeDB(pbfs)
+        if not memeDB.loadDB():
+            raise Exception('Could not load the JSON DB')
+        db = memeDB.getDBSnapshot()
         log_info('DB Downloaded Successfully...')
 
         save_path = os.path.join(BACKUP_DIR, make_backup_name())
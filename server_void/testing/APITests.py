@@ -1,3 +1,4 @@
+import base64
 import os
 from random import randint
 from unittest import TestCase
@@ -49,6 +50,7 @@ class APITests(TestCase):
         # Reset our test DB
         with open(ServerConfig.path('data/testing_db.json'), 'w') as file:
             json.dump(APITests.REFERENCE_PROD_DB, file, indent=4)
+        TestMemeDB.getInstance().clearLog()
 
         # Reset the server to use the prod db
         resp = requests.get(APITests.makeServerRoute('admin/reset'), headers=self.make_acc_token_header())
@@ -190,6 +192,61 @@ class APITests(TestCase):
         self.assertTrue(resp.ok)
         self.check_meme_info_from_server(memeID, resp.json()['payload'])
 
+    def test_api_get_memes(self):
+        tdb = TestMemeDB.getInstance()
+        tdb.loadDB()
+        infoRoute = APITests.makeServerRoute('info')
+
+        # ids is required and must be a list of IDs
+        resp = requests.post(infoRoute, json={})
+        self.assertEqual(400, resp.status_code)
+        resp = requests.post(infoRoute, json={'ids': ['abc']})
+        self.assertEqual(400, resp.status_code)
+
+        memeIDs = [APITests.getRandomMeme(), APITests.getRandomMeme()]
+        missingID = tdb.getNextID() + 1000
+        resp = requests.post(infoRoute, json={'ids': memeIDs + [missingID]})
+        self.assertTrue(resp.ok)
+
+        payload = resp.json()['payload']
+        self.assertEqual([missingID], payload['missing'])
+        self.assertEqual(memeIDs, [res['id'] for res in payload['results']], msg='Results are in the order of the requested IDs')
+        for res in payload['results']:
+            self.check_meme_info_from_server(res['id'], res)
+
+    def test_api_meme_thumbnail(self):
+        tdb = TestMemeDB.getInstance()
+        tdb.loadDB()
+        self.meme_id_route_checks(APITests.makeServerRoute('thumbnail'))
+
+        memeID = APITests.getRandomMeme()
+        resp = requests.get(APITests.makeServerRoute(f'thumbnail/{memeID}'))
+        self.assertTrue(resp.ok)
+        self.assertEqual(base64.b64decode(tdb.get(memeID, thumbnail=True)), resp.content, msg='Thumbnail bytes match')
+        self.assertTrue('ETag' in resp.headers)
+        self.assertTrue('max-age' in resp.headers.get('Cache-Control', ''))
+
+        with self.subTest('Conditional Request'):
+            resp = requests.get(APITests.makeServerRoute(f'thumbnail/{memeID}'), headers={'If-None-Match': resp.headers['ETag']})
+            self.assertEqual(304, resp.status_code)
+
+    def check_thumbnail_modes(self, baseRoute):
+        # Check the thumbnails URL parameter on routes that return lists of memes
+        resp = requests.get(f'{baseRoute}&thumbnails=abc')
+        self.assertEqual(400, resp.status_code, msg='Testing unknown thumbnails option is rejected')
+
+        resp = requests.get(f'{baseRoute}&thumbnails=url')
+        self.assertTrue(resp.ok)
+        for res in resp.json()['payload']['results']:
+            self.assertFalse('thumbnail' in res)
+            self.assertTrue(requests.get(res['thumbnailURL']).ok, msg='Thumbnail URL is reachable')
+
+        resp = requests.get(f'{baseRoute}&thumbnails=none')
+        self.assertTrue(resp.ok)
+        for res in resp.json()['payload']['results']:
+            self.assertFalse('thumbnail' in res)
+            self.assertFalse('thumbnailURL' in res)
+
     def test_api_edit_meme(self):
         # tdb = TestMemeDB.getInstance()
         # tdb.loadDB()
@@ -293,6 +350,33 @@ class APITests(TestCase):
                 self.assertTrue('id' in res)
                 self.check_meme_info_from_server(res['id'], res)
 
+        with self.subTest('Cursor Pagination'):
+            # following the cursor from the first page should give the same memes as the second page
+            firstPage = requests.get(f'{browseRoute}?page=1&per_page={itemsPerPage}&thumbnails=none').json()['payload']
+            self.assertTrue('nextCursor' in firstPage)
+            secondPage = requests.get(f'{browseRoute}?page=2&per_page={itemsPerPage}&thumbnails=none').json()['payload']
+
+            resp = requests.get(f'{browseRoute}?cursor={firstPage["nextCursor"]}&per_page={itemsPerPage}&thumbnails=none')
+            self.assertTrue(resp.ok)
+            cursorPage = resp.json()['payload']
+            self.assertFalse('page' in cursorPage)
+            self.assertEqual([res['id'] for res in secondPage['results']], [res['id'] for res in cursorPage['results']])
+
+            # after_id starts after the given meme
+            lastID = firstPage['results'][-1]['id']
+            resp = requests.get(f'{browseRoute}?after_id={lastID}&per_page={itemsPerPage}&thumbnails=none')
+            self.assertTrue(resp.ok)
+            self.assertTrue(all(res['id'] > lastID for res in resp.json()['payload']['results']))
+
+            # invalid cursors and mixing page with a cursor are client errors
+            resp = requests.get(f'{browseRoute}?cursor=abc&per_page={itemsPerPage}')
+            self.assertEqual(400, resp.status_code)
+            resp = requests.get(f'{browseRoute}?page=1&after_id={lastID}&per_page={itemsPerPage}')
+            self.assertEqual(400, resp.status_code)
+
+        with self.subTest('Thumbnail Options'):
+            self.check_thumbnail_modes(f'{browseRoute}?page={pageNo}&per_page={itemsPerPage}')
+
     def test_api_search_meme(self):
         # Test that query parameter is required
         searchRoute = APITests.makeServerRoute('search')
@@ -318,6 +402,9 @@ class APITests(TestCase):
         # Check the media type parameters
         self.check_media_types(f'{searchRoute}?query=happy')
 
+        # Check the thumbnail options
+        self.check_thumbnail_modes(f'{searchRoute}?query=happy')
+
         # Finally check if the results match api documentation
         resp = requests.get(f'{searchRoute}?query=happy')
         self.assertTrue(resp.ok)
@@ -0,0 +1,218 @@
+import json
+import threading
+import time
+from unittest import TestCase, mock
+
+from apiutils.FileStorage.JSONDBFileStorageInterface import JSONDBFileStorageInterface
+from apiutils.MemeDB.JSONMemeDB import JSONMemeDB
+from apiutils.MemeDB.JSONMemeDBLog import JSONMemeDBLog
+from apiutils.MemeManagement.MemeContainer import MemeContainer
+from apiutils.ReadWriteLock import ReadWriteLock
+
+
+class MemoryFileStorage(JSONDBFileStorageInterface):
+    """
+    File storage keeping the database, its log and the artifacts in memory, counting the calls made to it
+    """
+    def __init__(self, db:dict=None):
+        self.db = json.dumps(db if db is not None else {'nextID': 0, 'items': {}})
+        self.log = []
+        self.artifacts = {}
+        self.version = 0
+        self.dbReads = 0
+        self.dbWrites = 0
+        self.artifactWrites = 0
+        self.failAppends = False
+
+    def getJSONDB(self) -> dict:
+        self.dbReads += 1
+        return json.loads(self.db)
+
+    def writeJSONDB(self, db:dict) -> bool:
+        self.dbWrites += 1
+        self.db = json.dumps(db)
+        self.version += 1
+        return True
+
+    def getJSONDBRevision(self, refresh:bool=True) -> str:
+        return f'v{self.version}'
+
+    def supportsJSONDBLog(self) -> bool:
+        return True
+
+    def getJSONDBLog(self) -> list[dict]:
+        return [json.loads(entry) for entry in self.log]
+
+    def appendJSONDBLog(self, entries:list[dict]) -> bool:
+        if self.failAppends:
+            return False
+        self.log += [json.dumps(entry) for entry in entries]
+        self.version += 1
+        return True
+
+    def truncateJSONDBLog(self, count:int=None) -> bool:
+        self.log = [] if count is None else self.log[count:]
+        self.version += 1
+        return True
+
+    def supportsArtifacts(self) -> bool:
+        return True
+
+    def getArtifact(self, name:str) -> bytes:
+        return self.artifacts.get(name)
+
+    def writeArtifact(self, name:str, data:bytes) -> bool:
+        self.artifactWrites += 1
+        self.artifacts[name] = data
+        return True
+
+
+def runWithTimeout(test:TestCase, func, timeout:float=5):
+    """
+    Runs the function in another thread and fails the test if it does not return in time, e.g. because of a deadlock
+    """
+    thread = threading.Thread(target=func, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    test.assertFalse(thread.is_alive(), 'The call did not return, the lock was not released')
+
+
+class ReadWriteLockTests(TestCase):
+    def test_readers_share_the_lock(self):
+        lock = ReadWriteLock()
+        bothReading = threading.Barrier(2, timeout=5)
+
+        def read():
+            with lock.readLocked():
+                bothReading.wait()
+
+        threads = [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertFalse(bothReading.broken)
+
+    def test_writer_excludes_readers(self):
+        lock = ReadWriteLock()
+        events = []
+
+        def read():
+            with lock.readLocked():
+                events.append('read')
+
+        with lock.writeLocked():
+            reader = threading.Thread(target=read)
+            reader.start()
+            time.sleep(0.1)
+            events.append('write')
+        reader.join(5)
+        self.assertEqual(events, ['write', 'read'])
+
+    def test_exception_inside_write_lock_releases_it(self):
+        lock = ReadWriteLock()
+        with self.assertRaises(ValueError):
+            with lock.writeLocked():
+                raise ValueError('failed while locked')
+
+        def lockAgain():
+            with lock.writeLocked():
+                pass
+            with lock.readLocked():
+                pass
+        runWithTimeout(self, lockAgain)
+
+
+class JSONMemeDBTests(TestCase):
+    def setUp(self):
+        self.storage = MemoryFileStorage()
+        self.db = JSONMemeDB(self.storage)
+        self.assertTrue(self.db.loadDB())
+
+    def addMeme(self, name:str, tags:list[str]=None) -> int:
+        meme = MemeContainer(name=name, fileExt='png', tags=tags or [], mediaTypeStr='image')
+        self.assertTrue(self.db.addMemeToDB(meme))
+        return meme.getID()
+
+    def test_exception_inside_write_lock_does_not_deadlock(self):
+        with mock.patch.object(JSONMemeDBLog, 'record', side_effect=RuntimeError('log failed')):
+            with self.assertRaises(RuntimeError):
+                self.addMeme('first')
+
+        # the database is usable again, readers and writers do not wait for the failed change
+        runWithTimeout(self, lambda: self.addMeme('second'))
+        runWithTimeout(self, lambda: self.db.getAllDBMemes())
+
+    def test_exception_while_loading_does_not_deadlock(self):
+        self.storage.version += 1
+        with mock.patch.object(MemoryFileStorage, 'getJSONDB', side_effect=OSError('storage failed')):
+            with self.assertRaises(OSError):
+                self.db.loadDB()
+
+        runWithTimeout(self, lambda: self.db.loadDB())
+
+    def test_writes_append_to_the_log(self):
+        memeID = self.addMeme('girl happy at mall', ['happy'])
+        self.assertTrue(self.db.writeDB())
+        addedEntries = len(self.storage.log)
+        self.db.updateMeme(memeID, MemeContainer(tags=['happy', 'mall']))
+        self.assertTrue(self.db.writeDB())
+
+        # the snapshot is not written again, the changes are in the log
+        self.assertEqual(self.storage.dbWrites, 0)
+        self.assertEqual(len(self.storage.log), addedEntries + 1)
+
+        reloaded = JSONMemeDB(self.storage)
+        self.assertTrue(reloaded.loadDB())
+        self.assertEqual(reloaded.getMeme(memeID).getTags(), ['happy', 'mall'])
+
+    def test_failed_append_is_retried(self):
+        self.addMeme('first')
+        self.storage.failAppends = True
+        self.assertFalse(self.db.writeDB())
+        self.assertEqual(len(self.storage.log), 0)
+
+        self.storage.failAppends = False
+        self.assertTrue(self.db.writeDB())
+        reloaded = JSONMemeDB(self.storage)
+        reloaded.loadDB()
+        self.assertEqual([meme.getName() for meme in reloaded.getAllDBMemes()], ['first'])
+
+    def test_compaction_writes_a_snapshot_and_truncates_the_log(self):
+        memeIDs = [self.addMeme(f'meme {i}') for i in range(3)]
+        self.assertTrue(self.db.writeDB())
+        compactedRevisions = []
+        self.db.setCompactionCallback(compactedRevisions.append)
+
+        self.assertTrue(self.db.compactDB())
+        self.assertEqual(self.storage.log, [])
+        self.assertEqual(sorted(int(itemId) for itemId in json.loads(self.storage.db)['items']), memeIDs)
+        self.assertEqual(compactedRevisions, [self.storage.getJSONDBRevision()])
+
+    def test_revision_follows_the_stored_database(self):
+        storedRevision = self.db.getRevision()
+        self.assertEqual(storedRevision, self.storage.getJSONDBRevision())
+
+        # unwritten changes give a revision no stored database has
+        self.addMeme('first')
+        self.assertNotEqual(self.db.getRevision(), storedRevision)
+        self.assertNotEqual(self.db.getRevision(), self.storage.getJSONDBRevision())
+
+        self.assertTrue(self.db.writeDB())
+        self.assertEqual(self.db.getRevision(), self.storage.getJSONDBRevision())
+
+        # another process loading the written database has the same revision
+        reloaded = JSONMemeDB(self.storage)
+        reloaded.loadDB()
+        self.assertEqual(reloaded.getRevision(), self.db.getRevision())
+
+    def test_load_of_the_same_revision_is_skipped(self):
+        reads = self.storage.dbReads
+        self.assertTrue(self.db.loadDB())
+        self.assertEqual(self.storage.dbReads, reads)
+
+        # unwritten changes are discarded by loading the database again
+        memeID = self.addMeme('unsaved')
+        self.assertTrue(self.db.loadDB())
+        self.assertEqual(self.storage.dbReads, reads + 1)
+        self.assertFalse(self.db.hasMeme(memeID))
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from apiutils.DebouncedFlusher import DebouncedFlusher
+from apiutils.MemeDB.JSONMemeDB import JSONMemeDB
+from apiutils.MemeManagement.MemeLibrary import MemeLibrary
+from apiutils.MemeManagement.MemeLibrarySearcher import MemeLibrarySearcher
+from server_void.testing.MemeDBTests import MemoryFileStorage
+
+
+class MemeLibraryTests(TestCase):
+    """
+    Library tests with the database kept in memory, these do not need the meme servers to be running
+    """
+    def setUp(self):
+        self.indexDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.indexDir, ignore_errors=True)
+        # the libraries of the tests must not save their index to the removed directory when the tests exit
+        atexitPatcher = mock.patch('apiutils.MemeManagement.MemeLibrary.atexit')
+        atexitPatcher.start()
+        self.addCleanup(atexitPatcher.stop)
+
+        self.storage = MemoryFileStorage()
+
+    def makeLibrary(self, indexDir:str=None, flushIntervalSeconds:float=0) -> MemeLibrary:
+        memeLib = MemeLibrary(JSONMemeDB(self.storage), None, indexDir=indexDir, flushIntervalSeconds=flushIntervalSeconds)
+        self.assertTrue(memeLib.loadLibrary())
+        return memeLib
+
+    def addMemes(self, memeLib:MemeLibrary, names:list[str]) -> list[int]:
+        memeIDs = [memeLib.addMemeToLibrary(name=name, fileExt='png', tags=[], addMemeToIndex=True).getID() for name in names]
+        self.assertTrue(memeLib.saveLibrary())
+        return memeIDs
+
+    def searchNames(self, memeLib:MemeLibrary, query:str) -> list[str]:
+        return sorted(meme.getName() for meme in memeLib.search(query, itemsPerPage=100))
+
+    def test_added_memes_are_committed_in_batches(self):
+        memeLib = self.makeLibrary()
+        memeLib.indexLibrary()
+
+        with mock.patch.object(MemeLibrarySearcher, 'INDEX_BATCH_SIZE', 3), \
+                mock.patch.object(MemeLibrarySearcher, 'INDEX_BATCH_MAX_DELAY_SECONDS', 60):
+            self.addMemes(memeLib, ['cat one', 'cat two'])
+            self.assertTrue(memeLib.libSearcher.hasPendingMemes())
+
+            self.addMemes(memeLib, ['cat three'])
+            self.assertFalse(memeLib.libSearcher.hasPendingMemes())
+
+            # pending memes are committed before a search
+            self.addMemes(memeLib, ['cat four'])
+            self.assertEqual(self.searchNames(memeLib, 'cat'), ['cat four', 'cat one', 'cat three', 'cat two'])
+            self.assertFalse(memeLib.libSearcher.hasPendingMemes())
+
+    def test_search_cache_is_invalidated_by_changes(self):
+        memeLib = self.makeLibrary()
+        memeID, = self.addMemes(memeLib, ['dog running'])
+        memeLib.indexLibrary()
+        self.assertEqual(self.searchNames(memeLib, 'dog'), ['dog running'])
+
+        with mock.patch.object(MemeLibrarySearcher, 'searchMemeIDs', wraps=memeLib.libSearcher.searchMemeIDs) as searchMemeIDs:
+            # the following pages of a search use its cached results
+            memeLib.search('dog', itemsPerPage=1, pageNo=2)
+            memeLib.search('  dog ', itemsPerPage=1, pageNo=1)
+            self.assertEqual(searchMemeIDs.call_count, 0)
+
+            self.assertTrue(memeLib.editMeme(memeID, name='cat running'))
+            self.assertEqual(self.searchNames(memeLib, 'dog'), [])
+            self.assertEqual(self.searchNames(memeLib, 'cat'), ['cat running'])
+            self.assertEqual(searchMemeIDs.call_count, 2)
+
+    def test_persisted_index_is_reused_for_the_same_revision(self):
+        memeLib = self.makeLibrary(indexDir=self.indexDir)
+        self.addMemes(memeLib, ['frog dancing'])
+        self.assertTrue(memeLib.indexLibraryIfStale())
+
+        otherLib = self.makeLibrary(indexDir=self.indexDir)
+        with mock.patch.object(MemeLibrarySearcher, 'indexMemeList') as indexMemeList:
+            self.assertFalse(otherLib.indexLibraryIfStale())
+            indexMemeList.assert_not_called()
+        self.assertEqual(self.searchNames(otherLib, 'frog'), ['frog dancing'])
+
+        # a different revision of the database is indexed again
+        self.addMemes(memeLib, ['frog sleeping'])
+        thirdLib = self.makeLibrary(indexDir=self.indexDir)
+        self.assertTrue(thirdLib.indexLibraryIfStale())
+        self.assertEqual(self.searchNames(thirdLib, 'frog'), ['frog dancing', 'frog sleeping'])
+
+    def test_index_archive_is_saved_on_compaction_not_on_writes(self):
+        memeLib = self.makeLibrary(indexDir=self.indexDir)
+        self.assertTrue(memeLib.indexLibraryIfStale(artifactStorage=self.storage))
+        self.assertEqual(self.storage.artifactWrites, 1)
+
+        self.addMemes(memeLib, ['owl staring', 'owl flying'])
+        self.assertEqual(self.storage.artifactWrites, 1)
+
+        self.assertTrue(memeLib.db.compactDB())
+        self.assertEqual(self.storage.artifactWrites, 2)
+        self.assertEqual(memeLib.libSearcher.getPersistedRevision(), memeLib.db.getRevision())
+
+    def test_index_archive_is_used_without_a_local_index(self):
+        memeLib = self.makeLibrary(indexDir=self.indexDir)
+        self.addMemes(memeLib, ['duck swimming'])
+        self.assertTrue(memeLib.indexLibraryIfStale(artifactStorage=self.storage))
+
+        otherDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, otherDir, ignore_errors=True)
+        otherLib = self.makeLibrary(indexDir=os.path.join(otherDir, 'index'))
+        with mock.patch.object(MemeLibrarySearcher, 'indexMemeList') as indexMemeList:
+            self.assertFalse(otherLib.indexLibraryIfStale(artifactStorage=self.storage))
+            indexMemeList.assert_not_called()
+        self.assertEqual(self.searchNames(otherLib, 'duck'), ['duck swimming'])
+
+    def test_reload_discards_unwritten_changes(self):
+        memeLib = self.makeLibrary(flushIntervalSeconds=60)
+        self.addMemes(memeLib, ['bee buzzing'])
+        memeLib.indexLibrary()
+
+        memeLib.addMemeToLibrary(name='bee sleeping', fileExt='png', tags=[], addMemeToIndex=True)
+        self.assertTrue(memeLib.saveLibrary(durable=False))
+        self.assertTrue(memeLib.hasUnsavedChanges())
+
+        with mock.patch.object(DebouncedFlusher, 'flushNow') as flushNow:
+            self.assertTrue(memeLib.reloadLibrary())
+            flushNow.assert_not_called()
+        self.assertFalse(memeLib.hasUnsavedChanges())
+        self.assertEqual(self.searchNames(memeLib, 'bee'), ['bee buzzing'])
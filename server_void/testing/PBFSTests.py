@@ -0,0 +1,369 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+import requests
+
+from apiutils.configs.ServerConfig import JSONDBCodecOption
+from apiutils.FileStorage.AsyncPushBulletFileServer import AsyncPushBulletFileServer
+from apiutils.FileStorage.JSONCodec import JSONCodec, JSONCodecException, zstandard
+from apiutils.FileStorage.PBFSReadCache import PBFSReadCache
+from apiutils.FileStorage.PushBulletFileServer import PushBulletFileServer, PushBulletFileServerException
+from apiutils.OutboundPolicy import CircuitOpenException, CircuitState, OutboundPolicy
+
+
+class InterruptedResponse(requests.Response):
+    """
+    Response whose connection is lost after the first block of its contents
+    """
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        yield self._content[:chunk_size]
+        raise requests.exceptions.ChunkedEncodingError('Connection broken')
+
+
+class FakePushBulletSession:
+    """
+    Session answering the PushBullet API calls of the file server from memory, recording the requests made to it
+    Failed downloads answer 404 (not a server error), so they do not open the circuit breaker shared by the tests
+    """
+    UPLOAD_HOST = 'https://upload.test'
+    FILES_HOST = 'https://files.test'
+
+    def __init__(self):
+        self.pushes = {}
+        self.files = {}
+        self.devices = {}
+        self.requests = []
+        self.failDownloads = False
+        self.interruptDownloads = False
+        self.__uploadURLs = {}
+        self.__nextID = 0
+        self.__lock = threading.Lock()
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def makeResponse(status:int, body=None, responseClass=requests.Response) -> requests.Response:
+        response = responseClass()
+        response.status_code = status
+        response._content = body if isinstance(body, bytes) else json.dumps(body if body is not None else {}).encode()
+        response._content_consumed = True
+        return response
+
+    def countRequests(self, method:str, urlPrefix:str) -> int:
+        return len([url for reqMethod, url in self.requests if reqMethod == method and url.startswith(urlPrefix)])
+
+    def countDownloads(self) -> int:
+        return self.countRequests('GET', FakePushBulletSession.FILES_HOST)
+
+    def request(self, method:str, url:str, **kwargs) -> requests.Response:
+        with self.__lock:
+            self.requests.append((method, url))
+            self.__nextID += 1
+            return self.__answer(method, url, self.__nextID, **kwargs)
+
+    def __answer(self, method:str, url:str, requestID:int, json=None, files=None, **kwargs) -> requests.Response:
+        api = PushBulletFileServer.PUSHBULLET_API
+
+        if method == 'POST' and url == f'{api}/upload-request':
+            uploadURL = f'{FakePushBulletSession.UPLOAD_HOST}/{requestID}'
+            fileURL = f'{FakePushBulletSession.FILES_HOST}/{requestID}/{json["file_name"]}'
+            self.__uploadURLs[uploadURL] = fileURL
+            return FakePushBulletSession.makeResponse(200, {
+                'file_name': json['file_name'], 'file_type': json['file_type'], 'file_url': fileURL, 'upload_url': uploadURL
+            })
+
+        if method == 'POST' and url in self.__uploadURLs:
+            contents = files['file']
+            self.files[self.__uploadURLs[url]] = contents if isinstance(contents, bytes) else contents.encode()
+            return FakePushBulletSession.makeResponse(204, b'')
+
+        if method == 'POST' and url == f'{api}/pushes':
+            push = dict(json, iden=f'push{requestID}')
+            self.pushes[push['iden']] = push
+            return FakePushBulletSession.makeResponse(200, push)
+
+        if url.startswith(f'{api}/pushes/'):
+            iden = url.split('/')[-1]
+            if iden not in self.pushes:
+                return FakePushBulletSession.makeResponse(404, {'error': 'not found'})
+            if method == 'DELETE':
+                del self.pushes[iden]
+                return FakePushBulletSession.makeResponse(200)
+            return FakePushBulletSession.makeResponse(200, self.pushes[iden])
+
+        if method == 'GET' and url.startswith(FakePushBulletSession.FILES_HOST):
+            if self.failDownloads or url not in self.files:
+                return FakePushBulletSession.makeResponse(404, b'Not Found')
+            responseClass = InterruptedResponse if self.interruptDownloads else requests.Response
+            return FakePushBulletSession.makeResponse(200, self.files[url], responseClass=responseClass)
+
+        if method == 'GET' and url == f'{api}/devices':
+            return FakePushBulletSession.makeResponse(200, {'devices': list(self.devices.values())})
+
+        if method == 'POST' and url.startswith(f'{api}/devices/'):
+            iden = url.split('/')[-1]
+            device = self.devices.setdefault(iden, {
+                'iden': iden, 'nickname': 'server', 'manufacturer': PushBulletFileServer.DEVICE_MANUFACTURER,
+                'model': 'PBFS_INDEX:None', 'modified': time.time()
+            })
+            device.update(json)
+            return FakePushBulletSession.makeResponse(200, device)
+
+        return FakePushBulletSession.makeResponse(404, {'error': f'unexpected request {method} {url}'})
+
+
+class PushBulletFileServerTests(TestCase):
+    """
+    File server tests against a fake PushBullet API, these do not need a PushBullet account
+    """
+    SERVER_IDEN = 'server'
+
+    def setUp(self):
+        self.session = FakePushBulletSession()
+        sessionPatcher = mock.patch('requests.Session', return_value=self.session)
+        sessionPatcher.start()
+        self.addCleanup(sessionPatcher.stop)
+
+        self.cacheDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cacheDir, ignore_errors=True)
+
+    def makeServer(self, serverClass=PushBulletFileServer, **kwargs) -> PushBulletFileServer:
+        kwargs.setdefault('index', {})
+        return serverClass('token', serverIden=PushBulletFileServerTests.SERVER_IDEN, **kwargs)
+
+    def countIndexUploads(self) -> int:
+        return self.session.countRequests('POST', f'{PushBulletFileServer.PUSHBULLET_API}/devices/')
+
+    def test_large_files_are_written_in_chunks(self):
+        pbfs = self.makeServer(chunkSize=4)
+        contents = b'0123456789'
+
+        self.assertEqual(pbfs.write('/memes/large.bin', contents), '/memes/large.bin')
+        self.assertTrue(pbfs.isChunked('/memes/large.bin'))
+        self.assertEqual(len(self.session.pushes), 3)
+        self.assertEqual(pbfs.read('/memes/large.bin'), contents)
+
+        # file objects are read one chunk at a time
+        self.assertEqual(pbfs.write('/memes/stream.bin', io.BytesIO(contents)), '/memes/stream.bin')
+        self.assertEqual(pbfs.read('/memes/stream.bin'), contents)
+
+        self.assertEqual(pbfs.write('/memes/small.bin', b'0123'), '/memes/small.bin')
+        self.assertFalse(pbfs.isChunked('/memes/small.bin'))
+
+    def test_overwriting_a_chunked_file_deletes_all_its_chunks(self):
+        pbfs = self.makeServer(chunkSize=4)
+        pbfs.write('/large.bin', b'0123456789')
+        oldIdens = pbfs.getFileIden('/large.bin').split(',')
+
+        pbfs.write('/large.bin', b'abcdefgh')
+        self.assertEqual(pbfs.read('/large.bin'), b'abcdefgh')
+        self.assertTrue(all(iden not in self.session.pushes for iden in oldIdens))
+
+    def test_blocks_are_streamed(self):
+        pbfs = self.makeServer(chunkSize=4)
+        pbfs.write('/large.bin', b'0123456789')
+
+        with mock.patch.object(PushBulletFileServer, 'DOWNLOAD_BLOCK_SIZE', 2):
+            blocks = list(pbfs.readChunks('/large.bin'))
+        self.assertEqual(blocks, [b'01', b'23', b'45', b'67', b'89'])
+
+    def test_batch_uploads_the_index_once(self):
+        pbfs = self.makeServer(persistentStorage=True)
+        pbfs.write('/a.txt', b'a')
+        self.assertEqual(self.countIndexUploads(), 1)
+
+        with pbfs.batch():
+            for name in ['b', 'c', 'd']:
+                pbfs.write(f'/{name}.txt', name.encode())
+            with pbfs.batch():
+                pbfs.deleteFile('/a.txt')
+            self.assertEqual(self.countIndexUploads(), 1)
+        self.assertEqual(self.countIndexUploads(), 2)
+
+
+        # the device points to the last uploaded index, the previous one is deleted
+        indexIden = self.session.devices[PushBulletFileServerTests.SERVER_IDEN]['model'].split(':')[-1]
+        uploadedIndex = json.loads(self.session.files[self.session.pushes[indexIden]['file_url']])
+        self.assertEqual(sorted(uploadedIndex), ['b.txt', 'c.txt', 'd.txt'])
+        self.assertEqual(len(self.session.pushes), 4)
+
+    def test_uploaded_index_is_loaded_by_another_server(self):
+        pbfs = self.makeServer(persistentStorage=True)
+        with pbfs.batch():
+            pbfs.write('/a.txt', b'a')
+            pbfs.write('/b.txt', b'b')
+
+        otherPBFS = PushBulletFileServer('token', serverIden=PushBulletFileServerTests.SERVER_IDEN, loadIndexFromServer=True)
+        self.assertEqual(otherPBFS.getFileIndex(), pbfs.getFileIndex())
+        self.assertEqual(otherPBFS.read('/b.txt'), b'b')
+
+    def test_async_chunked_write_is_deferred_by_the_batch(self):
+        pbfs = self.makeServer(serverClass=AsyncPushBulletFileServer, persistentStorage=True, chunkSize=4)
+        with pbfs.batch():
+            self.assertEqual(pbfs.write('/large.bin', b'0123456789'), '/large.bin')
+            pbfs.write('/small.bin', b'01')
+            self.assertEqual(self.countIndexUploads(), 0)
+        self.assertEqual(self.countIndexUploads(), 1)
+        self.assertEqual(pbfs.readMany(['/large.bin', '/small.bin']), [b'0123456789', b'01'])
+
+    def test_read_cache_skips_the_download_of_unchanged_files(self):
+        pbfs = self.makeServer(readCache=PBFSReadCache(self.cacheDir), chunkSize=4)
+        pbfs.write('/large.bin', b'0123456789')
+
+        self.assertEqual(pbfs.read('/large.bin'), b'0123456789')
+        downloads = self.session.countDownloads()
+        self.assertEqual(pbfs.read('/large.bin'), b'0123456789')
+        self.assertEqual(self.session.countDownloads(), downloads)
+
+        # a new version of the file is a new push, so it is downloaded
+        pbfs.write('/large.bin', b'abcdefgh')
+        self.assertEqual(pbfs.read('/large.bin'), b'abcdefgh')
+        self.assertGreater(self.session.countDownloads(), downloads)
+
+    def test_failed_downloads_are_not_cached(self):
+        readCache = PBFSReadCache(self.cacheDir)
+        pbfs = self.makeServer(readCache=readCache)
+        pbfs.write('/file.bin', b'0123456789')
+
+        self.session.failDownloads = True
+        self.assertIsNone(pbfs.read('/file.bin'))
+        self.session.failDownloads = False
+
+        self.session.interruptDownloads = True
+        with mock.patch.object(PushBulletFileServer, 'DOWNLOAD_BLOCK_SIZE', 2):
+            self.assertIsNone(pbfs.read('/file.bin'))
+        self.session.interruptDownloads = False
+
+        self.assertEqual(readCache.getSize(), 0)
+        self.assertEqual(os.listdir(self.cacheDir), [])
+        self.assertEqual(pbfs.read('/file.bin'), b'0123456789')
+        self.assertEqual(readCache.getSize(), 10)
+
+    def test_read_to_does_not_leave_a_partial_file(self):
+        pbfs = self.makeServer(chunkSize=4)
+        pbfs.write('/large.bin', b'0123456789')
+        localPath = os.path.join(self.cacheDir, 'large.bin')
+
+        pbfs.readTo('/large.bin', localPath)
+        with open(localPath, 'rb') as file:
+            self.assertEqual(file.read(), b'0123456789')
+        os.remove(localPath)
+
+        self.session.interruptDownloads = True
+        with self.assertRaises(PushBulletFileServerException):
+            pbfs.readTo('/large.bin', localPath)
+        self.assertFalse(os.path.exists(localPath))
+
+        with self.assertRaises(PushBulletFileServerException):
+            pbfs.readTo('/missing.bin', localPath)
+        self.assertFalse(os.path.exists(localPath))
+
+
+class JSONCodecTests(TestCase):
+    DOCUMENT = {'nextID': 2, 'items': {'1': {'name': 'girl happy at mall', 'tags': ['happy', 'mall']}}}
+
+    def test_round_trips(self):
+        for option in [JSONDBCodecOption.JSON, JSONDBCodecOption.COMPACT, JSONDBCodecOption.GZIP]:
+            encoded = JSONCodec(option).encode(JSONCodecTests.DOCUMENT)
+            self.assertEqual(JSONCodec.decode(encoded), JSONCodecTests.DOCUMENT, option)
+
+    def test_format_is_sniffed(self):
+        self.assertEqual(JSONCodec.sniffOption(JSONCodec(JSONDBCodecOption.GZIP).encode({})), JSONDBCodecOption.GZIP)
+        self.assertEqual(JSONCodec.sniffOption(JSONCodec(JSONDBCodecOption.COMPACT).encode({})), JSONDBCodecOption.JSON)
+        # files written before the codec are pretty printed JSON
+        self.assertEqual(JSONCodec.decode(json.dumps(JSONCodecTests.DOCUMENT, indent=4).encode()), JSONCodecTests.DOCUMENT)
+
+    def test_compressed_encoding_is_deterministic(self):
+        codec = JSONCodec(JSONDBCodecOption.GZIP)
+        self.assertEqual(codec.encode(JSONCodecTests.DOCUMENT), codec.encode(JSONCodecTests.DOCUMENT))
+        self.assertLess(len(codec.encode(JSONCodecTests.DOCUMENT)), len(JSONCodec().encode(JSONCodecTests.DOCUMENT)))
+
+    def test_zstd_requires_zstandard(self):
+        if zstandard is not None:
+            encoded = JSONCodec(JSONDBCodecOption.ZSTD).encode(JSONCodecTests.DOCUMENT)
+            self.assertEqual(JSONCodec.sniffOption(encoded), JSONDBCodecOption.ZSTD)
+            self.assertEqual(JSONCodec.decode(encoded), JSONCodecTests.DOCUMENT)
+            return
+
+        with self.assertRaises(JSONCodecException):
+            JSONCodec(JSONDBCodecOption.ZSTD)
+        with self.assertRaises(JSONCodecException):
+            JSONCodec.decode(JSONCodec.ZSTD_MAGIC + b'data')
+
+
+class OutboundPolicyTests(TestCase):
+    """
+    Circuit breaker and retry tests, each with its own policy so the breakers of the backends are not affected
+    """
+    URL = 'https://backend.test/item'
+
+    def setUp(self):
+        self.session = mock.Mock()
+        self.statuses = []
+        self.session.request.side_effect = lambda method, url, **kwargs: FakePushBulletSession.makeResponse(self.statuses.pop(0))
+
+    def makePolicy(self, **kwargs) -> OutboundPolicy:
+        kwargs.setdefault('backoffFactor', 0)
+        return OutboundPolicy('test', 1, 1, **kwargs)
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        policy = self.makePolicy(maxRetries=0, failureThreshold=2, resetTimeoutSeconds=60)
+        self.statuses = [503, 200, 503, 503]
+
+        for _ in range(4):
+            policy.request('GET', OutboundPolicyTests.URL, session=self.session)
+        self.assertEqual(policy.breaker.getState(), CircuitState.OPEN)
+
+        # the backend is not called while the breaker is open
+        with self.assertRaises(CircuitOpenException):
+            policy.request('GET', OutboundPolicyTests.URL, session=self.session)
+        self.assertEqual(self.session.request.call_count, 4)
+
+    def test_half_open_trial_closes_or_opens_the_breaker(self):
+        policy = self.makePolicy(maxRetries=0, failureThreshold=1, resetTimeoutSeconds=0.05)
+        self.statuses = [503]
+        policy.request('GET', OutboundPolicyTests.URL, session=self.session)
+        self.assertEqual(policy.breaker.getState(), CircuitState.OPEN)
+
+        time.sleep(0.1)
+        self.assertEqual(policy.breaker.getState(), CircuitState.HALF_OPEN)
+        self.statuses = [503]
+        policy.request('GET', OutboundPolicyTests.URL, session=self.session)
+        self.assertEqual(policy.breaker.getState(), CircuitState.OPEN)
+
+        time.sleep(0.1)
+        # a single trial is let through while half-open
+        policy.breaker.beforeCall()
+        with self.assertRaises(CircuitOpenException):
+            policy.breaker.beforeCall()
+        policy.breaker.recordSuccess()
+        self.assertEqual(policy.breaker.getState(), CircuitState.CLOSED)
+
+    def test_only_idempotent_requests_are_retried(self):
+        policy = self.makePolicy(maxRetries=2, failureThreshold=10)
+        self.statuses = [503, 502, 200]
+        self.assertEqual(policy.request('GET', OutboundPolicyTests.URL, session=self.session).status_code, 200)
+        self.assertEqual(self.session.request.call_count, 3)
+
+        self.statuses = [503]
+        self.assertEqual(policy.request('POST', OutboundPolicyTests.URL, session=self.session).status_code, 503)
+        self.assertEqual(self.session.request.call_count, 4)
+
+    def test_exceptions_count_as_failures(self):
+        policy = self.makePolicy(maxRetries=1, failureThreshold=2, resetTimeoutSeconds=60)
+        self.session.request.side_effect = requests.exceptions.ConnectionError('unreachable')
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            policy.request('GET', OutboundPolicyTests.URL, session=self.session)
+        self.assertEqual(self.session.request.call_count, 2)
+        self.assertEqual(policy.breaker.getState(), CircuitState.OPEN)
@@ -1,4 +1,6 @@
+import base64
 import json
+import os
 
 from apiutils.configs.ServerConfig import ServerConfig
 from localMemeStorageServer.utils.LocalStorageUtils import cloudMemeNeedsToBeConvertedToLocal, \
@@ -19,12 +21,15 @@ class TestMemeDB:
             FileExt = "fileExt"
             Tags = "tags"
             Thumbnail = "thumbnail"
+            ThumbnailID = "thumbnailID"
             MediaID = "mediaID"
             MediaURL = "mediaURL"
 
     instance = None
     def __init__(self):
         self.dbpath = ServerConfig.path('data/testing_db.json')
+        self.logpath = ServerConfig.path('data/testing_db.log.jsonl')
+        self.thumbnailDir = ServerConfig.path('data/testing_thumbnails')
         self.db = None
 
     @staticmethod
@@ -37,6 +42,25 @@ class TestMemeDB:
         with open(self.dbpath, 'r') as file:
             self.db = json.load(file)
 
+        # Replay the changes the server appended to the db log since its last snapshot
+        if not os.path.exists(self.logpath):
+            return
+
+        with open(self.logpath, 'r') as file:
+            entries = [json.loads(line) for line in file if line.strip() != '']
+
+        for entry in entries:
+            itemId = str(entry['id'])
+            if entry['op'] == 'insert':
+                self.getItems()[itemId] = dict(entry['fields'])
+                self.db[TestMemeDB.DBFields.NextID] = max(self.db[TestMemeDB.DBFields.NextID], entry['nextID'])
+            else:
+                self.getItems()[itemId].update(entry['fields'])
+
+    def clearLog(self):
+        if os.path.exists(self.logpath):
+            os.remove(self.logpath)
+
     def writeDB(self):
         with open(self.dbpath, 'w') as file:
             json.dump(self.db, file, indent=4)
@@ -84,13 +108,22 @@ class TestMemeDB:
         if mediaURL:
             results['mediaURL'] = _mediaURL
         if thumbnail:
-            results['thumbnail'] = item[TestMemeDB.DBFields.ItemFields.Thumbnail]
+            results['thumbnail'] = self.getThumbnail(item)
 
         if len(results) == 1:
             return list(results.values())[0]
 
         return results
 
+    def getThumbnail(self, item: dict) -> str:
+        # Thumbnails may be kept out of the db in the local thumbnail storage
+        thumbnailID = item.get(TestMemeDB.DBFields.ItemFields.ThumbnailID)
+        if thumbnailID is None:
+            return item[TestMemeDB.DBFields.ItemFields.Thumbnail]
+
+        with open(os.path.join(self.thumbnailDir, thumbnailID), 'rb') as file:
+            return base64.b64encode(file.read()).decode()
+
     def set(self, itemId, name=None, mediaType=None, fileExt=None, tags=None, mediaID=None, mediaURL=None, thumbnail=None):
         item = self.getItem(itemId)
         if item is None:
@@ -0,0 +1,36 @@
+import base64
+from io import BytesIO
+from unittest import TestCase
+
+from PIL import Image
+
+from apiutils.ThumbnailMaker import ThumbnailMaker
+
+
+class ThumbnailMakerTests(TestCase):
+    """
+    Thumbnail tests, these do not need the meme servers to be running
+    """
+    SOURCE_SIZE = (2000, 1500)
+
+    @staticmethod
+    def makeImageBytes(mode:str, frmt:str) -> bytes:
+        image = Image.new(mode, ThumbnailMakerTests.SOURCE_SIZE)
+        buffered = BytesIO()
+        image.save(buffered, format=frmt)
+        return buffered.getvalue()
+
+    def check_thumbnails(self, imageBytes:bytes):
+        thumbnail = Image.open(BytesIO(base64.b64decode(ThumbnailMaker.makeBase64Thumbnail(imageBytes))))
+        self.assertEqual(thumbnail.size, (100, 75))
+
+        thumbnails = ThumbnailMaker.makeThumbnails(imageBytes, [((200, 200), 'jpeg'), ((400, 400), 'png')])
+        self.assertEqual(Image.open(BytesIO(thumbnails['200x200.jpeg'])).size, (200, 150))
+        self.assertEqual(Image.open(BytesIO(thumbnails['400x400.png'])).size, (400, 300))
+
+    def test_thumbnail_image_modes(self):
+        # Modes which cannot be reduced or stored by every thumbnail format
+        for mode, frmt in [('1', 'png'), ('1', 'bmp'), ('LA', 'png'), ('I;16', 'png'), ('CMYK', 'jpeg'), ('P', 'png'),
+                           ('RGBA', 'png'), ('L', 'jpeg'), ('RGB', 'jpeg')]:
+            with self.subTest(mode=mode, format=frmt):
+                self.check_thumbnails(ThumbnailMakerTests.makeImageBytes(mode, frmt))
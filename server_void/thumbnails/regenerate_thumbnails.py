@@ -0,0 +1,71 @@
+import argparse
+import os
+import sys
+
+script_loc_dir = os.path.split(os.path.realpath(__file__))[0]
+project_dir = os.path.abspath( os.path.join(script_loc_dir, '..', '..'))
+if project_dir not in sys.path:
+    sys.path.append(project_dir)
+
+from apiutils.configs.ServerConfig import ServerConfig
+from apiutils.configs.ServerComponents import getServerFileStorage, getServerMemeStorage, getServerThumbnailStorage, \
+    getServerThumbnailVariants, getServerVideoPreviewMaker
+from apiutils.MemeDB.JSONMemeDB import JSONMemeDB
+from apiutils.MemeManagement.MemeLibrary import MemeLibrary
+from apiutils.MemeManagement.ThumbnailBackfill import ThumbnailBackfill, BackfillProgress
+from apiutils.ThumbnailMaker import ThumbnailMaker
+
+DEFAULT_PROGRESS_FILE = os.path.join(script_loc_dir, 'progress.json')
+
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+def print_progress(progress: BackfillProgress):
+    eta = progress.getETASeconds()
+    eta_text = f'{eta:.0f}s' if eta is not None else '?'
+    print(f'\r{progress.getFinishedCount()}/{progress.total} memes (skipped={progress.skipped}, failed={progress.failed}) '
+          f'{progress.getRate():.1f}/s, ETA {eta_text}   ', end='', flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Makes the thumbnails of the memes in the server library again')
+    parser.add_argument('--size', type=parse_size, default=ThumbnailMaker.DEFAULT_SIZE,
+                        help='Size of an extra thumbnail variant to make e.g. 200x200, the default thumbnail is always made')
+    parser.add_argument('--format', default=ThumbnailMaker.DEFAULT_FORMAT, help='Format of the extra thumbnail variant e.g. webp')
+    parser.add_argument('--ids', type=int, nargs='*', help='Only these meme IDs, all the memes if not given')
+    parser.add_argument('--processes', type=int, help='Worker processes making thumbnails, the number of CPUs by default')
+    parser.add_argument('--downloads', type=int, default=ThumbnailBackfill.DEFAULT_DOWNLOAD_WORKERS, help='Media downloads at the same time')
+    parser.add_argument('--progress-file', default=DEFAULT_PROGRESS_FILE, help='File the progress is saved to, to resume an interrupted run')
+    parser.add_argument('--restart', action='store_true', help='Ignore the saved progress and make every thumbnail again')
+    args = parser.parse_args()
+
+    # Uses the same configuration as the server (JSON_CONFIG or RMSVR_* environment variables)
+    ServerConfig.initConfig()
+    ServerConfig.printConfig()
+
+    fileStorage = getServerFileStorage()
+    memeDB = JSONMemeDB(fileStorage, thumbnailStorage=getServerThumbnailStorage(fileStorage))
+    memeLib = MemeLibrary(memeDB, getServerMemeStorage(), thumbnailVariants=getServerThumbnailVariants(),
+                          videoPreviewMaker=getServerVideoPreviewMaker())
+    if not memeLib.loadLibrary():
+        print('Could not load the meme library!')
+        return -1
+
+    backfill = ThumbnailBackfill(memeLib, tbSize=args.size, tbFrmt=args.format, processes=args.processes,
+                                 downloadWorkers=args.downloads, progressFilePath=args.progress_file)
+    if args.restart:
+        backfill.clearProgress()
+
+    variants = ', '.join(ThumbnailMaker.makeVariantKey(size, tbFrmt) for size, tbFrmt in backfill.variants)
+    print(f'Making the thumbnails (variants: {variants or "none"})...')
+    progress = backfill.run(memeIDs=args.ids, onProgress=print_progress)
+    print('')
+
+    for memeID, error in backfill.getFailures().items():
+        print(f'Meme #{memeID} failed: {error}')
+    print(f'Done: {progress.done} made, {progress.skipped} skipped, {progress.failed} failed')
+    return 0 if progress.failed == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())